@@ -1,6 +1,10 @@
+from collections import deque
 from datetime import datetime as dt
 from hashlib import sha3_256
+from heapq import heappop, heappush
 import hmac
+import secrets
+from time import monotonic
 
 
 def gen_token(secret_key, uid, timestamp):
@@ -9,6 +13,20 @@ def gen_token(secret_key, uid, timestamp):
     return hmac.new(secret_key.encode('utf-8'), hash_key, sha3_256).hexdigest()
 
 
+def auth_request(secret_key, datetime_format, uid, weight):
+    """Параметры сигнала auth со свежим токеном, например для тестов
+    и нагрузочных прогонов
+    """
+    timestamp = dt.utcnow().strftime(datetime_format)
+
+    return {
+        'uid': uid,
+        'token': gen_token(secret_key, uid, timestamp),
+        'timestamp': timestamp,
+        'weight': weight
+    }
+
+
 def is_expired_token(timestamp, token_delay):
     now = dt.utcnow()
     timedelta = abs((timestamp - now).total_seconds())
@@ -16,14 +34,101 @@ def is_expired_token(timestamp, token_delay):
     return timedelta > token_delay
 
 
-def is_valid_auth(data, secret_key):
-    args = [
-        secret_key,
-        data['uid'],
-        data['timestamp']
-    ]
+class Authenticator:
+    """Проверка токенов аутентификации.
+
+    Ключ HMAC подготавливается один раз, для каждого токена копируется
+    уже инициализированный объект. Успешно проверенный токен запоминается
+    до конца срока его действия, поэтому повторное подключение с тем же
+    токеном не считает HMAC заново
+    """
+
+    def __init__(self, secret_key, token_delay, cache_size=100000):
+        self._hmac = hmac.new(secret_key.encode('utf-8'), digestmod=sha3_256)
+        self._token_delay = token_delay
+        self._cache_size = cache_size
+        self._verified = {}
+        self._expiry = []
+
+    def token(self, uid, timestamp):
+        mac = self._hmac.copy()
+        mac.update(f'{uid}{timestamp}'.encode('utf-8'))
+
+        return mac.hexdigest()
+
+    def verify(self, uid, timestamp, token):
+        """Проверяет токен; timestamp - штамп, разобранный схемой AuthSchema"""
+
+        now = monotonic()
+        self._purge(now)
+
+        key = (uid, timestamp, token)
+        if key in self._verified:
+            return True
+
+        if not hmac.compare_digest(self.token(uid, timestamp), token):
+            return False
+
+        if len(self._verified) < self._cache_size:
+            lifetime = (timestamp.value - dt.utcnow()).total_seconds() + self._token_delay
+            self._verified[key] = now + lifetime
+            heappush(self._expiry, (now + lifetime, key))
 
-    if data['token'] == gen_token(*args):
         return True
 
-    return False
+    def _purge(self, now):
+        expiry = self._expiry
+        while expiry and expiry[0][0] <= now:
+            _, key = heappop(expiry)
+            del self._verified[key]
+
+
+class Tickets:
+    """Короткоживущие билеты для возобновления сессии без аутентификации.
+
+    Билет - случайная строка, проверка которой сводится к поиску в словаре.
+    У актора действует только последний выданный ему билет
+    """
+
+    def __init__(self, ttl):
+        self._ttl = ttl
+        self._tickets = {}
+        self._by_uid = {}
+        self._issued = deque()
+
+    def __len__(self):
+        return len(self._tickets)
+
+    def issue(self, uid):
+        now = monotonic()
+        self._purge(now)
+
+        old = self._by_uid.get(uid)
+        if old is not None:
+            self._tickets.pop(old, None)
+
+        ticket = secrets.token_urlsafe(24)
+        expires = now + self._ttl
+        self._tickets[ticket] = (uid, expires)
+        self._by_uid[uid] = ticket
+        self._issued.append((expires, ticket))
+
+        return ticket
+
+    def resolve(self, ticket):
+        """uid актора, которому выдан билет, или None для неверного билета"""
+
+        entry = self._tickets.get(ticket)
+        if entry is None or entry[1] <= monotonic():
+            return None
+
+        return entry[0]
+
+    def _purge(self, now):
+        # Срок жизни одинаков, поэтому билеты истекают в порядке выдачи
+        issued = self._issued
+        while issued and issued[0][0] <= now:
+            _, ticket = issued.popleft()
+            entry = self._tickets.pop(ticket, None)
+            if entry is not None and self._by_uid.get(entry[0]) == ticket:
+                del self._by_uid[entry[0]]
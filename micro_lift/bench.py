@@ -0,0 +1,391 @@
+"""Микробенчмарки горячих путей модели лифтов.
+
+Каждый случай замеряется на сетке размеров здания: число ожидающих
+акторов и число лифтов. Одна операция случая - вызов метода для всех
+лифтов здания, то есть работа, которую делает шаг симуляции. Результат -
+медиана операций в секунду по нескольким повторам и разброс повторов.
+
+Базовый файл хранит результаты эталонного прогона и калибровку - скорость
+простого цикла на той же машине. При сравнении результаты делятся на
+калибровку, так что базовый файл переживает смену машины. Прогон
+завершается с ошибкой, если скорость какого-либо случая упала больше
+допуска: threshold или SIGMAS разбросов случая, если они больше
+"""
+
+import argparse
+import gc
+from math import hypot
+import os
+import platform
+import random
+from statistics import median
+import sys
+from time import perf_counter
+
+import ujson
+
+from conf import load_config
+from dispatch import create_dispatcher
+from engine import create_engine
+from events import EventBus
+from models import Actor, ActorStatus, WaitingRoom
+from simulation import Building
+
+
+ACTORS = (10, 100, 1000, 10000, 100000)
+LIFTS = (1, 10, 100, 500)
+
+# Допуск случая в его относительных разбросах
+SIGMAS = 3.0
+
+# Переводит медианное абсолютное отклонение в оценку стандартного
+MAD_SCALE = 1.4826
+
+BASELINE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        'benchmarks', 'baseline.json')
+
+
+class Fixture:
+    """Здание для замера: лифты на случайных этажах и акторы,
+    ожидающие лифт на случайных этажах
+    """
+
+    def __init__(self, config, actors, lifts, seed=0):
+        self.config = config
+        self.rnd = random.Random(seed)
+        self.floors = config['FLOOR']['COUNT']
+        self.height = config['FLOOR']['HEIGHT']
+        self.engine = create_engine({**config, 'LIFT': {**config['LIFT'], 'COUNT': lifts}})
+        self.lifts = list(self.engine.lifts.values())
+        self.waiting = WaitingRoom()
+        self.actors = []
+
+        for lift in self.lifts:
+            lift.position = (self.random_floor() - 1) * self.height + 0.01
+
+        for inx in range(actors):
+            actor = Actor(f'actor{inx}', self.rnd.uniform(50.0, 120.0), room=self.waiting)
+            actor.floor = self.random_floor()
+            actor.wait_lift(self.random_floor(actor.floor))
+            self.actors.append(actor)
+
+    def random_floor(self, exclude=None):
+        floor = self.rnd.randint(1, self.floors)
+        if floor == exclude:
+            floor = floor % self.floors + 1
+
+        return floor
+
+    def board(self, lift, need=None):
+        """Заполняет лифт пассажирами до грузоподъемности.
+
+        Пассажиры едут на need или на случайные этажи, кроме текущего
+        """
+        group = []
+        while lift.load + 70.0 * (len(group) + 1) <= lift.max_weight:
+            actor = Actor(f'{lift.id}_p{len(group)}', 70.0)
+            floor = self.random_floor(lift.floor) if need is None else need
+            ride(actor, lift.id, floor % self.floors + 1, floor)
+            group.append(actor)
+
+        lift.passengers = group
+        return group
+
+
+def ride(actor, lift_id, origin, need):
+    """Сажает актора с этажа origin в лифт, едущий на этаж need"""
+
+    actor.floor = origin
+    actor.wait_lift(need)
+    actor.enter_lift(lift_id)
+
+
+# Случаи замеров. Каждый получает здание и возвращает замеряемую функцию
+# и функцию, которая вне замера возвращает здание в исходное состояние
+
+def near_act_floor(fixture):
+    waiting = fixture.waiting
+    for lift in fixture.lifts:
+        fixture.board(lift)
+
+    def run():
+        for lift in fixture.lifts:
+            lift.near_act_floor(waiting)
+
+    return run, None
+
+
+def take_actors(fixture):
+    waiting, taken = fixture.waiting, []
+    needs = {x.uid: x.need_floor for x in fixture.actors}
+
+    def run():
+        for lift in fixture.lifts:
+            taken.append((lift, lift.take_actors(waiting)))
+
+    def reset():
+        for lift, group in taken:
+            lift.passengers = []
+            for actor in group:
+                actor.leave_lift()
+                actor.wait_lift(needs[actor.uid])
+
+        taken.clear()
+
+    return run, reset
+
+
+def drop_off(fixture):
+    groups = [(lift, fixture.board(lift, lift.floor)) for lift in fixture.lifts]
+
+    def run():
+        for lift in fixture.lifts:
+            lift.drop_off()
+
+    def reset():
+        for lift, group in groups:
+            for actor in group:
+                ride(actor, lift.id, lift.floor % fixture.floors + 1, lift.floor)
+
+            lift.passengers = list(group)
+
+    return run, reset
+
+
+def near_drop_floor(fixture):
+    for lift in fixture.lifts:
+        fixture.board(lift)
+
+    def run():
+        for lift in fixture.lifts:
+            lift._near_drop_floor()
+
+    return run, None
+
+
+def set_passengers(fixture):
+    groups = [(lift, fixture.board(lift)) for lift in fixture.lifts]
+
+    def run():
+        for lift, group in groups:
+            lift.passengers = group
+
+    return run, None
+
+
+def tick(fixture):
+    """Шаг петли лифтов без сокетов. Высаженные акторы снова вызывают
+    лифт, когда ожидающих становится вдвое меньше исходного
+    """
+    building = Building(fixture.engine, fixture.waiting,
+                        create_dispatcher(fixture.config), EventBus())
+    initial = len(fixture.waiting)
+
+    def run():
+        building.tick(1)
+
+    def reset():
+        if len(fixture.waiting) * 2 < initial:
+            for actor in fixture.actors:
+                if actor.status == ActorStatus.IDLE:
+                    actor.wait_lift(fixture.random_floor(actor.floor))
+
+    return run, reset
+
+
+CASES = {
+    'near_act_floor': near_act_floor,
+    'take_actors': take_actors,
+    'drop_off': drop_off,
+    'near_drop_floor': near_drop_floor,
+    'set_passengers': set_passengers,
+    'tick': tick,
+}
+
+
+def measure(run, reset=None, min_time=0.2, repeat=7):
+    """Медиана repeat замеров скорости run в операциях в секунду и
+    относительный разброс замеров: медианное отклонение от медианы,
+    приведенное к стандартному и деленное на медиану.
+    reset вызывается перед каждой операцией и в замер не входит
+    """
+    rates = []
+    # Как и timeit, сборщик мусора на время замера отключается
+    gc.collect()
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            ops, elapsed = 0, 0.0
+            while elapsed < min_time:
+                if reset is not None:
+                    reset()
+
+                started = perf_counter()
+                run()
+                elapsed += perf_counter() - started
+                ops += 1
+
+            rates.append(ops / elapsed)
+    finally:
+        if enabled:
+            gc.enable()
+
+    return dispersion(rates)
+
+
+def dispersion(rates):
+    """Медиана замеров и их относительный разброс"""
+
+    rate = median(rates)
+    return rate, MAD_SCALE * median(abs(x - rate) for x in rates) / rate
+
+
+def calibrate(min_time=0.2, repeat=7):
+    """Скорость эталонного цикла на чистом Python"""
+
+    def run():
+        total = 0
+        for x in range(1000):
+            total += x * x
+
+    return measure(run, min_time=min_time, repeat=repeat)
+
+
+def key(case, actors, lifts):
+    return f'{case}/{actors}x{lifts}'
+
+
+def run_suite(config, cases=tuple(CASES), actors=ACTORS, lifts=LIFTS, min_time=0.2, repeat=7):
+    results, spread, calibrations = {}, {}, []
+    for case in cases:
+        for lift_count in lifts:
+            # Скорость машины плывет за время прогона, поэтому калибровка
+            # замеряется перед каждой строкой случаев, а ее дрейф входит
+            # в разброс калибровки
+            calibrations.append(calibrate(min_time, 1)[0])
+            for actor_count in actors:
+                run, reset = CASES[case](Fixture(config, actor_count, lift_count))
+                name = key(case, actor_count, lift_count)
+                results[name], spread[name] = measure(run, reset, min_time, repeat)
+
+    calibrations.append(calibrate(min_time, 1)[0])
+    calibration, calibration_spread = dispersion(calibrations)
+    return {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'calibration': calibration,
+        'calibration_spread': calibration_spread,
+        'results': results,
+        'spread': spread,
+    }
+
+
+def tolerance(baseline, current, name, threshold):
+    """Допустимое падение скорости случая: не меньше threshold, а для
+    шумных случаев - SIGMAS их совокупных разбросов в обоих прогонах,
+    но не больше 0.9
+    """
+    noise = hypot(baseline.get('spread', {}).get(name, 0.0),
+                  current.get('spread', {}).get(name, 0.0),
+                  baseline.get('calibration_spread', 0.0),
+                  current.get('calibration_spread', 0.0))
+
+    return min(max(threshold, SIGMAS * noise), 0.9)
+
+
+def compare(baseline, current, threshold):
+    """Случаи, чья скорость относительно калибровки упала больше допуска:
+    список (ключ, отношение новой скорости к базовой, допуск)
+    """
+    base_cal, cur_cal = baseline['calibration'], current['calibration']
+    regressions = []
+    for name, value in current['results'].items():
+        base = baseline['results'].get(name)
+        if base:
+            ratio = (value / cur_cal) / (base / base_cal)
+            allowed = tolerance(baseline, current, name, threshold)
+            if ratio < 1.0 - allowed:
+                regressions.append((name, ratio, allowed))
+
+    return regressions
+
+
+def curves(report, cases, actors, lifts):
+    """Таблицы скорости по размерам здания: строки - лифты, столбцы - акторы"""
+
+    lines = []
+    for case in cases:
+        lines.append(f'{case} (ops/s)')
+        lines.append('lifts\\actors' + ''.join(f'{x:>12}' for x in actors))
+        for lift_count in lifts:
+            row = [report['results'][key(case, x, lift_count)] for x in actors]
+            lines.append(f'{lift_count:>12}' + ''.join(f'{x:>12.1f}' for x in row))
+
+        lines.append('')
+
+    return '\n'.join(lines)
+
+
+def _sizes(value):
+    return tuple(int(x) for x in value.split(','))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Lift model micro-benchmarks')
+    parser.add_argument('--config', type=str, help='Path to configuration yaml file')
+    parser.add_argument('--cases', type=str, default=','.join(CASES),
+                        help='Comma separated benchmark cases')
+    parser.add_argument('--actors', type=_sizes, default=ACTORS,
+                        help='Comma separated numbers of waiting actors')
+    parser.add_argument('--lifts', type=_sizes, default=LIFTS,
+                        help='Comma separated numbers of lifts')
+    parser.add_argument('--min-time', type=float, default=0.2,
+                        help='Minimum seconds of a single measurement')
+    parser.add_argument('--repeat', type=int, default=7,
+                        help='Measurements per point, the median is kept')
+    parser.add_argument('--baseline', type=str, default=BASELINE, help='Path to the baseline file')
+    parser.add_argument('--threshold', type=float, default=0.3,
+                        help='Allowed relative throughput drop against the baseline, '
+                             'noisy cases get a wider tolerance')
+    parser.add_argument('--update', action='store_true', help='Write results as the new baseline')
+    parser.add_argument('--output', type=str, default=None, help='Path to the JSON results')
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+    cases = args.cases.split(',')
+    for case in cases:
+        if case not in CASES:
+            parser.error(f'unknown case: {case}')
+
+    report = run_suite(config, cases, args.actors, args.lifts, args.min_time, args.repeat)
+    print(curves(report, cases, args.actors, args.lifts))
+
+    if args.output:
+        with open(args.output, 'wt') as fout:
+            fout.write(ujson.dumps(report, indent=2, escape_forward_slashes=False))
+
+    if args.update:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, 'wt') as fout:
+            fout.write(ujson.dumps(report, indent=2, escape_forward_slashes=False))
+
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f'No baseline at {args.baseline}, run with --update to create it')
+        return 0
+
+    with open(args.baseline, 'rt') as fin:
+        baseline = ujson.loads(fin.read())
+
+    regressions = compare(baseline, report, args.threshold)
+    for name, ratio, allowed in regressions:
+        print(f'REGRESSION {name}: {ratio:.2f} of baseline throughput, '
+              f'tolerance {allowed:.2f}')
+
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
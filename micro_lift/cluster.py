@@ -0,0 +1,298 @@
+"""Многопроцессный режим работы с общим состоянием здания.
+
+Здание симулирует ровно один процесс-владелец. Процессы-обработчики Sanic
+только держат websocket-соединения и пересылают кадры владельцу через
+локальный unix-сокет, а владелец обрабатывает их обычным LiftApp так,
+будто клиенты подключены к нему напрямую. HTTP-запросы метрик и спанов
+обработчики тоже передают владельцу и возвращают его ответ
+"""
+
+import asyncio
+from itertools import count
+import multiprocessing
+import os
+import signal
+import struct
+from types import SimpleNamespace
+from urllib.parse import parse_qs
+
+from sanic import response
+from sanic.log import error_logger
+from sanic.request import RequestParameters
+import ujson
+
+from codec import JSON
+from conf import load_config
+from fanout import Outbox
+from views import LiftApp
+
+
+OPEN, FRAME, CLOSE, REQUEST, RESPONSE = 1, 2, 3, 4, 5
+
+# HTTP-обработчики LiftApp, которые обработчики передают владельцу
+RELAYED_ROUTES = ('metrics', 'spans')
+
+# Заголовок сообщения: операция, признак бинарного кадра, номер соединения, длина
+_HEADER = struct.Struct('!BBQI')
+
+
+def pack_message(op, conn, payload=b''):
+    binary = isinstance(payload, bytes)
+    if not binary:
+        payload = payload.encode('utf-8')
+
+    return _HEADER.pack(op, binary, conn, len(payload)) + payload
+
+
+async def read_message(reader):
+    op, binary, conn, size = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+    payload = await reader.readexactly(size)
+
+    return op, conn, payload if binary else payload.decode('utf-8')
+
+
+class RelayClosed(Exception):
+    def __init__(self, message='Relayed connection is closed', *args, **kwargs):
+        super().__init__(message, *args, **kwargs)
+
+
+class OwnerUnavailable(Exception):
+    def __init__(self, message='Simulation owner is unavailable', *args, **kwargs):
+        super().__init__(message, *args, **kwargs)
+
+
+class RelayRequest:
+    """Параметры исходного запроса на подключение к процессу-обработчику"""
+
+    def __init__(self, query_string, headers=None):
+        self.query_string = query_string
+        self.args = RequestParameters(parse_qs(query_string))
+        # Заголовки ищутся без учета регистра, как у запроса Sanic
+        self.headers = {k.lower(): v for k, v in (headers or {}).items()}
+
+
+class RelaySocket:
+    """Сокет клиента на стороне владельца, подключенного через обработчик"""
+
+    def __init__(self, writer, conn):
+        self._writer = writer
+        self._conn = conn
+        self._inbox = asyncio.Queue()
+        self._closed = False
+
+    def feed(self, msg):
+        self._inbox.put_nowait(msg)
+
+    async def recv(self):
+        msg = await self._inbox.get()
+        if msg is None:
+            self._closed = True
+            raise RelayClosed
+
+        return msg
+
+    async def send(self, msg):
+        if self._closed:
+            raise RelayClosed
+
+        self._writer.write(pack_message(FRAME, self._conn, msg))
+        await self._writer.drain()
+
+    async def close(self):
+        if not self._closed:
+            self._closed = True
+            self._writer.write(pack_message(CLOSE, self._conn))
+            self._inbox.put_nowait(None)
+
+
+class SimulationOwner:
+    """Процесс, владеющий зданием и обрабатывающий сигналы всех клиентов"""
+
+    def __init__(self, app):
+        self.app = app
+        self.lift_app = LiftApp(app)
+
+    async def serve(self, path):
+        if os.path.exists(path):
+            os.unlink(path)
+
+        asyncio.ensure_future(self.lift_app.lift_loop(self.app))
+        return await asyncio.start_unix_server(self._handle_worker, path)
+
+    async def _handle_worker(self, reader, writer):
+        sockets = {}
+        try:
+            while True:
+                op, conn, payload = await read_message(reader)
+                if op == OPEN:
+                    ws = sockets[conn] = RelaySocket(writer, conn)
+                    asyncio.ensure_future(
+                        self.lift_app.entry_point(RelayRequest(payload), ws))
+                elif op == FRAME and conn in sockets:
+                    sockets[conn].feed(payload)
+                elif op == CLOSE and conn in sockets:
+                    sockets.pop(conn).feed(None)
+                elif op == REQUEST:
+                    asyncio.ensure_future(self._respond(writer, conn, payload))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            # Обработчик завершился, все его клиенты отключены
+            for ws in sockets.values():
+                ws.feed(None)
+
+
+    async def _respond(self, writer, conn, payload):
+        route, query_string, headers = ujson.loads(payload)
+        if route in RELAYED_ROUTES:
+            handler = getattr(self.lift_app, route)
+            resp = await handler(RelayRequest(query_string, headers))
+        else:
+            resp = response.json({'message': 'Not found'}, status=404)
+
+        writer.write(pack_message(RESPONSE, conn, ujson.dumps(
+            [resp.status, resp.content_type, resp.body.decode('utf-8')])))
+
+
+def run_owner(config_path, init_state):
+    config = load_config(config_path)
+    app = SimpleNamespace(config=config, ctx=SimpleNamespace())
+    init_state(app.ctx, config)
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    loop.run_until_complete(SimulationOwner(app).serve(config['CLUSTER']['SOCKET']))
+
+    # Главный процесс останавливает владельца сигналом SIGTERM. Вместо
+    # обработчиков остановки сервера, которых у владельца нет, состояние
+    # сохраняется здесь
+    loop.add_signal_handler(signal.SIGTERM, loop.stop)
+    loop.run_forever()
+    stop_owner(app.ctx)
+
+
+def stop_owner(ctx):
+    if ctx.persistence is not None:
+        ctx.persistence.snapshot()
+    if ctx.trace is not None:
+        ctx.trace.close()
+    if ctx.solver is not None:
+        ctx.solver.close()
+
+
+def start_owner(config_path, init_state):
+    """Запускает процесс-владелец симуляции"""
+
+    process = multiprocessing.Process(
+        target=run_owner, args=(config_path, init_state), name='lift-owner', daemon=True)
+    process.start()
+
+    return process
+
+
+class OwnerLink:
+    """Соединение процесса-обработчика с владельцем симуляции"""
+
+    def __init__(self, path, queue_size=256, policy='coalesce'):
+        self._path = path
+        self._queue_size = queue_size
+        self._policy = policy
+        self._ids = count(1)
+        self._outboxes = {}
+        # Ответы владельца на HTTP-запросы по номерам запросов
+        self._requests = {}
+        self._writer = None
+        self._down = False
+
+    async def connect(self, app, loop):
+        # Владелец мог еще не успеть открыть сокет
+        for _ in range(50):
+            try:
+                reader, self._writer = await asyncio.open_unix_connection(self._path)
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                await asyncio.sleep(0.1)
+        else:
+            raise RuntimeError(f'Simulation owner is not available at {self._path}')
+
+        asyncio.ensure_future(self._read(reader))
+
+    async def entry_point(self, request, ws):
+        if self._down:
+            await ws.send(JSON.error('connect', None, 503, str(OwnerUnavailable())))
+            await ws.close()
+            return
+
+        conn, writer = next(self._ids), self._writer
+        self._outboxes[conn] = Outbox(ws, self._queue_size, self._policy)
+
+        # Подпротокол известен только обработчику, владелец узнает кодек из параметров
+        query = request.query_string
+        if getattr(ws, 'subprotocol', None) and 'codec' not in request.args:
+            query = '&'.join(filter(None, [query, f'codec={ws.subprotocol}']))
+
+        writer.write(pack_message(OPEN, conn, query))
+        try:
+            while True:
+                msg = await ws.recv()
+                writer.write(pack_message(FRAME, conn, msg))
+                await writer.drain()
+        finally:
+            writer.write(pack_message(CLOSE, conn))
+            outbox = self._outboxes.pop(conn, None)
+            if outbox is not None:
+                outbox.close()
+
+    async def metrics(self, request):
+        return await self._relay('metrics', request)
+
+    async def spans(self, request):
+        return await self._relay('spans', request)
+
+    async def _relay(self, route, request):
+        """Передает HTTP-запрос владельцу и возвращает его ответ"""
+
+        if self._down:
+            return response.json({'message': str(OwnerUnavailable())}, status=503)
+
+        conn, loop = next(self._ids), asyncio.get_event_loop()
+        waiter = self._requests[conn] = loop.create_future()
+        try:
+            self._writer.write(pack_message(REQUEST, conn, ujson.dumps(
+                [route, request.query_string, dict(request.headers)])))
+            status, content_type, body = await waiter
+        except OwnerUnavailable as e:
+            return response.json({'message': str(e)}, status=503)
+        finally:
+            self._requests.pop(conn, None)
+
+        return response.raw(body.encode('utf-8'), status=status, content_type=content_type)
+
+    async def _read(self, reader):
+        try:
+            while True:
+                op, conn, payload = await read_message(reader)
+                if op == RESPONSE:
+                    waiter = self._requests.get(conn)
+                    if waiter is not None and not waiter.done():
+                        waiter.set_result(ujson.loads(payload))
+                    continue
+
+                outbox = self._outboxes.get(conn)
+                if outbox is None:
+                    continue
+
+                if op == FRAME:
+                    outbox.put(payload)
+                elif op == CLOSE:
+                    self._outboxes.pop(conn)
+                    outbox.finish()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            # Владелец завершился: его клиентам больше никто не ответит,
+            # они отключаются после уже полученных кадров
+            error_logger.error('Simulation owner closed the cluster socket')
+            self._down = True
+            for outbox in self._outboxes.values():
+                outbox.finish()
+            self._outboxes.clear()
+            for waiter in self._requests.values():
+                if not waiter.done():
+                    waiter.set_exception(OwnerUnavailable())
@@ -0,0 +1,237 @@
+"""Кодирование кадров протокола, выбираемое для каждого соединения.
+
+По умолчанию кадры передаются текстом в JSON. Клиент может запросить
+компактный бинарный формат MessagePack параметром ?codec=msgpack или
+подпротоколом websocket "msgpack". В нем объекты передаются массивами
+полей, статусы - числами, а уведомления - массивами без повторяющихся
+ключей
+"""
+
+import struct
+
+import msgpack
+import ujson
+
+from models import ActorStatus, LiftStatus
+from serializers import (actor_json, actors_json, encode_actor, encode_lift,
+                         lift_json, lifts_json)
+
+
+class UnknownCodec(Exception):
+    def __init__(self, message='Unsupported codec', *args, **kwargs):
+        super().__init__(message, *args, **kwargs)
+
+
+class JsonCodec:
+    name = 'json'
+
+    @staticmethod
+    def loads(msg):
+        return ujson.loads(msg)
+
+    actor = staticmethod(actor_json)
+    actors = staticmethod(actors_json)
+    lift = staticmethod(lift_json)
+    lifts = staticmethod(lifts_json)
+
+    @staticmethod
+    def join(items):
+        """Список из уже закодированных элементов"""
+        return '[' + ','.join(items) + ']'
+
+    @staticmethod
+    def response(signal, id, data, status='ok'):
+        return ujson.dumps({
+            'type': 'response',
+            'signal': signal,
+            'id': id,
+            'status': status,
+            'data': data
+        })
+
+    @staticmethod
+    def raw_response(signal, id, raw, status='ok', **extra):
+        """Ответ с данными, уже закодированными в JSON.
+        Непустые строки extra добавляются к ответу, например курсор
+        следующей страницы выборки
+        """
+        tail = ''.join([',"%s":%s' % (k, ujson.dumps(v)) for k, v in extra.items() if v is not None])
+
+        return '{"type":"response","signal":%s,"id":%s,"status":%s,"data":%s%s}' % (
+            ujson.dumps(signal), ujson.dumps(id), ujson.dumps(status), raw, tail)
+
+    @classmethod
+    def error(cls, signal, id, code, message):
+        return cls.response(signal, id, {'code': code, 'message': message}, 'error')
+
+    @staticmethod
+    def notify(event, data):
+        return ujson.dumps({
+            'type': 'notify',
+            'event': event,
+            'data': data
+        })
+
+    @staticmethod
+    def raw_notify(event, raw):
+        """Уведомление с данными, уже закодированными в JSON"""
+        return '{"type":"notify","event":%s,"data":%s}' % (ujson.dumps(event), raw)
+
+    @classmethod
+    def lift_event(cls, event, lift_id, floor):
+        """Уведомление о посадке в лифт или высадке из него"""
+        return cls.notify(event, {'id': lift_id, 'floor': floor})
+
+    @classmethod
+    def update(cls, topic, changes, removed):
+        """Уведомление подписчика об изменениях темы"""
+        return cls.notify('update', {
+            'topic': topic,
+            'changes': changes,
+            'removed': removed,
+        })
+
+
+# Порядок полей объектов в массивах MessagePack и коды их статусов
+TOPICS = {
+    'lifts': (('id', 'speed', 'max_weight', 'position', 'passengers', 'status'), LiftStatus),
+    'actors': (('uid', 'weight', 'floor', 'need_floor', 'status', 'timestamp'), ActorStatus),
+    'floors': (('waiting',), None),
+}
+
+
+def _packb(obj):
+    return msgpack.packb(obj, use_bin_type=True)
+
+
+def _array_header(size):
+    if size < 16:
+        return bytes((0x90 | size,))
+    if size < 0x10000:
+        return b'\xdc' + struct.pack('>H', size)
+
+    return b'\xdd' + struct.pack('>I', size)
+
+
+def _compact(topic, state):
+    """Объект темы в виде массива полей с числовым статусом"""
+
+    names, statuses = TOPICS[topic]
+    return [statuses[state[x]].value if x == 'status' else state[x] for x in names]
+
+
+def _actor_msgpack(actor):
+    return _packb(_compact('actors', encode_actor(actor)))
+
+
+def _lift_msgpack(lift):
+    return _packb(_compact('lifts', encode_lift(lift)))
+
+
+class MsgpackCodec:
+    name = 'msgpack'
+
+    @staticmethod
+    def loads(msg):
+        if not isinstance(msg, bytes):
+            raise ValueError('MessagePack frame expected')
+
+        return msgpack.unpackb(msg, raw=False)
+
+    @staticmethod
+    def actor(actor):
+        return actor.snapshot(_actor_msgpack)
+
+    @classmethod
+    def actors(cls, actors):
+        return cls.join([cls.actor(x) for x in actors])
+
+    @staticmethod
+    def lift(lift):
+        return lift.snapshot(_lift_msgpack)
+
+    @classmethod
+    def lifts(cls, lifts):
+        return cls.join([cls.lift(x) for x in lifts])
+
+    @staticmethod
+    def join(items):
+        return _array_header(len(items)) + b''.join(items)
+
+    @staticmethod
+    def response(signal, id, data, status='ok'):
+        return _packb({
+            'type': 'response',
+            'signal': signal,
+            'id': id,
+            'status': status,
+            'data': data
+        })
+
+    @staticmethod
+    def raw_response(signal, id, raw, status='ok', **extra):
+        """Ответ с данными, уже закодированными в MessagePack"""
+
+        head = _packb({'type': 'response', 'signal': signal, 'id': id, 'status': status})
+        tail = _packb('data') + raw
+        size = 5
+        for key, value in extra.items():
+            if value is not None:
+                tail += _packb(key) + _packb(value)
+                size += 1
+
+        # Заголовок fixmap содержит число пар ключ-значение
+        return bytes((0x80 | size,)) + head[1:] + tail
+
+    @classmethod
+    def error(cls, signal, id, code, message):
+        return cls.response(signal, id, {'code': code, 'message': message}, 'error')
+
+    @staticmethod
+    def notify(event, data):
+        return _packb([event, data])
+
+    @staticmethod
+    def raw_notify(event, raw):
+        return b'\x92' + _packb(event) + raw
+
+    @staticmethod
+    def lift_event(event, lift_id, floor):
+        return _packb([event, [lift_id, floor]])
+
+    @staticmethod
+    def update(topic, changes, removed):
+        """Изменившиеся поля передаются номерами полей вместо имен"""
+
+        names, statuses = TOPICS[topic]
+        inx = {x: i for i, x in enumerate(names)}
+        compact = {}
+        for id, fields in changes.items():
+            compact[int(id) if topic == 'floors' else id] = {
+                inx[k]: statuses[v].value if k == 'status' else v
+                for k, v in fields.items()
+            }
+
+        if topic == 'floors':
+            removed = [int(x) for x in removed]
+
+        return _packb(['update', [topic, compact, removed]])
+
+
+JSON = JsonCodec()
+
+CODECS = {JSON.name: JSON, MsgpackCodec.name: MsgpackCodec()}
+
+# Подпротоколы websocket, которые сервер готов согласовать
+SUBPROTOCOLS = tuple(CODECS)
+
+
+def negotiate(request, ws):
+    """Кодек соединения: из параметра codec или согласованного подпротокола"""
+
+    name = request.args.get('codec') or getattr(ws, 'subprotocol', None) or JSON.name
+    codec = CODECS.get(name)
+    if codec is None:
+        raise UnknownCodec(f'Unsupported codec: {name}')
+
+    return codec
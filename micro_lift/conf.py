@@ -1,7 +1,19 @@
-from marshmallow import Schema, fields
+from importlib.util import find_spec
+
+from marshmallow import Schema, ValidationError, fields
+from marshmallow.validate import OneOf, Range
 import yaml
 
 
+def _engine_installed(value):
+    # Векторный движок - необязательная зависимость, ее отсутствие должно
+    # выясниться при загрузке конфигурации, а не при создании здания
+    if value == 'numpy' and find_spec('numpy') is None:
+        raise ValidationError('Engine numpy requires the numpy package, '
+                              'install requirements-optional.txt')
+
+
+
 class FloorSchema(Schema):
     COUNT = fields.Int(required=True)
     HEIGHT = fields.Float(required=True)
@@ -10,6 +22,44 @@ class LiftSchema(Schema):
     COUNT = fields.Int(required=True)
     MAX_WEIGHT = fields.Float(default=300.0, missing=300.0)
     SPEED = fields.Float(default=0.25, missing=0.25)
+    ENGINE = fields.Str(default='python', missing='python',
+                        validate=[OneOf(['python', 'numpy']), _engine_installed])
+
+class DispatchSchema(Schema):
+    STRATEGY = fields.Str(default='nearest', missing='nearest',
+                          validate=OneOf(['nearest', 'collective', 'destination', 'optimal']))
+    STATS_WINDOW = fields.Int(default=1000, missing=1000)
+    SOLVER_INTERVAL = fields.Float(default=1.0, missing=1.0, validate=Range(min=0.01))
+    SOLVER_WORKERS = fields.Int(default=1, missing=1, validate=Range(min=1))
+
+class FanoutSchema(Schema):
+    QUEUE_SIZE = fields.Int(default=256, missing=256, validate=Range(min=1))
+    POLICY = fields.Str(default='coalesce', missing='coalesce',
+                        validate=OneOf(['coalesce', 'drop']))
+    MAX_WATCHES = fields.Int(default=64, missing=64, validate=Range(min=1))
+
+class ClusterSchema(Schema):
+    SOCKET = fields.Str(default='/tmp/micro_lift.sock', missing='/tmp/micro_lift.sock')
+
+class LifecycleSchema(Schema):
+    ACTOR_TTL = fields.Float(default=600.0, missing=600.0, validate=Range(min=0))
+    MAX_ACTORS = fields.Int(missing=None, allow_none=True, validate=Range(min=1))
+    SWEEP_INTERVAL = fields.Float(default=10.0, missing=10.0, validate=Range(min=0.01))
+
+class PersistenceSchema(Schema):
+    DIR = fields.Str(missing=None, allow_none=True)
+    FLUSH_INTERVAL = fields.Float(default=0.2, missing=0.2, validate=Range(min=0.01))
+    SNAPSHOT_INTERVAL = fields.Float(default=60.0, missing=60.0, validate=Range(min=1))
+
+class TraceSchema(Schema):
+    PATH = fields.Str(missing=None, allow_none=True)
+    FLUSH_INTERVAL = fields.Float(default=1.0, missing=1.0, validate=Range(min=0.01))
+    BUFFER_SIZE = fields.Int(default=65536, missing=65536, validate=Range(min=1))
+
+class SpansSchema(Schema):
+    ENABLED = fields.Bool(default=False, missing=False)
+    BUFFER_SIZE = fields.Int(default=65536, missing=65536, validate=Range(min=1))
+    TOKEN = fields.Str(missing=None, allow_none=True)
 
 class ConfigSchema(Schema):
     HOST = fields.Str(required=True)
@@ -17,13 +67,21 @@ class ConfigSchema(Schema):
     UNIX = fields.Str(missing=None, allow_none=True)
     DEBUG = fields.Bool(default=False, missing=False)
     SOCK = fields.Str(missing=None, allow_none=True)
-    WORKERS = fields.Int(default=1)
+    WORKERS = fields.Int(default=1, missing=1)
     ACCESS_LOG = fields.Bool(default=False, missing=False)
 
     AUTH_TOKEN_DELAY = fields.Int(required=True)
+    AUTH_TICKET_TTL = fields.Int(default=300, missing=300, validate=Range(min=1))
     DATETIME_FORMAT = fields.Str(required=True)
     FLOOR = fields.Nested(FloorSchema, required=True)
     LIFT = fields.Nested(LiftSchema, required=True)
+    DISPATCH = fields.Nested(DispatchSchema, missing=lambda: DispatchSchema().load({}))
+    FANOUT = fields.Nested(FanoutSchema, missing=lambda: FanoutSchema().load({}))
+    CLUSTER = fields.Nested(ClusterSchema, missing=lambda: ClusterSchema().load({}))
+    LIFECYCLE = fields.Nested(LifecycleSchema, missing=lambda: LifecycleSchema().load({}))
+    PERSISTENCE = fields.Nested(PersistenceSchema, missing=lambda: PersistenceSchema().load({}))
+    TRACE = fields.Nested(TraceSchema, missing=lambda: TraceSchema().load({}))
+    SPANS = fields.Nested(SpansSchema, missing=lambda: SpansSchema().load({}))
     LOOP_DELAY = fields.Float(required=True)
     SECRET_KEY = fields.Str(required=True)
 
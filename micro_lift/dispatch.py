@@ -0,0 +1,254 @@
+"""Диспетчеризация вызовов: каждый вызов с этажа закрепляется за одним лифтом"""
+
+from collections import deque
+from time import monotonic
+
+
+class Stats:
+    """Накопительная статистика по интервалам времени в секундах.
+
+    Среднее и максимум считаются по всем замерам, а перцентили - по
+    скользящему окну последних window замеров (по всем, если window=None)
+    """
+
+    def __init__(self, window=1000):
+        self._samples = deque(maxlen=window)
+        self._count = 0
+        self._total = 0.0
+        self._max = 0.0
+
+    def add(self, value):
+        self._samples.append(value)
+        self._count += 1
+        self._total += value
+        if value > self._max:
+            self._max = value
+
+    def summary(self):
+        samples = sorted(self._samples)
+
+        def percentile(p):
+            return samples[min(len(samples) - 1, int(len(samples) * p))] if samples else None
+
+        return {
+            'count': self._count,
+            'mean': self._total / self._count if self._count else None,
+            'max': self._max if self._count else None,
+            'p50': percentile(0.5),
+            'p90': percentile(0.9),
+            'p99': percentile(0.99),
+            'p999': percentile(0.999),
+        }
+
+
+class Dispatcher:
+    """Стратегия "ближайший лифт".
+
+    На каждом шаге все вызовы распределяются между лифтами заново, и каждый
+    вызов достается ровно одному лифту - тому, для которого он дешевле всего.
+    Лифт едет к ближайшему из своих вызовов или этажей высадки
+    """
+
+    name = 'nearest'
+
+    def __init__(self, stats_window=1000):
+        self._calls = {}
+        self.wait_stats = Stats(stats_window)
+        self.trip_stats = Stats(stats_window)
+
+    def assign(self, lifts, waiting):
+        """Распределяет текущие вызовы между лифтами"""
+
+        self._calls = {lift_id: [] for lift_id in lifts}
+        for floor, weight in waiting.calls():
+            best = self._best(lifts, floor, weight, waiting)
+            if best is not None:
+                self._calls[best].append(floor)
+
+    def calls(self, lift_id):
+        """Этажи вызовов, закрепленных за лифтом"""
+        return self._calls.get(lift_id, [])
+
+    def next_floor(self, lift, waiting):
+        """Этаж, к которому лифту следует двигаться"""
+
+        free = lift.max_weight - lift.load
+        stops = {x.need_floor for x in lift.passengers}
+        for floor in self.calls(lift.id):
+            # Вызов мог быть уже обслужен другим лифтом на этом шаге
+            lightest = waiting.lightest(floor)
+            if lightest is not None and lightest <= free:
+                stops.add(floor)
+
+        return self._pick(lift, stops) if stops else None
+
+    def boarded(self, actors):
+        now = monotonic()
+        for x in actors:
+            if x.called_at is not None:
+                self.wait_stats.add(now - x.called_at)
+
+    def dropped(self, actors):
+        now = monotonic()
+        for x in actors:
+            if x.entered_at is not None:
+                self.trip_stats.add(now - x.entered_at)
+
+    def stats(self):
+        return {
+            'strategy': self.name,
+            'wait': self.wait_stats.summary(),
+            'trip': self.trip_stats.summary(),
+        }
+
+    def _best(self, lifts, floor, weight, waiting):
+        """Лифт, для которого вызов дешевле всего, или None, если вызов
+        не по силам ни одному
+        """
+        best, best_cost = None, None
+        for lift_id, lift in lifts.items():
+            if lift.max_weight - lift.load < weight:
+                continue
+
+            cost = self._cost(lift, floor, waiting)
+            if best_cost is None or cost < best_cost:
+                best, best_cost = lift_id, cost
+
+        return best
+
+    def _stops(self, lift):
+        return {x.need_floor for x in lift.passengers}.union(self.calls(lift.id))
+
+    def _cost(self, lift, floor, waiting):
+        return abs(lift.floor - floor)
+
+    def _pick(self, lift, stops):
+        cur_floor = lift.floor
+        return min(stops, key=lambda x: abs(cur_floor - x))
+
+
+class CollectiveDispatcher(Dispatcher):
+    """Собирательное управление (SCAN/LOOK).
+
+    Лифт продолжает движение в текущем направлении, пока впереди есть
+    остановки, и разворачивается только когда они заканчиваются. Вызов
+    впереди по ходу движения стоит расстояние до него, вызов позади -
+    еще и дорогу до дальней остановки и обратно
+    """
+
+    name = 'collective'
+
+    def __init__(self, *args, **kwargs):
+        self._directions = {}
+
+        super().__init__(*args, **kwargs)
+
+    def _cost(self, lift, floor, waiting):
+        cur_floor = lift.floor
+        direction = self._directions.get(lift.id, 1)
+        if (floor - cur_floor) * direction >= 0:
+            return abs(floor - cur_floor)
+
+        ahead = [abs(x - cur_floor) for x in self._stops(lift)
+                 if (x - cur_floor) * direction > 0]
+
+        return abs(floor - cur_floor) + 2 * max(ahead, default=0)
+
+    def _pick(self, lift, stops):
+        cur_floor = lift.floor
+        direction = self._directions.get(lift.id, 1)
+        ahead = [x for x in stops if (x - cur_floor) * direction >= 0]
+        if not ahead:
+            direction = -direction
+            self._directions[lift.id] = direction
+            ahead = stops
+
+        return min(ahead, key=lambda x: abs(cur_floor - x))
+
+
+class DestinationDispatcher(Dispatcher):
+    """Диспетчеризация по этажам назначения.
+
+    Вызов достается лифту, которому он добавит меньше всего новых
+    остановок: пассажиры с общими этажами назначения собираются в один лифт
+    """
+
+    name = 'destination'
+
+    STOP_COST = 2.0
+
+    def _cost(self, lift, floor, waiting):
+        stops = self._stops(lift)
+        new_stops = {x.need_floor for x in waiting.at_floor(floor)} - stops
+        if floor not in stops:
+            new_stops.add(floor)
+
+        return abs(lift.floor - floor) + self.STOP_COST * len(new_stops)
+
+
+class OptimalDispatcher(Dispatcher):
+    """Распределение по плану решателя задачи о назначениях.
+
+    План рассчитывается вне петли событий (solver.PlanSolver), и до прихода
+    следующего действует последний. Вызовы, которых в плане нет или которые
+    закрепленный лифт уже не вместит, распределяются как в "ближайшем лифте"
+    """
+
+    name = 'optimal'
+
+    def __init__(self, stats_window=1000):
+        self._plan = {}
+        self._plan_at = None
+        self.solver_stats = Stats(stats_window)
+
+        super().__init__(stats_window)
+
+    def set_plan(self, plan, at, latency):
+        """Принимает план, рассчитанный по состоянию здания на момент at"""
+
+        self._plan = plan
+        self._plan_at = at
+        self.solver_stats.add(latency)
+
+    def plan_age(self):
+        """Возраст действующего плана в секундах или None, если плана еще нет"""
+
+        return monotonic() - self._plan_at if self._plan_at is not None else None
+
+    def assign(self, lifts, waiting):
+        plan = self._plan
+        self._calls = {lift_id: [] for lift_id in lifts}
+        for floor, weight in waiting.calls():
+            lift = lifts.get(plan.get(floor))
+            if lift is not None and lift.max_weight - lift.load >= weight:
+                best = lift.id
+            else:
+                best = self._best(lifts, floor, weight, waiting)
+
+            if best is not None:
+                self._calls[best].append(floor)
+
+    def stats(self):
+        stats = super().stats()
+        stats['solver'] = {
+            'plan_age': self.plan_age(),
+            'latency': self.solver_stats.summary(),
+        }
+
+        return stats
+
+
+STRATEGIES = {
+    Dispatcher.name: Dispatcher,
+    CollectiveDispatcher.name: CollectiveDispatcher,
+    DestinationDispatcher.name: DestinationDispatcher,
+    OptimalDispatcher.name: OptimalDispatcher,
+}
+
+
+def create_dispatcher(config):
+    """Создает диспетчер, выбранный в конфигурации"""
+
+    dispatch = config['DISPATCH']
+
+    return STRATEGIES[dispatch['STRATEGY']](dispatch['STATS_WINDOW'])
@@ -0,0 +1,174 @@
+"""Движки, продвигающие все лифты здания на один шаг симуляции"""
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from models import BaseLift, Lift, LiftStatus
+
+
+_STATUSES = tuple(LiftStatus)
+
+
+class LiftEngine:
+    """Базовый движок: каждый лифт хранит свое состояние и двигается сам"""
+
+    def __init__(self, count, speed, max_weight, floor_height):
+        self.lifts = {}
+        for inx in range(count):
+            self.lifts[f'lift_{inx}'] = self._create_lift(
+                inx, f'lift_{inx}', speed, max_weight, floor_height)
+
+    def _create_lift(self, inx, id, speed, max_weight, floor_height):
+        return Lift(id, speed, max_weight, floor_height)
+
+    def advance(self, steps=1):
+        """Сдвигает все лифты на steps шагов к назначенным этажам"""
+
+        for lift in self.lifts.values():
+            lift.advance(steps)
+
+
+class ArrayLift(BaseLift):
+    """Лифт, чье состояние хранится в массивах NumpyEngine.
+
+    Закрытые атрибуты базового класса отображены на ячейки массивов,
+    поэтому весь интерфейс Lift продолжает работать без изменений.
+    В самом объекте остаются лишь неизменные поля и пассажиры
+    """
+
+    __slots__ = ('_engine', '_inx', '_id', '_max_weight', '_passengers', '_floor_height',
+                 '_dirty', '_snapshots', '_watchers')
+
+    def __init__(self, engine, inx, id, speed, max_weight, floor_height=1.0):
+        self._engine = engine
+        self._inx = inx
+        self._id = id
+        self._max_weight = max_weight
+        self._passengers = []
+        self._floor_height = floor_height
+        self._dirty = True
+        self._snapshots = None
+        self._watchers = ()
+
+        self._speed = speed
+        self._position = 0.01
+        self._load = 0.0
+        self._status = LiftStatus.STOPPED
+        self._target = None
+
+    @property
+    def _position(self):
+        return float(self._engine.position[self._inx])
+
+    @_position.setter
+    def _position(self, pos):
+        engine = self._engine
+        engine.position[self._inx] = pos
+        engine.floor[self._inx] = np.ceil(pos / engine.floor_height)
+
+    @property
+    def _speed(self):
+        return float(self._engine.speed[self._inx])
+
+    @_speed.setter
+    def _speed(self, speed):
+        self._engine.speed[self._inx] = speed
+
+    @property
+    def _status(self):
+        return _STATUSES[self._engine.status[self._inx]]
+
+    @_status.setter
+    def _status(self, status):
+        self._engine.status[self._inx] = status.value
+
+    @property
+    def _load(self):
+        return float(self._engine.load[self._inx])
+
+    @_load.setter
+    def _load(self, load):
+        self._engine.load[self._inx] = load
+
+    @property
+    def _target(self):
+        target = self._engine.target[self._inx]
+        return int(target) if target != NumpyEngine.NO_TARGET else None
+
+    @_target.setter
+    def _target(self, floor):
+        self._engine.target[self._inx] = NumpyEngine.NO_TARGET if floor is None else floor
+
+    @property
+    def floor(self):
+        return int(self._engine.floor[self._inx])
+
+
+class NumpyEngine(LiftEngine):
+    """Движок, хранящий состояние лифтов в массивах NumPy.
+
+    Положение, скорость, статус, загрузка и целевой этаж всех лифтов
+    лежат в отдельных массивах, а шаг симуляции выполняется одной
+    векторной операцией сразу для всего здания
+    """
+
+    NO_TARGET = -1
+
+    def __init__(self, count, speed, max_weight, floor_height):
+        if np is None:
+            raise RuntimeError('NumPy engine requires numpy package')
+
+        self.floor_height = floor_height
+        self.position = np.zeros(count, dtype=np.float64)
+        self.floor = np.zeros(count, dtype=np.int64)
+        self.speed = np.zeros(count, dtype=np.float64)
+        self.status = np.zeros(count, dtype=np.int8)
+        self.load = np.zeros(count, dtype=np.float64)
+        self.target = np.full(count, self.NO_TARGET, dtype=np.int64)
+
+        super().__init__(count, speed, max_weight, floor_height)
+        self._by_inx = list(self.lifts.values())
+
+    def _create_lift(self, inx, id, speed, max_weight, floor_height):
+        return ArrayLift(self, inx, id, speed, max_weight, floor_height)
+
+    def advance(self, steps=1):
+        if steps <= 0:
+            return
+
+        target, height = self.target, self.floor_height
+        direction = np.where(target != self.NO_TARGET, np.sign(target - self.floor), 0)
+        moving = direction != 0
+
+        # Шаги до въезда на целевой этаж, как в Lift.steps_to
+        up = np.floor(((target - 1) * height - self.position) / self.speed) + 1
+        down = np.ceil((self.position - target * height) / self.speed)
+        need = np.maximum(np.where(direction > 0, up, down), 1)
+
+        self.position += self.speed * direction * np.minimum(need, steps)
+        np.maximum(self.position, 0.0, out=self.position)
+        self.status[moving] = LiftStatus.IN_ACTION.value
+        self.floor[:] = np.ceil(self.position / height)
+
+        # Массивы изменены в обход сеттеров, оповещаем о сдвинутых лифтах
+        lifts = self._by_inx
+        for inx in np.flatnonzero(moving):
+            lifts[inx]._touch()
+
+
+ENGINES = {
+    'python': LiftEngine,
+    'numpy': NumpyEngine,
+}
+
+
+def create_engine(config):
+    """Создает движок лифтов, выбранный в конфигурации"""
+
+    lift = config['LIFT']
+    engine_cls = ENGINES[lift['ENGINE']]
+
+    return engine_cls(lift['COUNT'], lift['SPEED'], lift['MAX_WEIGHT'],
+                      config['FLOOR']['HEIGHT'])
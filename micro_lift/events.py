@@ -0,0 +1,61 @@
+"""Внутренняя шина доменных событий симуляции"""
+
+import asyncio
+from collections import namedtuple
+
+from sanic.log import error_logger
+
+
+DROP_OFF = 'drop_off'
+ENTER_LIFT = 'enter_lift'
+FLOOR_PASSED = 'floor_passed'
+LIFT_STOPPED = 'lift_stopped'
+
+
+Event = namedtuple('Event', ['kind', 'lift_id', 'floor', 'actors'])
+Event.__new__.__defaults__ = ((),)
+
+
+class EventBus:
+    """Шина, через которую шаг симуляции сообщает о происходящем.
+
+    Публикация синхронна и ничего не ждет: слушатели (listen) вызываются
+    сразу и должны быть дешевыми, а подписчики (subscribe) получают события
+    через свою очередь в отдельной задаче и могут заниматься вводом-выводом
+    """
+
+    def __init__(self):
+        self._listeners = []
+        self._queues = []
+
+    def listen(self, handler, kinds=None):
+        """Регистрирует синхронный обработчик событий"""
+
+        self._listeners.append((kinds, handler))
+
+    def subscribe(self, handler, kinds=None):
+        """Запускает задачу, передающую события асинхронному обработчику"""
+
+        queue = asyncio.Queue()
+        self._queues.append((kinds, queue))
+
+        return asyncio.ensure_future(self._consume(queue, handler))
+
+    def publish(self, event):
+        for kinds, handler in self._listeners:
+            if kinds is None or event.kind in kinds:
+                handler(event)
+
+        for kinds, queue in self._queues:
+            if kinds is None or event.kind in kinds:
+                queue.put_nowait(event)
+
+    @staticmethod
+    async def _consume(queue, handler):
+        while True:
+            event = await queue.get()
+            try:
+                await handler(event)
+            except Exception:
+                # Ошибка одного события не должна лишать подписчика остальных
+                error_logger.exception('Event handler failed on %s', event.kind)
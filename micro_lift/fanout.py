@@ -0,0 +1,172 @@
+"""Рассылка сообщений подписчикам без ожидания медленных клиентов"""
+
+import asyncio
+from collections import deque
+from time import monotonic
+
+from codec import JSON
+
+
+class Outbox:
+    """Ограниченная очередь исходящих сообщений одного сокета.
+
+    Сообщения отправляет отдельная задача-писатель, поэтому постановка
+    в очередь никогда не ждет сеть. При переполнении очереди медленный
+    клиент либо отключается (политика drop), либо теряет самые старые
+    сообщения (политика coalesce). Сообщения с ключом в политике coalesce
+    заменяют еще не отправленное сообщение с тем же ключом. В гистограмму
+    delay записывается время от постановки кадра в очередь до его отправки
+    """
+
+    def __init__(self, ws, size, policy, delay=None):
+        self._ws = ws
+        self._size = size
+        self._policy = policy
+        self._delay = delay
+        self._queue = deque()
+        self._keyed = {}
+        self._ready = asyncio.Event()
+        self._closed = False
+        self._finishing = False
+        self._task = asyncio.ensure_future(self._writer())
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def __len__(self):
+        return len(self._queue)
+
+    def put(self, frame, key=None):
+        """Ставит кадр в очередь, возвращает False если клиент отключен"""
+
+        if self._closed or self._finishing:
+            return False
+
+        if key is not None and self._policy == 'coalesce':
+            entry = self._keyed.get(key)
+            if entry is not None:
+                entry[1] = frame
+                return True
+
+        if len(self._queue) >= self._size:
+            if self._policy == 'drop':
+                self.close()
+                return False
+
+            old_key = self._queue.popleft()[0]
+            self._keyed.pop(old_key, None)
+
+        entry = [key, frame, monotonic()]
+        self._queue.append(entry)
+        if key is not None:
+            self._keyed[key] = entry
+
+        self._ready.set()
+
+        return True
+
+    def finish(self):
+        """Отключает клиента после отправки уже поставленных в очередь кадров"""
+
+        self._finishing = True
+        self._ready.set()
+
+    def close(self):
+        """Отключает клиента и останавливает писателя"""
+
+        if self._closed:
+            return
+
+        self._closed = True
+        self._queue.clear()
+        self._keyed.clear()
+        self._task.cancel()
+        asyncio.ensure_future(self._ws.close())
+
+    async def _writer(self):
+        queue = self._queue
+        while True:
+            await self._ready.wait()
+            while queue:
+                key, frame, queued_at = queue.popleft()
+                if key is not None:
+                    self._keyed.pop(key, None)
+
+                try:
+                    await self._ws.send(frame)
+                except Exception:
+                    self.close()
+                    return
+
+                if self._delay is not None:
+                    self._delay.observe(monotonic() - queued_at)
+
+            if self._finishing:
+                self.close()
+                return
+
+            self._ready.clear()
+
+
+class Broadcaster:
+    """Раздает один заранее закодированный кадр очередям всех получателей"""
+
+    def __init__(self, sockets, queue_size=256, policy='coalesce', codecs=None, delay=None):
+        self._sockets = sockets
+        self._queue_size = queue_size
+        self._policy = policy
+        self._codecs = {} if codecs is None else codecs
+        self._delay = delay
+        self._outboxes = {}
+
+    def outbox(self, ws):
+        box = self._outboxes.get(ws)
+        if box is None:
+            box = self._outboxes[ws] = Outbox(ws, self._queue_size, self._policy, self._delay)
+
+        return box
+
+    def discard(self, ws):
+        box = self._outboxes.pop(ws, None)
+        if box is not None:
+            box.close()
+
+    def publish(self, frame, only=None, exclude=(), key=None):
+        """Рассылает кадр сокетам указанных uid, не дожидаясь отправки.
+
+        Вместо готового кадра можно передать функцию, которая строит кадр
+        кодеком соединения: она вызывается один раз на каждый кодек
+        """
+
+        sockets = self._sockets
+        uids = sockets.keys() if only is None else only
+
+        return self.deliver(frame, (
+            sock
+            for uid_item in uids if uid_item not in exclude
+            for sock in sockets.get(uid_item, ())
+        ), key)
+
+    def deliver(self, frame, targets, key=None):
+        """Рассылает кадр перечисленным сокетам, как и publish"""
+
+        codecs = self._codecs
+        build = frame if callable(frame) else None
+        frames = {}
+
+        sent = 0
+        for sock in targets:
+            if build is not None:
+                codec = codecs.get(sock, JSON)
+                frame = frames.get(codec.name)
+                if frame is None:
+                    frame = frames[codec.name] = build(codec)
+
+            sent += self.outbox(sock).put(frame, key)
+
+        return sent
+
+    def depth(self):
+        """Суммарное число неотправленных кадров во всех очередях"""
+        return sum(len(x) for x in self._outboxes.values())
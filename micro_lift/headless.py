@@ -0,0 +1,200 @@
+"""Симуляция трафика здания без сервера, быстрее реального времени.
+
+Вместо опроса лифтов каждые LOOP_DELAY секунд используется очередь
+дискретных событий: появление актора и прибытие лифта на этаж. Время
+между событиями не моделируется шагами, а сразу пропускается, поэтому
+сутки трафика считаются за секунды
+"""
+
+import argparse
+from heapq import heappop, heappush
+from itertools import count
+import random
+import sys
+
+import ujson
+
+from conf import load_config
+from dispatch import Stats, create_dispatcher
+from engine import create_engine
+from models import Actor, WaitingRoom
+
+
+ARRIVAL, LIFT_READY = 0, 1
+
+
+def load_traffic(path):
+    """Читает трафик из файла, по одному JSON-объекту на строку:
+    {"time": 12.5, "uid": "a1", "weight": 70, "floor": 1, "need_floor": 5}
+    """
+    with open(path, 'rt') as ftraffic:
+        return [ujson.loads(x) for x in ftraffic if x.strip()]
+
+
+def random_traffic(count, rate, floors, seed=None):
+    """Пуассоновский поток из count акторов с интенсивностью rate в секунду"""
+
+    rnd, time, traffic = random.Random(seed), 0.0, []
+    for inx in range(count):
+        time += rnd.expovariate(rate)
+        floor, need_floor = rnd.sample(range(1, floors + 1), 2)
+        traffic.append({
+            'time': time,
+            'uid': f'actor{inx}',
+            'weight': rnd.uniform(50.0, 120.0),
+            'floor': floor,
+            'need_floor': need_floor,
+        })
+
+    return traffic
+
+
+class Simulation:
+    """Дискретно-событийная симуляция лифтов здания.
+
+    Лифт принимает решение только стоя на этаже: высаживает и забирает
+    пассажиров, выбирает следующую остановку через диспетчер и едет до нее
+    без промежуточных шагов. Положение едущих лифтов интерполируется, когда
+    диспетчеру нужно распределить вызовы
+    """
+
+    def __init__(self, config, dwell=0.0):
+        self.waiting = WaitingRoom()
+        self.lifts = create_engine(config).lifts
+        self.dispatcher = create_dispatcher(config)
+        self.floor_height = config['FLOOR']['HEIGHT']
+        self.velocity = config['LIFT']['SPEED'] / config['LOOP_DELAY']
+        self.dwell = dwell
+        self.now = 0.0
+
+        self.wait_stats = Stats(window=None)
+        self.trip_stats = Stats(window=None)
+        self.served = 0
+        self.last_drop = 0.0
+
+        self._queue = []
+        self._seq = count()
+        self._idle = set(self.lifts)
+        self._moving = {}
+        self._times = {}
+
+    def run(self, traffic):
+        for item in traffic:
+            self._push(item['time'], ARRIVAL, item)
+
+        while self._queue:
+            self.now, _, kind, payload = heappop(self._queue)
+            if kind == ARRIVAL:
+                self._arrive(payload)
+            else:
+                self._lift_ready(payload)
+
+        return self.report()
+
+    def report(self):
+        duration = self.last_drop
+        return {
+            'strategy': self.dispatcher.name,
+            'duration': duration,
+            'served': self.served,
+            'throughput_per_hour': self.served / duration * 3600 if duration else 0.0,
+            'wait': self.wait_stats.summary(),
+            'trip': self.trip_stats.summary(),
+        }
+
+    def _push(self, time, kind, payload):
+        heappush(self._queue, (time, next(self._seq), kind, payload))
+
+    def _floor_position(self, floor):
+        return (floor - 1) * self.floor_height + 0.01
+
+    def _arrive(self, item):
+        # Актору на своем этаже лифт не нужен, он бы так и не сел в лифт
+        if item['floor'] == item['need_floor']:
+            return
+
+        actor = Actor(item['uid'], item['weight'], room=self.waiting)
+        actor.floor = item['floor']
+        actor.wait_lift(item['need_floor'])
+        self._times[actor] = self.now
+
+        # Новый вызов будит стоящие без дела лифты
+        for lift_id in self._idle:
+            self._push(self.now, LIFT_READY, lift_id)
+        self._idle.clear()
+
+    def _sync_positions(self):
+        for lift_id, (started, src, dst, finished) in self._moving.items():
+            part = (self.now - started) / (finished - started) if finished > started else 1.0
+            self.lifts[lift_id].position = src + (dst - src) * min(max(part, 0.0), 1.0)
+
+    def _lift_ready(self, lift_id):
+        lift = self.lifts[lift_id]
+        moving = self._moving.pop(lift_id, None)
+        if moving is not None:
+            lift.position = moving[2]
+
+        floor = lift.floor
+        for p in lift.passengers:
+            p.floor = floor
+
+        dropped = lift.drop_off()
+        for x in dropped:
+            self.trip_stats.add(self.now - self._times.pop(x))
+            self.served += 1
+            self.last_drop = self.now
+
+        taken = lift.take_actors(self.waiting)
+        for x in taken:
+            self.wait_stats.add(self.now - self._times[x])
+            self._times[x] = self.now
+
+        self._sync_positions()
+        self.dispatcher.assign(self.lifts, self.waiting)
+
+        # Вызов мог достаться другому стоящему лифту
+        for other in [x for x in self._idle if self.dispatcher.calls(x)]:
+            self._idle.discard(other)
+            self._push(self.now, LIFT_READY, other)
+
+        target = self.dispatcher.next_floor(lift, self.waiting)
+        if target is None:
+            lift.stop()
+            self._idle.add(lift_id)
+            return
+
+        dwell = self.dwell if dropped or taken else 0.0
+        src, dst = lift.position, self._floor_position(target)
+        started = self.now + dwell
+        finished = started + abs(dst - src) / self.velocity
+        self._moving[lift_id] = (started, src, dst, finished)
+        self._push(finished, LIFT_READY, lift_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Headless lift simulation')
+    parser.add_argument('--config', type=str, help='Path to configuration yaml file')
+    parser.add_argument('--traffic', type=str, help='Path to traffic file (JSON lines)')
+    parser.add_argument('--random', type=int, default=1000,
+                        help='Number of random actors if no traffic file is given')
+    parser.add_argument('--rate', type=float, default=0.1,
+                        help='Random actor arrival rate per second')
+    parser.add_argument('--seed', type=int, default=None, help='Random traffic seed')
+    parser.add_argument('--dwell', type=float, default=2.0,
+                        help='Seconds a lift spends at a floor to board or drop off')
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+    if args.traffic:
+        traffic = load_traffic(args.traffic)
+    else:
+        traffic = random_traffic(args.random, args.rate, config['FLOOR']['COUNT'], args.seed)
+
+    report = Simulation(config, args.dwell).run(traffic)
+    print(ujson.dumps(report, indent=2))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,548 @@
+"""Индексы объектов для постраничной выборки с фильтрами"""
+
+from array import array
+from bisect import bisect_left, bisect_right
+from heapq import nsmallest
+
+
+# Наибольшая длина куска отсортированного списка номеров
+CHUNK = 1024
+
+# Номера объектов лежат в массивах int32. Когда они исчерпаны, живые
+# объекты нумеруются заново
+SEQ_LIMIT = 2 ** 31 - 1
+
+
+class SeqList:
+    """Отсортированный список номеров объектов.
+
+    Номера лежат в массивах-кусках длиной не больше CHUNK, поэтому вставка
+    и удаление сдвигают один кусок, а не весь список
+    """
+
+    itemsize = array('i').itemsize
+
+    def __init__(self, seqs=()):
+        seqs = array('i', seqs)
+        self._chunks = [seqs[x:x + CHUNK] for x in range(0, len(seqs), CHUNK)]
+        self._maxes = [x[-1] for x in self._chunks]
+        self._len = len(seqs)
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        for chunk in self._chunks:
+            yield from chunk
+
+    def add(self, seq):
+        chunks, maxes = self._chunks, self._maxes
+        self._len += 1
+        if not chunks:
+            chunks.append(array('i', [seq]))
+            maxes.append(seq)
+            return
+
+        inx = bisect_left(maxes, seq)
+        if inx == len(maxes):
+            inx -= 1
+            chunks[inx].append(seq)
+            maxes[inx] = seq
+        else:
+            chunk = chunks[inx]
+            chunk.insert(bisect_left(chunk, seq), seq)
+
+        chunk = chunks[inx]
+        if len(chunk) > CHUNK:
+            half = len(chunk) // 2
+            chunks[inx:inx + 1] = [chunk[:half], chunk[half:]]
+            maxes[inx:inx + 1] = [chunk[half - 1], chunk[-1]]
+
+    def remove(self, seq):
+        chunks, maxes = self._chunks, self._maxes
+        inx = bisect_left(maxes, seq)
+        chunk = chunks[inx]
+        del chunk[bisect_left(chunk, seq)]
+        self._len -= 1
+        if chunk:
+            maxes[inx] = chunk[-1]
+        else:
+            del chunks[inx], maxes[inx]
+
+    def ceil(self, seq):
+        """Наименьший номер не меньше seq или None"""
+
+        inx = bisect_left(self._maxes, seq)
+        if inx == len(self._maxes):
+            return None
+
+        chunk = self._chunks[inx]
+        return chunk[bisect_left(chunk, seq)]
+
+    def renumber(self, rank):
+        """Заменяет номера по таблице rank, сохраняющей их порядок"""
+
+        self._chunks = [array('i', [rank[x] for x in chunk]) for chunk in self._chunks]
+        self._maxes = [x[-1] for x in self._chunks]
+
+
+class SeqRows(SeqList):
+    """Номера всех объектов индекса вместе с их строками.
+
+    Новый объект получает номер больше всех прежних, поэтому добавление -
+    дописывание в последний кусок
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._rows = []
+
+    def add(self, seq, row):
+        chunks, rows, maxes = self._chunks, self._rows, self._maxes
+        if not chunks or len(chunks[-1]) >= CHUNK:
+            chunks.append(array('i'))
+            rows.append(array('i'))
+            maxes.append(seq)
+
+        chunks[-1].append(seq)
+        rows[-1].append(row)
+        maxes[-1] = seq
+        self._len += 1
+
+    def remove(self, seq):
+        chunks, maxes = self._chunks, self._maxes
+        inx = bisect_left(maxes, seq)
+        chunk = chunks[inx]
+        pos = bisect_left(chunk, seq)
+        del chunk[pos], self._rows[inx][pos]
+        self._len -= 1
+        if chunk:
+            maxes[inx] = chunk[-1]
+        else:
+            del chunks[inx], self._rows[inx], maxes[inx]
+
+    def row(self, seq):
+        inx = bisect_left(self._maxes, seq)
+        return self._rows[inx][bisect_left(self._chunks[inx], seq)]
+
+
+class RangeList:
+    """Пары (значение, номер объекта) по возрастанию значений.
+
+    Выбирает номера объектов, чье значение попадает в диапазон, двоичным
+    поиском. Хранится кусками, как SeqList
+    """
+
+    def __init__(self):
+        self._values = []
+        self._seqs = []
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    def add(self, value, seq):
+        values, seqs = self._values, self._seqs
+        self._len += 1
+        if not values:
+            values.append(array('d', [value]))
+            seqs.append(array('i', [seq]))
+            return
+
+        inx = self._chunk(value, seq)
+        if inx == len(values):
+            inx -= 1
+        chunk, chunk_seqs = values[inx], seqs[inx]
+        pos = self._position(chunk, chunk_seqs, value, seq)
+        chunk.insert(pos, value)
+        chunk_seqs.insert(pos, seq)
+
+        if len(chunk) > CHUNK:
+            half = len(chunk) // 2
+            values[inx:inx + 1] = [chunk[:half], chunk[half:]]
+            seqs[inx:inx + 1] = [chunk_seqs[:half], chunk_seqs[half:]]
+
+    def remove(self, value, seq):
+        values, seqs = self._values, self._seqs
+        inx = self._chunk(value, seq)
+        chunk, chunk_seqs = values[inx], seqs[inx]
+        pos = self._position(chunk, chunk_seqs, value, seq)
+        del chunk[pos], chunk_seqs[pos]
+        self._len -= 1
+        if not chunk:
+            del values[inx], seqs[inx]
+
+    def count(self, low=None, high=None):
+        """Число объектов со значением от low до high включительно"""
+
+        return sum(stop - start for _, start, stop in self._spans(low, high))
+
+    def between(self, low=None, high=None):
+        """Номера объектов со значением от low до high включительно"""
+
+        for inx, start, stop in self._spans(low, high):
+            yield from self._seqs[inx][start:stop]
+
+    def renumber(self, rank):
+        """Заменяет номера по таблице rank, сохраняющей их порядок"""
+
+        self._seqs = [array('i', [rank[x] for x in chunk]) for chunk in self._seqs]
+
+    def _spans(self, low, high):
+        for inx, chunk in enumerate(self._values):
+            if low is not None and chunk[-1] < low:
+                continue
+            if high is not None and chunk[0] > high:
+                break
+
+            start = 0 if low is None else bisect_left(chunk, low)
+            stop = len(chunk) if high is None else bisect_right(chunk, high)
+            yield inx, start, stop
+
+    def _chunk(self, value, seq):
+        """Первый кусок, последняя пара которого не меньше (value, seq)"""
+
+        values, seqs = self._values, self._seqs
+        lo, hi = 0, len(values)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if (values[mid][-1], seqs[mid][-1]) < (value, seq):
+                lo = mid + 1
+            else:
+                hi = mid
+
+        return lo
+
+    @staticmethod
+    def _position(chunk, chunk_seqs, value, seq):
+        # Среди равных значений пары упорядочены по номеру
+        lo, hi = bisect_left(chunk, value), bisect_right(chunk, value)
+        return bisect_left(chunk_seqs, seq, lo, hi)
+
+
+class Rows:
+    """Номера строк индекса для объектов, у которых нет своего хранилища.
+
+    Строки освободившихся объектов достаются новым
+    """
+
+    def __init__(self, key):
+        self._key = key
+        self._rows = {}
+        self._objects = []
+        self._free = []
+
+    def find(self, key):
+        return self._rows.get(key)
+
+    def slot(self, obj):
+        key = self._key(obj)
+        row = self._rows.get(key)
+        if row is None:
+            if self._free:
+                row = self._free.pop()
+                self._objects[row] = obj
+            else:
+                row = len(self._objects)
+                self._objects.append(obj)
+            self._rows[key] = row
+
+        return row
+
+    def release(self, key):
+        row = self._rows.pop(key)
+        self._objects[row] = None
+        self._free.append(row)
+
+    def at(self, row):
+        return self._objects[row]
+
+
+class StoreRows:
+    """Номера строк индекса - ячейки хранилища акторов store.ActorStore"""
+
+    def __init__(self, store):
+        self._store = store
+
+    def find(self, key):
+        return self._store.slot(key)
+
+    def slot(self, obj):
+        return self._store.slot(obj.uid)
+
+    def release(self, key):
+        pass
+
+    def at(self, row):
+        return self._store.at(row)
+
+
+class ObjectIndex:
+    """Индекс объектов по набору полей.
+
+    Объект занимает строку индекса: ячейку хранилища или номер, выданный
+    Rows, и получает порядковый номер, больший номеров всех прежних
+    объектов. Строки освободившихся объектов достаются новым, а номера -
+    нет, поэтому курсор страницы - номер, и новый объект всегда попадает
+    в конец выборки. Для каждого значения каждого поля хранится
+    отсортированный список номеров, а для числовых полей из ranges -
+    номера по возрастанию значения. Значения полей лежат в массивах по
+    строкам, так что на объект приходятся только числа в массивах.
+    Страница выбирается с места курсора пересечением самых коротких из
+    подходящих списков, а не перебором всех объектов. Индекс следит за
+    изменениями объектов через Snapshot.watch и перекладывает объект
+    только в списках изменившихся полей
+    """
+
+    def __init__(self, key, fields, ranges=None, rows=None):
+        self._key = key
+        self._fields = fields
+        self._range_fields = ranges or {}
+        self._rows = rows if rows is not None else Rows(key)
+        self._all = SeqRows()
+        self._next = 0
+        self._live = bytearray()
+        self._seqs = array('i')
+        self._by = {name: {} for name in fields}
+        # Значения полей кодируются номерами, общими для всех строк
+        self._codes = {name: {} for name in fields}
+        self._decode = {name: [] for name in fields}
+        self._columns = {name: array('i') for name in fields}
+        self._ranges = {name: RangeList() for name in self._range_fields}
+        self._range_columns = {name: array('d') for name in self._range_fields}
+
+    def __len__(self):
+        return len(self._all)
+
+    def add(self, obj):
+        row = self._rows.slot(obj)
+        if row < len(self._live) and self._live[row]:
+            return
+
+        if self._next >= SEQ_LIMIT:
+            self._renumber()
+        self._grow(row + 1)
+        seq = self._seqs[row] = self._next
+        self._next += 1
+
+        self._live[row] = 1
+        self._all.add(seq, row)
+        for name, getter in self._fields.items():
+            self._put(name, getter(obj), row, seq)
+        for name, getter in self._range_fields.items():
+            value = self._range_columns[name][row] = getter(obj)
+            self._ranges[name].add(value, seq)
+
+        obj.watch(self._update)
+
+    def remove(self, key):
+        """Убирает объект из индекса. Актора хранилища нужно убрать
+        до удаления из хранилища, пока его ячейка известна
+        """
+        row = self._rows.find(key)
+        if row is None or row >= len(self._live) or not self._live[row]:
+            return
+
+        obj = self._rows.at(row)
+        obj.unwatch(self._update)
+        self._rows.release(key)
+
+        seq = self._seqs[row]
+        self._live[row] = 0
+        self._all.remove(seq)
+        for name in self._fields:
+            self._drop(name, self._value(name, row), seq)
+        for name, column in self._range_columns.items():
+            self._ranges[name].remove(column[row], seq)
+
+    def page(self, limit, filters=None, after=None, ranges=None):
+        """До limit объектов после курсора after, подходящих под фильтры
+        и диапазоны ranges: поле -> (нижняя, верхняя граница), граница None
+        не ограничивает.
+
+        Возвращает объекты и курсор следующей страницы (None, если это
+        последняя страница)
+        """
+        lists = []
+        for name, value in (filters or {}).items():
+            seqs = self._by[name].get(value)
+            if seqs is None:
+                return [], None
+            lists.append(seqs)
+
+        # Диапазон, в который попало меньше объектов, чем в любой список,
+        # сам перечисляет кандидатов, остальные проверяются у найденных.
+        # Номера диапазона идут не по порядку, поэтому от них остаются
+        # только limit + 1 наименьших
+        ranges = ranges or {}
+        counts = {name: self._ranges[name].count(low, high) for name, (low, high) in ranges.items()}
+        driver = min(counts, key=counts.get, default=None)
+        if driver is not None and counts[driver] >= min(map(len, lists), default=len(self._all)):
+            driver = None
+        checks = [(self._range_columns[name], low, high)
+                  for name, (low, high) in ranges.items() if name != driver]
+
+        start = 0 if after is None else after + 1
+        if driver is not None:
+            found = (x for x in self._ranges[driver].between(*ranges[driver])
+                     if x >= start and all(seqs.ceil(x) == x for seqs in lists)
+                     and self._checked(x, checks))
+            result = nsmallest(limit + 1, found)
+        else:
+            lists = sorted(lists, key=len) or [self._all]
+            result, seq = [], start
+            while len(result) <= limit:
+                seq = self._intersect(lists, seq)
+                if seq is None:
+                    break
+
+                if self._checked(seq, checks):
+                    result.append(seq)
+                seq += 1
+
+        at, row = self._rows.at, self._all.row
+        if len(result) > limit:
+            return [at(row(x)) for x in result[:limit]], result[limit - 1]
+
+        return [at(row(x)) for x in result], None
+
+    def nbytes(self):
+        """Объем массивов индекса в байтах"""
+
+        lists = [self._all]
+        for buckets in self._by.values():
+            lists.extend(buckets.values())
+
+        # Строки всех объектов лежат рядом с их номерами
+        total = (sum(len(x) for x in lists) + len(self._all)) * self._all.itemsize
+        total += sum(len(x) * (8 + self._all.itemsize) for x in self._ranges.values())
+        columns = [self._seqs] + list(self._columns.values()) + list(self._range_columns.values())
+        return total + len(self._live) + sum(len(x) * x.itemsize for x in columns)
+
+    @staticmethod
+    def _intersect(lists, seq):
+        """Наименьший номер не меньше seq, который есть во всех списках.
+
+        Списки по очереди подтягиваются к наибольшему из найденных номеров
+        """
+        matched = 0
+        while matched < len(lists):
+            for seqs in lists:
+                found = seqs.ceil(seq)
+                if found is None:
+                    return None
+                if found == seq:
+                    matched += 1
+                else:
+                    seq, matched = found, 1
+                if matched == len(lists):
+                    break
+
+        return seq
+
+    def _checked(self, seq, checks):
+        """Значения объекта с номером seq попадают во все диапазоны checks"""
+
+        if not checks:
+            return True
+
+        row = self._all.row(seq)
+        return all((low is None or column[row] >= low) and (high is None or column[row] <= high)
+                   for column, low, high in checks)
+
+    def _renumber(self):
+        """Номера живых объектов подряд с нуля в прежнем порядке.
+
+        Порядок номеров сохраняется, поэтому списки остаются
+        отсортированными и перенумеровываются на месте. Курсоры, выданные
+        до перенумерации, после нее недействительны
+        """
+        rank = {seq: inx for inx, seq in enumerate(self._all)}
+        lists = [self._all]
+        for buckets in self._by.values():
+            lists.extend(buckets.values())
+        for seqs in lists:
+            seqs.renumber(rank)
+        for found in self._ranges.values():
+            found.renumber(rank)
+
+        seqs, live = self._seqs, self._live
+        for row in range(len(live)):
+            if live[row]:
+                seqs[row] = rank[seqs[row]]
+        self._next = len(rank)
+
+    def _update(self, obj):
+        row = self._rows.find(self._key(obj))
+        if row is None or row >= len(self._live) or not self._live[row]:
+            return
+
+        seq = self._seqs[row]
+        for name, getter in self._fields.items():
+            old, value = self._value(name, row), getter(obj)
+            if old != value:
+                self._drop(name, old, seq)
+                self._put(name, value, row, seq)
+
+        for name, getter in self._range_fields.items():
+            column, value = self._range_columns[name], getter(obj)
+            if column[row] != value:
+                self._ranges[name].remove(column[row], seq)
+                self._ranges[name].add(value, seq)
+                column[row] = value
+
+    def _grow(self, size):
+        grow = size - len(self._live)
+        if grow <= 0:
+            return
+
+        # Запас, чтобы не расширять массивы на каждом новом объекте
+        grow = max(grow, len(self._live) // 8)
+        self._live.extend(bytes(grow))
+        self._seqs.extend(array('i', bytes(grow * self._seqs.itemsize)))
+        for column in self._columns.values():
+            column.extend(array('i', bytes(grow * column.itemsize)))
+        for column in self._range_columns.values():
+            column.extend(array('d', bytes(grow * column.itemsize)))
+
+    def _value(self, name, row):
+        return self._decode[name][self._columns[name][row]]
+
+    def _put(self, name, value, row, seq):
+        codes = self._codes[name]
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(self._decode[name])
+            self._decode[name].append(value)
+        self._columns[name][row] = code
+
+        seqs = self._by[name].get(value)
+        if seqs is None:
+            seqs = self._by[name][value] = SeqList()
+        seqs.add(seq)
+
+    def _drop(self, name, value, seq):
+        seqs = self._by[name][value]
+        seqs.remove(seq)
+        if not seqs:
+            del self._by[name][value]
+
+
+def actor_index(store=None):
+    """Индекс акторов. Для акторов хранилища строками служат его ячейки"""
+
+    return ObjectIndex(lambda x: x.uid, {
+        'status': lambda x: x.status.name,
+        'floor': lambda x: x.floor,
+        'need_floor': lambda x: x.need_floor,
+        'lift': lambda x: x.lift_id,
+    }, {
+        'weight': lambda x: x.weight,
+    }, StoreRows(store) if store is not None else None)
+
+
+def lift_index():
+    return ObjectIndex(lambda x: x.id, {
+        'status': lambda x: x.status.name,
+        'floor': lambda x: x.floor,
+    })
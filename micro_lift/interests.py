@@ -0,0 +1,147 @@
+"""Адресная доставка уведомлений только заинтересованным сокетам.
+
+Тема уведомления - этаж ("floor:3") или лифт ("lift:lift_0"). Интерес
+к этажу есть у ожидающих на нем лифт, к лифту - у его пассажиров, а к
+любой теме - у сокетов, явно наблюдающих за ней сигналом watch. Поэтому
+цена рассылки зависит от числа заинтересованных, а не от числа всех
+соединений.
+
+Прибытия акторов за один шаг симуляции собираются в одну сводку
+actor_arrive на этаж, так что массовое подключение не порождает по
+уведомлению на каждую пару акторов
+"""
+
+import asyncio
+from time import perf_counter, perf_counter_ns
+
+
+FLOOR, LIFT = 'floor', 'lift'
+
+
+def floor_topic(floor):
+    return f'{FLOOR}:{floor}'
+
+
+def lift_topic(lift_id):
+    return f'{LIFT}:{lift_id}'
+
+
+class InterestRouter:
+    def __init__(self, ctx, period, max_watches=64):
+        self._ctx = ctx
+        self._period = period
+        self._max_watches = max_watches
+        # Тема -> сокеты, наблюдающие за ней явно, и обратный индекс
+        self._watchers = {}
+        self._topics = {}
+        # Тема -> uid прибывших за текущий шаг акторов, в порядке прибытия
+        self._arrivals = {}
+        self._pending = None
+
+    def watch(self, ws, topic):
+        """Добавляет явный интерес сокета. False, если сокет уже наблюдает
+        за max_watches темами
+        """
+        topics = self._topics.get(ws, ())
+        if topic not in topics and len(topics) >= self._max_watches:
+            return False
+
+        self._watchers.setdefault(topic, set()).add(ws)
+        self._topics.setdefault(ws, set()).add(topic)
+
+        return True
+
+    def unwatch(self, ws, topic):
+        watchers = self._watchers.get(topic)
+        if watchers is None or ws not in watchers:
+            return False
+
+        watchers.discard(ws)
+        if not watchers:
+            del self._watchers[topic]
+
+        topics = self._topics[ws]
+        topics.discard(topic)
+        if not topics:
+            del self._topics[ws]
+
+        return True
+
+    def discard(self, ws):
+        """Убирает все явные интересы сокета"""
+
+        for topic in list(self._topics.get(ws, ())):
+            self.unwatch(ws, topic)
+
+    def members(self, topic):
+        """uid акторов, заинтересованных в теме по своему положению"""
+
+        ctx = self._ctx
+        kind, _, key = topic.partition(':')
+        if kind == FLOOR:
+            return [x.uid for x in ctx.waiting.on_floor(int(key))]
+        if kind == LIFT:
+            lift = ctx.lifts.get(key)
+            return [] if lift is None else [x.uid for x in lift.passengers]
+
+        return []
+
+    def publish(self, topic, frame, uids=None, exclude=()):
+        """Рассылает кадр заинтересованным в теме: сокетам акторов uids
+        (по умолчанию участникам темы) и явным наблюдателям. Каждый сокет
+        получает кадр один раз
+        """
+        ctx = self._ctx
+        sockets = ctx.sockets
+        if uids is None:
+            uids = self.members(topic)
+
+        targets = set(self._watchers.get(topic, ()))
+        for uid in uids:
+            if uid not in exclude:
+                targets.update(sockets.get(uid, ()))
+
+        if ctx.spans is not None:
+            span_started = perf_counter_ns()
+        started = perf_counter()
+        sent = ctx.broadcaster.deliver(frame, targets)
+        ctx.metrics.fanout_duration.observe(perf_counter() - started)
+        ctx.metrics.fanout_size.observe(sent)
+        if ctx.spans is not None:
+            ctx.spans.add('broadcast', 'fanout', span_started, args={'topic': topic, 'sockets': sent})
+
+        return sent
+
+    def arrive(self, actor):
+        """Откладывает уведомление о прибытии актора до конца шага"""
+
+        self._arrivals.setdefault(floor_topic(actor.floor), {})[actor.uid] = None
+        if self._pending is not None:
+            self._pending.set()
+
+    def flush(self):
+        """Рассылает сводки прибытий, накопленные за шаг"""
+
+        arrivals, self._arrivals = self._arrivals, {}
+        actors = self._ctx.actors
+        for topic, uids in arrivals.items():
+            # Актор мог быть удален раньше, чем ушла сводка
+            arrived = [actors[x] for x in uids if x in actors]
+            if arrived:
+                self.publish(
+                    topic,
+                    lambda codec: codec.raw_notify('actor_arrive', codec.actors(arrived)),
+                    exclude=uids
+                )
+
+    async def run(self):
+        self._pending = asyncio.Event()
+        if self._arrivals:
+            self._pending.set()
+
+        while True:
+            await self._pending.wait()
+            # Прибытия в пределах шага попадают в одну сводку
+            await asyncio.sleep(self._period)
+            self._pending.clear()
+            self.flush()
@@ -0,0 +1,157 @@
+"""Жизненный цикл соединений и акторов.
+
+Сокет привязывается к актору при аутентификации и отвязывается при
+отключении, вместе с его очередью рассылки и подписками. Актор без
+единого сокета считается брошенным: через ACTOR_TTL секунд он удаляется
+из здания, если не едет в лифте. Пассажир остается до высадки
+"""
+
+import asyncio
+from time import monotonic
+
+from models import ActorStatus
+
+
+class Lifecycle:
+    def __init__(self, ctx, actor_ttl=600.0, max_actors=None, sweep_interval=10.0):
+        self._ctx = ctx
+        self._actor_ttl = actor_ttl
+        self._max_actors = max_actors
+        self._sweep_interval = sweep_interval
+        # Брошенные акторы в порядке отключения: uid -> время отключения
+        self._orphans = {}
+
+        self.connected = 0
+        self.disconnected = 0
+        self.evicted = 0
+        self.rejected = 0
+
+    def admit(self):
+        """Можно ли добавить нового актора, не превысив лимит.
+
+        При достижении лимита место освобождается за счет давно
+        отключившихся акторов, не дожидаясь истечения их срока
+        """
+        ctx, limit = self._ctx, self._max_actors
+        if limit is None or len(ctx.actors) < limit:
+            return True
+
+        for uid in list(self._orphans):
+            if self._evict(uid) and len(ctx.actors) < limit:
+                return True
+
+        self.rejected += 1
+        return False
+
+    def attach(self, ws, actor):
+        """Привязывает сокет к актору"""
+
+        ctx, uid = self._ctx, actor.uid
+        if ws in ctx.by_ws:
+            self._detach(ws)
+
+        ctx.by_ws[ws] = actor
+        self._orphans.pop(uid, None)
+
+        if uid in ctx.sockets and ctx.sockets[uid]:
+            ctx.sockets[uid].add(ws)
+        else:
+            ctx.sockets[uid] = {ws}
+
+    def adopt(self, uids):
+        """Считает брошенными акторов без сокетов, например восстановленных с диска"""
+
+        now, sockets = monotonic(), self._ctx.sockets
+        for uid in uids:
+            if uid not in sockets:
+                self._orphans[uid] = now
+
+    def connect(self, ws, codec):
+        self._ctx.codecs[ws] = codec
+        self.connected += 1
+
+    def disconnect(self, ws):
+        """Освобождает все, что связано с закрытым сокетом"""
+
+        ctx = self._ctx
+        ctx.codecs.pop(ws, None)
+        ctx.broadcaster.discard(ws)
+        ctx.subscriptions.discard(ws)
+        ctx.interests.discard(ws)
+        self._detach(ws)
+        self.disconnected += 1
+
+    def sweep(self, now=None):
+        """Удаляет акторов, отключившихся больше ACTOR_TTL секунд назад"""
+
+        deadline = (monotonic() if now is None else now) - self._actor_ttl
+        for uid, at in list(self._orphans.items()):
+            if at > deadline:
+                break
+
+            self._evict(uid)
+
+    def stats(self):
+        ctx = self._ctx
+        return {
+            'actors': len(ctx.actors),
+            'online_actors': len(ctx.sockets),
+            'orphan_actors': len(self._orphans),
+            'sockets': len(ctx.by_ws),
+            'connections': self.connected,
+            'disconnections': self.disconnected,
+            'evicted': self.evicted,
+            'rejected': self.rejected,
+        }
+
+    def by_status(self):
+        """Число подключенных акторов в каждом статусе"""
+
+        ctx = self._ctx
+        counts = dict.fromkeys((x.name for x in ActorStatus), 0)
+        for uid in ctx.sockets:
+            actor = ctx.actors.get(uid)
+            if actor is not None:
+                counts[actor.status.name] += 1
+
+        return counts
+
+    async def run(self):
+        trace = self._ctx.trace
+        while True:
+            await asyncio.sleep(self._sweep_interval)
+            if trace is not None:
+                trace.sweep()
+            self.sweep()
+
+    def _detach(self, ws):
+        ctx = self._ctx
+        actor = ctx.by_ws.pop(ws, None)
+        if actor is None:
+            return
+
+        sockets = ctx.sockets.get(actor.uid)
+        if sockets is not None:
+            sockets.discard(ws)
+            if not sockets:
+                del ctx.sockets[actor.uid]
+                self._orphans[actor.uid] = monotonic()
+
+    def _evict(self, uid):
+        ctx = self._ctx
+        actor = ctx.actors.get(uid)
+        if actor is None:
+            self._orphans.pop(uid, None)
+            return False
+
+        # Пассажир удаляется только после высадки
+        if actor.status == ActorStatus.IN_LIFT:
+            return False
+
+        del self._orphans[uid]
+        actor.idle()
+        ctx.actor_index.remove(uid)
+        del ctx.actors[uid]
+        self.evicted += 1
+
+        return True
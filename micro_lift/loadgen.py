@@ -0,0 +1,370 @@
+"""Нагрузочный прогон сервера тысячами акторов.
+
+Поднимает сервер отдельным процессом (или использует уже запущенный,
+адрес которого передан в --url), подключает акторов по расписанию
+профиля трафика и возит их между этажами. Клиент замеряет время ответа
+на сигналы. Задержка доставки уведомлений, опоздание и длительность шагов
+петли лифтов берутся из /metrics сервера как прирост гистограмм за прогон.
+Отчет пишется в JSON, чтобы сравнивать прогоны разных версий
+"""
+
+import argparse
+import asyncio
+from itertools import count
+import os
+import random
+import subprocess
+import sys
+from time import monotonic, perf_counter, time
+from urllib.parse import urlsplit, urlunsplit
+from urllib.request import urlopen
+
+import ujson
+import websockets
+
+from auth import auth_request
+from conf import load_config
+from dispatch import Stats
+from events import DROP_OFF
+
+
+PROFILES = ('up', 'lunch', 'down')
+
+QUANTILES = (('p50', 0.5), ('p99', 0.99), ('p999', 0.999))
+
+
+class LoadError(Exception):
+    def __init__(self, message='Request failed', *args, **kwargs):
+        super().__init__(message, *args, **kwargs)
+
+
+def traffic_plan(profile, actors, rate, floors, seed=None, prefix='load'):
+    """Расписание акторов: время подключения и этажи поездок по порядку.
+
+    Акторы подключаются пуассоновским потоком с интенсивностью rate в секунду.
+    up - утренний подъем с первого этажа на свой; down - вечерний спуск:
+    актор поднимается на свой этаж и спускается на первый; lunch - обед:
+    с первого этажа на свой, вниз на первый и обратно
+    """
+    if profile not in PROFILES:
+        raise ValueError(f'Unknown profile: {profile}')
+
+    rnd, at, plan = random.Random(seed), 0.0, []
+    for inx in range(actors):
+        at += rnd.expovariate(rate)
+        floor = rnd.randint(2, floors)
+        legs = {
+            'up': [floor],
+            'down': [floor, 1],
+            'lunch': [floor, 1, floor],
+        }[profile]
+        plan.append({
+            'time': at,
+            'uid': f'{prefix}{inx}',
+            'weight': rnd.uniform(50.0, 120.0),
+            'legs': legs,
+        })
+
+    return plan
+
+
+def parse_metrics(text):
+    """Значения текстового формата Prometheus: имя с метками -> число"""
+
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith('#'):
+            name, _, value = line.rpartition(' ')
+            samples[name] = float(value)
+
+    return samples
+
+
+def scrape(url):
+    with urlopen(url, timeout=10) as response:
+        return parse_metrics(response.read().decode('utf-8'))
+
+
+def histogram_quantiles(before, after, name):
+    """Перцентили по приросту корзин гистограммы между двумя съемами.
+
+    Внутри корзины значение интерполируется линейно, как в Prometheus
+    """
+    prefix = name + '_bucket{le="'
+    buckets = sorted(
+        (float(key[len(prefix):-2]), value - before.get(key, 0.0))
+        for key, value in after.items() if key.startswith(prefix)
+    )
+    total = buckets[-1][1] if buckets else 0.0
+    result = {'count': int(total)}
+    for label, q in QUANTILES:
+        result[label] = None
+        if not total:
+            continue
+
+        rank, low, below = q * total, 0.0, 0.0
+        for bound, cumulative in buckets:
+            if cumulative >= rank:
+                if bound == float('inf'):
+                    result[label] = low
+                else:
+                    part = (rank - below) / (cumulative - below) if cumulative > below else 0.0
+                    result[label] = low + (bound - low) * part
+                break
+
+            low, below = bound, cumulative
+
+    return result
+
+
+class Recorder:
+    """Замеры прогона, общие для всех акторов"""
+
+    def __init__(self):
+        self.rtt = {}
+        self.trips = 0
+        self.notifications = 0
+        self.errors = 0
+        self.timeouts = 0
+
+    def request(self, signal, seconds):
+        stats = self.rtt.get(signal)
+        if stats is None:
+            stats = self.rtt[signal] = Stats(window=None)
+
+        stats.add(seconds)
+
+    def report(self):
+        return {
+            'trips': self.trips,
+            'notifications': self.notifications,
+            'errors': self.errors,
+            'timeouts': self.timeouts,
+            'rtt': {signal: x.summary() for signal, x in self.rtt.items()},
+        }
+
+
+class LoadClient:
+    """Соединение одного актора: сопоставляет ответы запросам по id
+    и складывает уведомления в очередь
+    """
+
+    def __init__(self, ws, recorder):
+        self._ws = ws
+        self._recorder = recorder
+        self._ids = count()
+        self._pending = {}
+        self._events = asyncio.Queue()
+        self._reader = asyncio.ensure_future(self._read())
+
+    async def request(self, signal, data):
+        id = str(next(self._ids))
+        future = self._pending[id] = asyncio.get_event_loop().create_future()
+
+        started = perf_counter()
+        await self._ws.send(ujson.dumps({'signal': signal, 'id': id, 'data': data}))
+        response = await future
+        self._recorder.request(signal, perf_counter() - started)
+
+        if response['status'] != 'ok':
+            raise LoadError(f"{signal}: {response['data']['message']}")
+
+        return response['data']
+
+    async def event(self, name):
+        """Данные ближайшего уведомления name"""
+
+        while True:
+            msg = await self._events.get()
+            if msg is None:
+                raise LoadError('Connection closed')
+            if msg['event'] == name:
+                return msg['data']
+
+    async def poll(self, signal, data, interval):
+        """Периодически повторяет запрос, как клиент, опрашивающий лифты"""
+
+        while True:
+            await asyncio.sleep(interval)
+            await self.request(signal, data)
+
+    def close(self):
+        self._reader.cancel()
+
+    async def _read(self):
+        try:
+            async for raw in self._ws:
+                msg = ujson.loads(raw)
+                if msg['type'] == 'response':
+                    future = self._pending.pop(msg['id'], None)
+                    if future is not None and not future.done():
+                        future.set_result(msg)
+                else:
+                    self._recorder.notifications += 1
+                    self._events.put_nowait(msg)
+        except websockets.ConnectionClosed:
+            pass
+
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(LoadError('Connection closed'))
+
+        self._events.put_nowait(None)
+
+
+async def simulate_actor(url, config, item, started, recorder, trip_timeout, poll=0.0):
+    """Подключает актора в назначенное время и совершает его поездки"""
+
+    await asyncio.sleep(max(0.0, started + item['time'] - monotonic()))
+    auth = auth_request(config['SECRET_KEY'], config['DATETIME_FORMAT'], item['uid'], item['weight'])
+    try:
+        async with websockets.connect(url, max_size=None, ping_interval=None) as ws:
+            client = LoadClient(ws, recorder)
+            poller = None
+            try:
+                await client.request('auth', auth)
+                if poll:
+                    poller = asyncio.ensure_future(client.poll('lift_list', {}, poll))
+
+                for floor in item['legs']:
+                    await client.request('actor_expect', {'floor': floor})
+                    await asyncio.wait_for(client.event(DROP_OFF), trip_timeout)
+                    recorder.trips += 1
+            finally:
+                if poller is not None:
+                    poller.cancel()
+                client.close()
+    except asyncio.TimeoutError:
+        recorder.timeouts += 1
+    except (LoadError, OSError, websockets.WebSocketException):
+        recorder.errors += 1
+
+
+def metrics_url(url):
+    """Адрес /metrics сервера по адресу websocket"""
+
+    parts = urlsplit(url)
+    scheme = 'https' if parts.scheme == 'wss' else 'http'
+
+    return urlunsplit((scheme, parts.netloc, '/metrics', '', ''))
+
+
+async def _scrape(url):
+    """Метрики сервера или None, если они недоступны"""
+
+    try:
+        return await asyncio.get_event_loop().run_in_executor(None, scrape, url)
+    except OSError:
+        return None
+
+
+async def run_load(url, config, plan, trip_timeout=300.0, poll=0.0):
+    """Прогоняет план трафика против сервера и возвращает отчет"""
+
+    recorder = Recorder()
+    before = await _scrape(metrics_url(url))
+
+    started = monotonic()
+    await asyncio.gather(*[
+        simulate_actor(url, config, item, started, recorder, trip_timeout, poll)
+        for item in plan
+    ])
+
+    report = recorder.report()
+    report['actors'] = len(plan)
+    report['duration'] = monotonic() - started
+
+    after = await _scrape(metrics_url(url))
+    report['server'] = None
+    if before is not None and after is not None:
+        report['server'] = {
+            'delivery': histogram_quantiles(before, after, 'lift_outbox_delay_seconds'),
+            'tick_drift': histogram_quantiles(before, after, 'lift_tick_drift_seconds'),
+            'tick_duration': histogram_quantiles(before, after, 'lift_tick_duration_seconds'),
+            'tick_overruns': int(after.get('lift_tick_overruns_total', 0.0)
+                                 - before.get('lift_tick_overruns_total', 0.0)),
+        }
+
+    return report
+
+
+def start_server(config_path):
+    """Запускает сервер отдельным процессом, чтобы он не делил петлю с нагрузкой"""
+
+    main = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+    return subprocess.Popen([sys.executable, main, '--config', config_path],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+async def wait_ready(host, port, timeout=30.0):
+    deadline = monotonic() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_connection(host, port)
+            writer.close()
+            return
+        except OSError:
+            if monotonic() > deadline:
+                raise
+
+            await asyncio.sleep(0.1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Lift server load generator')
+    parser.add_argument('--config', type=str, help='Path to configuration yaml file')
+    parser.add_argument('--url', type=str, default=None,
+                        help='Websocket URL of a running server; by default a local one is started')
+    parser.add_argument('--profile', choices=PROFILES, default='up', help='Traffic pattern')
+    parser.add_argument('--actors', type=int, default=1000, help='Number of simulated actors')
+    parser.add_argument('--rate', type=float, default=50.0, help='Actor arrival rate per second')
+    parser.add_argument('--seed', type=int, default=None, help='Traffic seed')
+    parser.add_argument('--poll', type=float, default=0.0,
+                        help='Seconds between lift_list requests of every actor, 0 - no polling')
+    parser.add_argument('--trip-timeout', type=float, default=300.0,
+                        help='Seconds an actor waits for the drop off before giving up')
+    parser.add_argument('--output', type=str, default=None, help='Path to the JSON report')
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+    # Уникальные uid не дают столкнуться с акторами прошлых прогонов
+    plan = traffic_plan(args.profile, args.actors, args.rate, config['FLOOR']['COUNT'],
+                        args.seed, prefix=f'load{int(time())}_')
+
+    server, url = None, args.url
+    if url is None:
+        host = '127.0.0.1' if config['HOST'] in (None, '0.0.0.0') else config['HOST']
+        url = f"ws://{host}:{config['PORT']}/ws"
+        server = start_server(args.config)
+
+    loop = asyncio.get_event_loop()
+    try:
+        if server is not None:
+            parts = urlsplit(url)
+            loop.run_until_complete(wait_ready(parts.hostname, parts.port))
+
+        report = loop.run_until_complete(run_load(url, config, plan, args.trip_timeout, args.poll))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    report.update({
+        'profile': args.profile,
+        'rate': args.rate,
+        'seed': args.seed,
+        'started': int(time()),
+    })
+
+    text = ujson.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'wt') as freport:
+            freport.write(text)
+
+    print(text)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
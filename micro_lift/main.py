@@ -5,33 +5,168 @@ from sanic import Sanic
 
 from conf import load_config
 
-from models import Lift
+from auth import Authenticator, Tickets
+from cluster import OwnerLink, start_owner
+from codec import SUBPROTOCOLS
+from dispatch import create_dispatcher
+from engine import create_engine
+from events import EventBus
+from fanout import Broadcaster
+from index import actor_index, lift_index
+from interests import InterestRouter
+from lifecycle import Lifecycle
+from metrics import SOLVER_BUCKETS, Counter, Histogram, Metrics
+from persistence import Persistence
+from replay import TraceRecorder
+from models import WaitingRoom
+from simulation import Building
+from solver import PlanSolver
+from spans import SpanBuffer
+from store import ActorStore
+from subscriptions import SubscriptionHub
 from views import LiftApp
 
 
+def init_state(ctx, config):
+    """Создает состояние здания в контексте приложения"""
+
+    ctx.auth = Authenticator(config['SECRET_KEY'], config['AUTH_TOKEN_DELAY'])
+    ctx.tickets = Tickets(config['AUTH_TICKET_TTL'])
+    ctx.waiting = WaitingRoom()
+    ctx.actors = ActorStore(room=ctx.waiting)
+    ctx.building = Building(
+        create_engine(config),
+        ctx.waiting,
+        create_dispatcher(config),
+        EventBus()
+    )
+    ctx.lifts = ctx.building.lifts
+
+    persistence = config['PERSISTENCE']
+    ctx.persistence = None
+    if persistence['DIR'] is not None:
+        ctx.persistence = Persistence(
+            persistence['DIR'],
+            persistence['FLUSH_INTERVAL'],
+            persistence['SNAPSHOT_INTERVAL']
+        )
+        ctx.persistence.restore(ctx)
+
+    ctx.actor_index = actor_index(ctx.actors)
+    for actor in ctx.actors.values():
+        ctx.actor_index.add(actor)
+
+    ctx.lift_index = lift_index()
+    for lift in ctx.lifts.values():
+        ctx.lift_index.add(lift)
+
+    trace = config['TRACE']
+    ctx.trace = None
+    if trace['PATH'] is not None:
+        ctx.trace = TraceRecorder(trace['PATH'], trace['FLUSH_INTERVAL'], trace['BUFFER_SIZE'])
+        ctx.trace.state(ctx)
+
+    ctx.spans = None
+    if config['SPANS']['ENABLED']:
+        ctx.spans = ctx.building.spans = SpanBuffer(config['SPANS']['BUFFER_SIZE'])
+
+    ctx.sockets = {}
+    ctx.by_ws = {}
+    ctx.codecs = {}
+    ctx.metrics = Metrics()
+    ctx.broadcaster = Broadcaster(
+        ctx.sockets,
+        config['FANOUT']['QUEUE_SIZE'],
+        config['FANOUT']['POLICY'],
+        ctx.codecs,
+        ctx.metrics.outbox_delay
+    )
+    ctx.subscriptions = SubscriptionHub(ctx, config['LOOP_DELAY'])
+    ctx.interests = InterestRouter(ctx, config['LOOP_DELAY'], config['FANOUT']['MAX_WATCHES'])
+    ctx.lifecycle = Lifecycle(
+        ctx,
+        config['LIFECYCLE']['ACTOR_TTL'],
+        config['LIFECYCLE']['MAX_ACTORS'],
+        config['LIFECYCLE']['SWEEP_INTERVAL']
+    )
+    ctx.lifecycle.adopt(ctx.actors)
+
+    ctx.metrics.gauge('lift_outbox_depth', 'Frames waiting in outbound socket queues',
+                      ctx.broadcaster.depth)
+    ctx.metrics.gauge('lift_sockets', 'Open authenticated sockets', lambda: len(ctx.by_ws))
+    ctx.metrics.gauge('lift_actors', 'Actors in the building', lambda: len(ctx.actors))
+    ctx.metrics.gauge('lift_connected_actors', 'Connected actors by status',
+                      ctx.lifecycle.by_status, label='status')
+
+    dispatch = config['DISPATCH']
+    ctx.solver = None
+    if dispatch['STRATEGY'] == 'optimal':
+        ctx.solver = PlanSolver(
+            ctx.building,
+            config['FLOOR']['HEIGHT'],
+            config['LOOP_DELAY'],
+            dispatch['SOLVER_INTERVAL'],
+            dispatch['SOLVER_WORKERS'],
+            ctx.metrics.register('lift_solver_duration_seconds',
+                                 'Time to compute an assignment plan off the loop',
+                                 Histogram(SOLVER_BUCKETS)),
+            ctx.trace
+        )
+        ctx.metrics.gauge('lift_plan_age_seconds', 'Age of the assignment plan in use',
+                          lambda: ctx.building.dispatcher.plan_age() or 0.0)
+
+    if ctx.persistence is not None:
+        ctx.persistence.attach(ctx, ctx.metrics.register(
+            'lift_persistence_errors_total', 'Failed writes of the state to disk', Counter()))
+
+
+async def save_state(app, loop):
+    app.ctx.persistence.snapshot()
+
+
+async def close_trace(app, loop):
+    app.ctx.trace.close()
+
+
+async def close_solver(app, loop):
+    app.ctx.solver.close()
+
+
 def init_app(config_path):
     app = Sanic("Lift app")
     config = load_config(config_path)
     app.config.update(config)
 
-    app.ctx.actors = {}
-    app.ctx.lifts = {}
-    for inx in range(config['LIFT']['COUNT']):
-        app.ctx.lifts[f'lift_{inx}'] = Lift(
-            f'lift_{inx}',
-            config['LIFT']['SPEED'],
-            config['LIFT']['MAX_WEIGHT'],
-            config['FLOOR']['HEIGHT']
+    if config['WORKERS'] > 1:
+        # Здание симулирует отдельный процесс, обработчики лишь держат сокеты
+        link = OwnerLink(
+            config['CLUSTER']['SOCKET'],
+            config['FANOUT']['QUEUE_SIZE'],
+            config['FANOUT']['POLICY']
         )
+        app.register_listener(link.connect, 'before_server_start')
+        app.add_websocket_route(link.entry_point, '/ws', subprotocols=SUBPROTOCOLS)
+        # Метрики и спаны есть только у владельца, обработчики передают ему запросы
+        app.add_route(link.metrics, '/metrics')
+        app.add_route(link.spans, '/spans')
 
-    app.ctx.sockets = {}
-    app.ctx.by_ws = {}
+        return app
 
+    init_state(app.ctx, config)
     lift_app = LiftApp(app)
 
-    app.add_websocket_route(lift_app.entry_point, '/ws')
+    app.add_websocket_route(lift_app.entry_point, '/ws', subprotocols=SUBPROTOCOLS)
+    app.add_route(lift_app.metrics, '/metrics')
+    app.add_route(lift_app.spans, '/spans')
     app.add_task(lift_app.lift_loop)
 
+    if app.ctx.persistence is not None:
+        app.register_listener(save_state, 'after_server_stop')
+    if app.ctx.trace is not None:
+        app.register_listener(close_trace, 'after_server_stop')
+    if app.ctx.solver is not None:
+        app.register_listener(close_solver, 'after_server_stop')
+
     return app
 
 
@@ -41,6 +176,11 @@ def main():
     args = parser.parse_args()
 
     app = init_app(args.config)
+
+    owner = None
+    if app.config['WORKERS'] > 1:
+        owner = start_owner(args.config, init_state)
+
     app.run(
         host=app.config['HOST'],
         port=app.config['PORT'],
@@ -51,6 +191,11 @@ def main():
         access_log=app.config['ACCESS_LOG']
     )
 
+    if owner is not None:
+        # Владелец сохраняет состояние по SIGTERM, дожидаемся записи
+        owner.terminate()
+        owner.join()
+
     return 0
 
 
@@ -0,0 +1,168 @@
+"""Метрики сервера в текстовом формате Prometheus.
+
+Запись значения - несколько операций над заранее выделенным списком
+счетчиков корзин, без блокировок: все метрики пишутся из петли событий.
+Накопительные суммы корзин считаются только при выдаче /metrics.
+Значения, которые и так есть в состоянии сервера (глубина очередей,
+число подключенных акторов), не дублируются, а снимаются при выдаче
+"""
+
+from bisect import bisect_left
+
+
+# Корзины длительностей в секундах
+DURATION_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+# Корзины длительности расчета плана распределения вызовов в секундах
+SOLVER_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Корзины числа получателей рассылки
+FANOUT_BUCKETS = (0, 1, 5, 10, 50, 100, 500, 1000, 5000, 10000, 50000)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+
+    return '{' + ','.join('%s="%s"' % (k, _escape(v)) for k, v in pairs) + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def samples(self, name, labels):
+        yield name + _labels(labels), self.value
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self._bounds = tuple(buckets)
+        # Последняя корзина - значения больше верхней границы
+        self._counts = [0] * (len(self._bounds) + 1)
+        self.sum = 0.0
+
+    @property
+    def count(self):
+        return sum(self._counts)
+
+    def observe(self, value):
+        self._counts[bisect_left(self._bounds, value)] += 1
+        self.sum += value
+
+    def samples(self, name, labels):
+        total = 0
+        for bound, count in zip(self._bounds + (float('inf'),), self._counts):
+            total += count
+            yield name + '_bucket' + _labels(labels + [('le', _number(bound))]), total
+
+        yield name + '_sum' + _labels(labels), self.sum
+        yield name + '_count' + _labels(labels), total
+
+
+class Family:
+    """Метрики одного имени, различающиеся значением метки"""
+
+    def __init__(self, metric, label, *args):
+        self.kind = metric.kind
+        self._metric = metric
+        self._label = label
+        self._args = args
+        self._children = {}
+
+    def labels(self, value):
+        child = self._children.get(value)
+        if child is None:
+            child = self._children[value] = self._metric(*self._args)
+
+        return child
+
+    def samples(self, name, labels):
+        for value, child in self._children.items():
+            yield from child.samples(name, labels + [(self._label, value)])
+
+
+class Gauge:
+    """Значение, снимаемое функцией collect в момент выдачи метрик.
+
+    С меткой label функция возвращает словарь значение метки -> значение
+    """
+    kind = 'gauge'
+
+    def __init__(self, collect, label=None):
+        self._collect = collect
+        self._label = label
+
+    def samples(self, name, labels):
+        value = self._collect()
+        if self._label is None:
+            yield name + _labels(labels), value
+            return
+
+        for key, item in value.items():
+            yield name + _labels(labels + [(self._label, key)]), item
+
+
+class Metrics:
+    def __init__(self):
+        self._metrics = {}
+
+        self.tick_duration = self.register(
+            'lift_tick_duration_seconds', 'Time spent in one building tick', Histogram())
+        self.tick_drift = self.register(
+            'lift_tick_drift_seconds', 'How late the simulation loop woke up', Histogram())
+        self.tick_overruns = self.register(
+            'lift_tick_overruns_total', 'Ticks that took longer than LOOP_DELAY', Counter())
+        self.signal_duration = self.register(
+            'lift_signal_duration_seconds', 'Signal handler latency',
+            Family(Histogram, 'signal', DURATION_BUCKETS))
+        self.validation_failures = self.register(
+            'lift_validation_failures_total', 'Messages rejected by validation',
+            Family(Counter, 'stage'))
+        self.fanout_size = self.register(
+            'lift_broadcast_recipients', 'Sockets a broadcast frame was queued for',
+            Histogram(FANOUT_BUCKETS))
+        self.fanout_duration = self.register(
+            'lift_broadcast_duration_seconds', 'Time spent queueing a broadcast', Histogram())
+        self.outbox_delay = self.register(
+            'lift_outbox_delay_seconds', 'Time a frame waited in a socket queue until sent',
+            Histogram())
+
+    def register(self, name, help, metric):
+        if name in self._metrics:
+            raise KeyError(f'Metric {name} already registered')
+
+        self._metrics[name] = (help, metric)
+        return metric
+
+    def gauge(self, name, help, collect, label=None):
+        return self.register(name, help, Gauge(collect, label))
+
+    def render(self):
+        lines = []
+        for name, (help, metric) in self._metrics.items():
+            lines.append(f'# HELP {name} {help}')
+            lines.append(f'# TYPE {name} {metric.kind}')
+            for sample, value in metric.samples(name, []):
+                lines.append(f'{sample} {_number(value)}')
+
+        return '\n'.join(lines) + '\n'
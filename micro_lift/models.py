@@ -1,6 +1,9 @@
+from bisect import bisect_left, insort
 from datetime import datetime as dt
 from enum import Enum
+from itertools import count
 from math import ceil
+from time import monotonic
 
 
 ISO8601_FORMAT = '%Y-%m-%dT%H:%M:%S.%fZ'
@@ -17,17 +20,57 @@ class ActorStatus(Enum):
     IN_LIFT = 2
 
 
-class Lift():
-    def __init__(self, id, speed, max_weight, floor_height=1.0, *args, **kwargs):
-        self._id = id
-        self._speed = speed
-        self._max_weight = max_weight
-        self._position = 0.01
-        self._passengers = []
-        self._status = LiftStatus.STOPPED
-        self._floor_height = floor_height
+class Snapshot:
+    """Закодированный снимок состояния объекта.
 
-        super().__init__(*args, **kwargs)
+    Снимок строится при первом запросе отдельно для каждого кодировщика
+    и переиспользуется, пока объект не изменится: сеттеры и переходы
+    состояния вызывают _touch, который взводит флаг _dirty и оповещает
+    наблюдателей, например индексы
+    """
+
+    __slots__ = ()
+
+    _dirty = True
+    _snapshots = None
+    _watchers = ()
+
+    def snapshot(self, encoder):
+        if self._dirty:
+            self._snapshots = {}
+            self._dirty = False
+
+        raw = self._snapshots.get(encoder)
+        if raw is None:
+            raw = self._snapshots[encoder] = encoder(self)
+
+        return raw
+
+    def watch(self, callback):
+        """Регистрирует функцию, вызываемую после каждого изменения объекта"""
+
+        if not self._watchers:
+            self._watchers = []
+        self._watchers.append(callback)
+
+    def unwatch(self, callback):
+        if callback in self._watchers:
+            self._watchers.remove(callback)
+
+    def _touch(self):
+        self._dirty = True
+        for callback in self._watchers:
+            callback(self)
+
+
+class BaseLift(Snapshot):
+    """Интерфейс и поведение лифта.
+
+    Состояние хранится в закрытых атрибутах: Lift держит их в самом
+    объекте, а engine.ArrayLift - в массивах движка
+    """
+
+    __slots__ = ()
 
     @property
     def id(self):
@@ -49,6 +92,7 @@ class Lift():
     def position(self, pos):
         if pos >= 0.0:
             self._position = pos
+            self._touch()
 
     @property
     def passengers(self):
@@ -56,8 +100,16 @@ class Lift():
 
     @passengers.setter
     def passengers(self, pas):
-        if sum([x.weight for x in pas]) <= self._max_weight:
+        load = sum([x.weight for x in pas])
+        if load <= self._max_weight:
             self._passengers = pas
+            self._load = load
+            self._touch()
+
+    @property
+    def load(self):
+        """Суммарный вес пассажиров в лифте"""
+        return self._load
 
     @property
     def status(self):
@@ -67,10 +119,19 @@ class Lift():
     def floor(self):
         return ceil(self.position / self._floor_height)
 
-    def near_act_floor(self, actors):
+    @property
+    def target(self):
+        """Этаж, к которому лифт сдвинется на следующем шаге симуляции"""
+        return self._target
+
+    @target.setter
+    def target(self, floor):
+        self._target = floor
+
+    def near_act_floor(self, waiting):
         """Ближайший этаж на котором нужно выполнить какое-то действие"""
 
-        drop, take = self._near_drop_floor(), self._near_take_floor(actors)
+        drop, take = self._near_drop_floor(), self._near_take_floor(waiting)
 
         if None not in (drop, take):
             return drop if abs(self.floor - drop) < abs(self.floor - take) else take
@@ -83,62 +144,97 @@ class Lift():
         drop_off = self._out_passengers()
         for p in drop_off:
             self._passengers.remove(p)
+            self._load -= p.weight
             p.leave_lift()
 
+        if drop_off:
+            self._touch()
+
         return drop_off
 
-    def take_actors(self, actors):
+    def take_actors(self, waiting):
         """Забирает actor'ов c текущего этажа, если им нужен лифт"""
 
-        new_passengers = [x for x in actors if x.floor == self.floor and
-                          x.status == ActorStatus.EXPECT]
-
-        # теперь нужно проверить ограничение с грузоподъемностью лифта
-        new_passengers.sort(key=lambda x: x.weight)
-        possible_weight = self._max_weight - sum([x.weight for x in self._passengers])
-        extra_inx = weight = 0
-        for p in new_passengers:
-            extra_inx += 1
-            if possible_weight > weight + p.weight:
-                break
-
-            weight += p.weight
-
-        new_passengers = new_passengers[0:extra_inx]
+        # Кандидаты уже упорядочены по весу, берем самых легких,
+        # пока не упремся в ограничение грузоподъемности лифта
+        new_passengers = waiting.board(self.floor, self._max_weight - self._load)
         for x in new_passengers:
-            x.enter_lift()
+            x.enter_lift(self._id)
+            self._load += x.weight
 
         self._passengers += new_passengers
+        if new_passengers:
+            self._touch()
 
         return new_passengers
 
     def stop(self):
         self._status = LiftStatus.STOPPED
+        self._target = None
+        self._touch()
 
-    def move_to_act_floor(self, actors):
+    def move_to_act_floor(self, waiting):
         """Перемещает лифт на один шаг к ближайшему этажу с посадкой/высадкой"""
 
-        near = self.near_act_floor(actors)
+        near = self.near_act_floor(waiting)
         if near is not None:
             if near < self.floor:
                 self.move_down()
             else:
                 self.move_up()
 
-    def move_up(self):
-        self._status = LiftStatus.IN_ACTION
-        self._position += self._speed
+    def steps_to(self, target):
+        """Число шагов, за которое лифт доедет до указанного этажа"""
+
+        cur_floor = self.floor
+        if target > cur_floor:
+            return int(((target - 1) * self._floor_height - self.position) // self._speed) + 1
+        if target < cur_floor:
+            return ceil((self.position - target * self._floor_height) / self._speed)
+
+        return 0
+
+    def advance(self, steps=1):
+        """Сдвигает лифт на steps шагов к назначенному этажу, не проезжая его"""
+
+        target = self._target
+        if target is not None and steps > 0:
+            steps = min(steps, max(self.steps_to(target), 1))
+            if target < self.floor:
+                self.move_down(steps)
+            elif target > self.floor:
+                self.move_up(steps)
 
-    def move_down(self):
+    def move_up(self, steps=1):
         self._status = LiftStatus.IN_ACTION
-        self._position -= self._speed
+        self._position += self._speed * steps
+        self._touch()
 
+    def move_down(self, steps=1):
+        self._status = LiftStatus.IN_ACTION
+        self._position -= self._speed * steps
         if self._position < 0:
             self._position = 0
 
+        self._touch()
+
     def is_empty(self):
         return not self._passengers
 
+    def state(self):
+        """Изменяемое состояние лифта для сохранения на диск"""
+        return [self._position, self._status.value, self._target, [x.uid for x in self._passengers]]
+
+    def restore(self, position, status, target, passengers):
+        """Восстанавливает состояние, сохраненное методом state"""
+
+        self._position = position
+        self._status = LiftStatus(status)
+        self._target = target
+        self._passengers = list(passengers)
+        self._load = sum([x.weight for x in self._passengers])
+        self._touch()
+
     def _out_passengers(self):
         """Пассажиры, выходящие на текущем этаже"""
 
@@ -152,27 +248,162 @@ class Lift():
 
         return min(dist, key=lambda x: x[0])[1] if dist else None
 
-    def _near_take_floor(self, actors):
+    def _near_take_floor(self, waiting):
         """Ближайший этаж, на котором следует забрать пассажира,
         при условии что его вес не приведет к перегрузке лифта
         """
-        cur_floor = self.floor
-        possible_weight = self._max_weight - sum([x.weight for x in self._passengers])
-        dist = [(abs(cur_floor - x.floor), x.floor) for x in actors
-                if x.weight <= possible_weight and x.status == ActorStatus.EXPECT]
+        return waiting.nearest_floor(self.floor, self._max_weight - self._load)
 
-        return min(dist, key=lambda x: x[0])[1] if dist else None
 
+class Lift(BaseLift):
+    def __init__(self, id, speed, max_weight, floor_height=1.0, *args, **kwargs):
+        self._id = id
+        self._speed = speed
+        self._max_weight = max_weight
+        self._position = 0.01
+        self._passengers = []
+        self._load = 0.0
+        self._status = LiftStatus.STOPPED
+        self._target = None
+        self._floor_height = floor_height
 
+        super().__init__(*args, **kwargs)
 
-class Actor:
-    def __init__(self, uid, weight):
-        self._uid = uid
-        self._weight = weight
-        self._floor = 1
-        self._need_floor = None
-        self._status = ActorStatus.IDLE
-        self._timestamp = dt.utcnow()
+
+class WaitingRoom:
+    """Реестр акторов, ожидающих лифт, сгруппированных по этажам.
+
+    Номера этажей с ожидающими хранятся в отсортированном списке, а внутри
+    этажа акторы упорядочены по весу. Реестр обновляется самими акторами
+    при смене состояния, поэтому лифтам не нужно перебирать всех акторов здания
+    """
+
+    def __init__(self):
+        self._floors = []
+        self._buckets = {}
+        self._keys = {}
+        self._seq = count()
+        self._listeners = []
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, actor):
+        return actor in self._keys
+
+    def __iter__(self):
+        for floor in self._floors:
+            for _, _, actor in self._buckets[floor]:
+                yield actor
+
+    def listen(self, callback):
+        """Регистрирует функцию, вызываемую при появлении нового ожидающего"""
+
+        self._listeners.append(callback)
+
+    def add(self, actor):
+        """Ставит актора в очередь на его текущем этаже"""
+
+        if actor in self._keys:
+            return
+
+        floor, key = actor.floor, (actor.weight, next(self._seq), actor)
+        bucket = self._buckets.get(floor)
+        if bucket is None:
+            bucket = self._buckets[floor] = []
+            insort(self._floors, floor)
+
+        insort(bucket, key)
+        self._keys[actor] = (floor, key)
+
+        for callback in self._listeners:
+            callback()
+
+    def discard(self, actor):
+        """Убирает актора из очереди, если он в ней находится"""
+
+        entry = self._keys.pop(actor, None)
+        if entry is None:
+            return
+
+        floor, key = entry
+        bucket = self._buckets[floor]
+        del bucket[bisect_left(bucket, key)]
+        if not bucket:
+            del self._buckets[floor]
+            del self._floors[bisect_left(self._floors, floor)]
+
+    def on_floor(self, floor):
+        """Акторы, ожидающие лифт на этаже"""
+
+        for _, _, actor in self._buckets.get(floor, ()):
+            yield actor
+
+    def calls(self):
+        """Этажи с ожидающими и вес самого легкого актора на каждом из них"""
+
+        buckets = self._buckets
+        for floor in self._floors:
+            yield floor, buckets[floor][0][0]
+
+    def counts(self):
+        """Этажи с ожидающими и число ожидающих на каждом из них"""
+
+        buckets = self._buckets
+        for floor in self._floors:
+            yield floor, len(buckets[floor])
+
+    def lightest(self, floor):
+        """Вес самого легкого ожидающего на этаже или None"""
+
+        bucket = self._buckets.get(floor)
+        return bucket[0][0] if bucket else None
+
+    def at_floor(self, floor):
+        """Ожидающие на этаже акторы в порядке возрастания веса"""
+
+        return [x[2] for x in self._buckets.get(floor, [])]
+
+    def nearest_floor(self, floor, max_weight):
+        """Ближайший к floor этаж, где ждет актор весом не более max_weight"""
+
+        floors, buckets = self._floors, self._buckets
+        hi = bisect_left(floors, floor)
+        lo = hi - 1
+        while lo >= 0 or hi < len(floors):
+            if hi >= len(floors) or (lo >= 0 and floor - floors[lo] < floors[hi] - floor):
+                candidate, lo = floors[lo], lo - 1
+            else:
+                candidate, hi = floors[hi], hi + 1
+
+            # Первым в очереди этажа стоит самый легкий актор
+            if buckets[candidate][0][0] <= max_weight:
+                return candidate
+
+        return None
+
+    def board(self, floor, max_weight):
+        """Акторы этажа, которых можно забрать не превысив max_weight"""
+
+        result, weight = [], 0
+        for w, _, actor in self._buckets.get(floor, []):
+            if weight + w > max_weight:
+                break
+
+            weight += w
+            result.append(actor)
+
+        return result
+
+
+class BaseActor(Snapshot):
+    """Интерфейс и переходы состояния актора.
+
+    Состояние хранится в закрытых атрибутах: Actor держит их в самом
+    объекте, а StoredActor - в массивах ActorStore
+    """
+
+    __slots__ = ()
 
     @property
     def uid(self):
@@ -188,8 +419,15 @@ class Actor:
 
     @floor.setter
     def floor(self, value):
-        if value >= 1:
-            self._floor = value
+        if value >= 1 and value != self._floor:
+            if self._status == ActorStatus.EXPECT and self._room is not None:
+                self._room.discard(self)
+                self._floor = value
+                self._room.add(self)
+            else:
+                self._floor = value
+
+            self._touch()
 
     @property
     def need_floor(self):
@@ -203,17 +441,41 @@ class Actor:
     def timestamp(self):
         return self._timestamp
 
+    @property
+    def lift_id(self):
+        """Лифт, в котором едет актор"""
+        return self._lift_id
+
+    @property
+    def called_at(self):
+        """Монотонное время вызова лифта"""
+        return self._called_at
+
+    @property
+    def entered_at(self):
+        """Монотонное время посадки в лифт"""
+        return self._entered_at
+
     def idle(self):
         """Переход в режим бездействия"""
         if self._status == ActorStatus.EXPECT:
             self._status = ActorStatus.IDLE
             self._need_floor = None
+            if self._room is not None:
+                self._room.discard(self)
+            self._touch()
 
     def wait_lift(self, floor):
         """Ожидать лифт на текущем этаже"""
         if self._status != ActorStatus.IN_LIFT and floor != self._floor:
+            if self._status != ActorStatus.EXPECT:
+                self._called_at = monotonic()
+
             self._need_floor = floor
             self._status = ActorStatus.EXPECT
+            if self._room is not None:
+                self._room.add(self)
+            self._touch()
 
     def leave_lift(self):
         """Покидает лифт и выходит на этаж"""
@@ -221,17 +483,38 @@ class Actor:
         if self._status == ActorStatus.IN_LIFT:
             self._status = ActorStatus.IDLE
             self._need_floor = None
+            self._lift_id = None
+            self._touch()
 
             return True
 
         return False
 
-    def enter_lift(self):
+    def enter_lift(self, lift_id=None):
         """Заходит в лифт, если это возможно"""
 
         if self._status == ActorStatus.EXPECT:
             self._status = ActorStatus.IN_LIFT
+            self._entered_at = monotonic()
+            self._lift_id = lift_id
+            if self._room is not None:
+                self._room.discard(self)
+            self._touch()
 
             return True
 
         return False
+
+
+class Actor(BaseActor):
+    def __init__(self, uid, weight, room=None):
+        self._uid = uid
+        self._weight = weight
+        self._floor = 1
+        self._need_floor = None
+        self._status = ActorStatus.IDLE
+        self._timestamp = dt.utcnow()
+        self._called_at = None
+        self._entered_at = None
+        self._lift_id = None
+        self._room = room
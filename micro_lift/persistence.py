@@ -0,0 +1,268 @@
+"""Сохранение состояния здания на диск для быстрого перезапуска.
+
+Состояние складывается из снимка и журнала. Журнал - файлы с JSON-строками
+полного состояния каждого изменившегося актора и лифта: изменения между
+двумя сбросами на диск сливаются, остается последнее состояние объекта.
+Снимок - двоичный файл с массивами ActorStore и состоянием лифтов. После
+записи снимка начинается новый файл журнала, а старые удаляются.
+
+Запись идет в отдельном потоке, по одному fsync на сброс, поэтому петля
+лифтов никогда не ждет диск. При старте загружается снимок и поверх него
+проигрываются более новые файлы журнала
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import os
+import struct
+from time import monotonic
+
+from sanic.log import error_logger
+import ujson
+
+
+SNAPSHOT_MAGIC = b'MLSNAP1\n'
+SNAPSHOT_NAME = 'snapshot.bin'
+
+_SIZE = struct.Struct('!I')
+
+ACTOR, REMOVED, LIFT = 'a', 'r', 'l'
+
+# Через сколько секунд после ошибки записи снимок пишется повторно
+RETRY_DELAY = 5.0
+
+
+def write_snapshot(path, state):
+    """Атомарно записывает снимок: заголовок в JSON и байты массивов"""
+
+    uids, lift_ids, columns, lifts, journal = state
+    names = sorted(columns)
+    header = ujson.dumps({
+        'journal': journal,
+        'uids': uids,
+        'lift_ids': lift_ids,
+        'lifts': lifts,
+        'columns': [[x, len(columns[x])] for x in names],
+    }).encode('utf-8')
+
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as fsnap:
+        fsnap.write(SNAPSHOT_MAGIC)
+        fsnap.write(_SIZE.pack(len(header)))
+        fsnap.write(header)
+        for name in names:
+            fsnap.write(columns[name])
+
+        fsnap.flush()
+        os.fsync(fsnap.fileno())
+
+    os.replace(tmp, path)
+
+
+def read_snapshot(path):
+    with open(path, 'rb') as fsnap:
+        if fsnap.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+            raise ValueError(f'Not a snapshot file: {path}')
+
+        size, = _SIZE.unpack(fsnap.read(_SIZE.size))
+        header = ujson.loads(fsnap.read(size))
+        columns = {name: fsnap.read(length) for name, length in header['columns']}
+
+    return header, columns
+
+
+def read_journal(path):
+    """Записи файла журнала. Недописанная последняя строка пропускается"""
+
+    with open(path, 'rb') as fjournal:
+        for line in fjournal:
+            try:
+                yield ujson.loads(line)
+            except ValueError:
+                return
+
+
+def restore_lift(actors, lift, state):
+    """Возвращает лифту состояние, полученное методом state"""
+
+    position, status, target, passengers = state
+    lift.restore(position, status, target, [actors[x] for x in passengers if x in actors])
+
+
+class Persistence:
+    def __init__(self, directory, flush_interval=0.2, snapshot_interval=60.0):
+        self._dir = directory
+        self._flush_interval = flush_interval
+        self._snapshot_interval = snapshot_interval
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='persistence')
+        self._pending = {}
+        self._segment = 0
+        self._file = None
+        self._ctx = None
+        self._errors = None
+
+        os.makedirs(directory, exist_ok=True)
+
+    def restore(self, ctx):
+        """Загружает снимок и журнал в пустое здание контекста.
+
+        Возвращает число восстановленных акторов
+        """
+        actors, lifts = ctx.actors, ctx.lifts
+
+        journal = 0
+        path = os.path.join(self._dir, SNAPSHOT_NAME)
+        if os.path.exists(path):
+            header, columns = read_snapshot(path)
+            actors.load(header['uids'], header['lift_ids'], columns)
+            for id, state in header['lifts'].items():
+                if id in lifts:
+                    restore_lift(actors, lifts[id], state)
+            journal = header['journal']
+
+        segments = self._segments()
+        for segment in segments:
+            if segment < journal:
+                continue
+
+            for record in read_journal(self._journal_path(segment)):
+                kind, key = record[0], record[1]
+                if kind == ACTOR:
+                    actors.put(key, record[2])
+                elif kind == REMOVED:
+                    if key in actors:
+                        del actors[key]
+                elif kind == LIFT and key in lifts:
+                    restore_lift(actors, lifts[key], record[2])
+
+        for actor in actors.waiting():
+            ctx.waiting.add(actor)
+
+        # Новые записи идут в новый файл, недописанный хвост старого не трогаем
+        self._segment = max(segments + [journal - 1]) + 1
+
+        return len(actors)
+
+    def attach(self, ctx, errors=None):
+        """Начинает записывать в журнал изменения акторов и лифтов контекста.
+
+        errors - счетчик неудачных записей на диск
+        """
+        self._ctx = ctx
+        self._errors = errors
+        ctx.actors.listen(self._actor_changed)
+        ctx.actors.watch(self._actor_touched)
+        for lift in ctx.lifts.values():
+            lift.watch(self._lift_touched)
+
+    async def run(self):
+        loop = asyncio.get_event_loop()
+        last_snapshot = monotonic()
+        while True:
+            await asyncio.sleep(self._flush_interval)
+
+            try:
+                if monotonic() - last_snapshot >= self._snapshot_interval:
+                    last_snapshot = monotonic()
+                    await loop.run_in_executor(self._executor, self._write_snapshot, *self._capture())
+                else:
+                    data = self._drain()
+                    if data:
+                        await loop.run_in_executor(self._executor, self._append, self._segment, data)
+            except OSError as e:
+                # Строки журнала потеряны, их покроет полный снимок,
+                # который пишется вне очереди через RETRY_DELAY
+                error_logger.error('Failed to write state to %s: %s', self._dir, e)
+                if self._errors is not None:
+                    self._errors.inc()
+                last_snapshot = monotonic() - self._snapshot_interval + \
+                    min(RETRY_DELAY, self._snapshot_interval)
+
+    def flush(self):
+        """Синхронно сбрасывает накопленные изменения в журнал"""
+
+        data = self._drain()
+        if data:
+            self._executor.submit(self._append, self._segment, data).result()
+
+    def snapshot(self):
+        """Синхронно сбрасывает журнал и записывает снимок, например при остановке"""
+
+        self._executor.submit(self._write_snapshot, *self._capture()).result()
+
+    def _actor_changed(self, uid, actor):
+        self._pending[(ACTOR, uid)] = actor
+
+    def _actor_touched(self, actor):
+        self._pending[(ACTOR, actor.uid)] = actor
+
+    def _lift_touched(self, lift):
+        self._pending[(LIFT, lift.id)] = lift
+
+    def _drain(self):
+        """Кодирует накопленные изменения в строки журнала"""
+
+        pending, self._pending = self._pending, {}
+        actors, lines = self._ctx.actors, []
+        for (kind, key), obj in pending.items():
+            if kind == LIFT:
+                record = [LIFT, key, obj.state()]
+            elif obj is None or key not in actors:
+                record = [REMOVED, key]
+            else:
+                record = [ACTOR, key, actors.row(key)]
+
+            lines.append(ujson.dumps(record))
+
+        return ('\n'.join(lines) + '\n').encode('utf-8') if lines else b''
+
+    def _capture(self):
+        """Состояние для снимка, снятое в петле событий.
+
+        Изменения до этого момента уходят в текущий файл журнала,
+        после него - в следующий, с которого снимок и начинается
+        """
+        data = self._drain()
+        segment = self._segment
+        self._segment += 1
+
+        uids, lift_ids, columns = self._ctx.actors.dump()
+        lifts = {id: x.state() for id, x in self._ctx.lifts.items()}
+
+        return segment, data, (uids, lift_ids, columns, lifts, self._segment)
+
+    def _write_snapshot(self, segment, data, state):
+        if data:
+            self._append(segment, data)
+
+        write_snapshot(os.path.join(self._dir, SNAPSHOT_NAME), state)
+
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+        for old in self._segments():
+            if old <= segment:
+                os.unlink(self._journal_path(old))
+
+    def _append(self, segment, data):
+        path = self._journal_path(segment)
+        if self._file is None or self._file.name != path:
+            if self._file is not None:
+                self._file.close()
+            self._file = open(path, 'ab')
+
+        self._file.write(data)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def _segments(self):
+        result = []
+        for name in os.listdir(self._dir):
+            if name.startswith('journal.') and name.endswith('.log'):
+                result.append(int(name[len('journal.'):-len('.log')]))
+
+        return sorted(result)
+
+    def _journal_path(self, segment):
+        return os.path.join(self._dir, f'journal.{segment:08d}.log')
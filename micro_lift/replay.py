@@ -0,0 +1,402 @@
+"""Запись входящих событий сервера и их детерминированное воспроизведение.
+
+Регистратор пишет в двоичный файл состояние здания на начало записи,
+например восстановленное с диска, и все, что приходит в здание извне:
+подключения, сырые кадры клиентов, результаты проверки токенов и
+билетов, шаги петли лифтов, чистки брошенных акторов и планы решателя -
+с монотонным временем в наносекундах. Запись события - упаковка
+заголовка в буфер, сам файл пишется отдельным потоком, когда буфер
+наполнится.
+
+Проигрыватель подает события записи обработчикам LiftApp и моделям в том
+же порядке без ожидания, а время берет из записи: модули видят
+виртуальные часы вместо настоящих. Результаты проверки токенов и билетов
+и планы решателя берутся из записи, поэтому проигрыш не зависит от
+секретного ключа и текущего времени. Итог проигрыша - отпечаток
+состояния здания, у двух проигрышей одной записи он совпадает
+"""
+
+import argparse
+import asyncio
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+import cProfile
+from hashlib import sha256
+import pstats
+import struct
+import sys
+from time import monotonic_ns, perf_counter, time
+from types import SimpleNamespace
+
+import ujson
+
+from codec import CODECS
+from conf import load_config
+from events import DROP_OFF, ENTER_LIFT
+from persistence import restore_lift
+from views import LiftApp, TokenExpired
+
+
+TRACE_MAGIC = b'MLTRACE1\n'
+
+# Виды событий. Аргумент события - целое число, его смысл зависит от вида
+CONNECT, DISCONNECT, TEXT, BINARY, AUTH, RESUME, TICK, SWEEP, PLAN, STATE = range(1, 11)
+# Результаты проверки токена
+DENIED, GRANTED, EXPIRED = 0, 1, 2
+
+# Время старта записи: настоящее и монотонное в наносекундах
+_START = struct.Struct('!dq')
+# Заголовок события: вид, аргумент, монотонное время в наносекундах, длина данных
+_EVENT = struct.Struct('!Bqqi')
+
+# Модули, в которых проигрыватель подменяет часы
+CLOCK_MODULES = ('auth', 'dispatch', 'fanout', 'lifecycle', 'models',
+                 'simulation', 'store', 'subscriptions')
+
+
+class TraceRecorder:
+    def __init__(self, path, flush_interval=1.0, buffer_size=65536):
+        self._flush_interval = flush_interval
+        self._buffer_size = buffer_size
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='trace')
+        self._file = open(path, 'wb')
+        self._conns = {}
+        self._next_conn = 0
+        self._buf = bytearray(TRACE_MAGIC + _START.pack(time(), monotonic_ns()))
+
+    def state(self, ctx):
+        """Состояние акторов и лифтов здания на начало записи"""
+
+        actors = ctx.actors
+        self._event(STATE, 0, ujson.dumps({
+            'actors': [[uid, actors.row(uid)] for uid in actors],
+            'lifts': {id: x.state() for id, x in ctx.lifts.items()},
+        }).encode('utf-8'))
+
+    def connect(self, ws, codec):
+        conn = self._conns[ws] = self._next_conn
+        self._next_conn += 1
+        self._event(CONNECT, conn, codec.name.encode('utf-8'))
+
+    def disconnect(self, ws):
+        conn = self._conns.pop(ws, None)
+        if conn is not None:
+            self._event(DISCONNECT, conn)
+
+    def message(self, ws, msg):
+        if isinstance(msg, str):
+            self._event(TEXT, self._conns[ws], msg.encode('utf-8'))
+        else:
+            self._event(BINARY, self._conns[ws], msg)
+
+    def auth(self, uid, granted, expired=False):
+        result = EXPIRED if expired else GRANTED if granted else DENIED
+        self._event(AUTH, result, uid.encode('utf-8'))
+
+    def resume(self, ticket, uid):
+        self._event(RESUME, 0, ujson.dumps([ticket, uid]).encode('utf-8'))
+
+    def tick(self, steps):
+        self._event(TICK, steps)
+
+    def sweep(self):
+        self._event(SWEEP, 0)
+
+    def plan(self, plan, latency):
+        """План решателя стратегии optimal и время его расчета"""
+
+        self._event(PLAN, int(latency * 1e9), ujson.dumps(list(plan.items())).encode('utf-8'))
+
+    def flush(self):
+        """Отдает накопленные события потоку записи"""
+
+        if self._buf:
+            data, self._buf = bytes(self._buf), bytearray()
+            self._executor.submit(self._write, data)
+
+    def close(self):
+        self.flush()
+        self._executor.shutdown(wait=True)
+        self._file.close()
+
+    async def run(self):
+        """Периодически отдает события на диск, даже если буфер не наполнился"""
+
+        while True:
+            await asyncio.sleep(self._flush_interval)
+            self.flush()
+
+    def _event(self, kind, arg, payload=b''):
+        buf = self._buf
+        buf += _EVENT.pack(kind, arg, monotonic_ns(), len(payload))
+        buf += payload
+        if len(buf) >= self._buffer_size:
+            self.flush()
+
+    def _write(self, data):
+        self._file.write(data)
+        self._file.flush()
+
+
+def read_trace(path):
+    """Время старта записи и события: (вид, аргумент, время в нс, данные).
+
+    Недописанное последнее событие пропускается
+    """
+    with open(path, 'rb') as ftrace:
+        data = ftrace.read()
+
+    if not data.startswith(TRACE_MAGIC):
+        raise ValueError(f'Not a trace file: {path}')
+
+    offset = len(TRACE_MAGIC)
+    start = _START.unpack_from(data, offset)
+    offset += _START.size
+
+    events = []
+    while offset + _EVENT.size <= len(data):
+        kind, arg, at, size = _EVENT.unpack_from(data, offset)
+        offset += _EVENT.size
+        if offset + size > len(data):
+            break
+
+        events.append((kind, arg, at, data[offset:offset + size]))
+        offset += size
+
+    return start, events
+
+
+class VirtualClock:
+    """Часы, которые двигает только проигрыватель.
+
+    install подменяет monotonic и time в модулях сервера, uninstall
+    возвращает настоящие
+    """
+
+    def __init__(self, wall, start_ns):
+        self._wall = wall
+        self._start = start_ns
+        self.now_ns = start_ns
+        self._saved = []
+
+    def monotonic(self):
+        return self.now_ns / 1e9
+
+    def time(self):
+        return self._wall + (self.now_ns - self._start) / 1e9
+
+    def install(self):
+        for name in CLOCK_MODULES:
+            module = sys.modules.get(name)
+            for attr in ('monotonic', 'time'):
+                if module is not None and hasattr(module, attr):
+                    self._saved.append((module, attr, getattr(module, attr)))
+                    setattr(module, attr, getattr(self, attr))
+
+    def uninstall(self):
+        while self._saved:
+            module, attr, value = self._saved.pop()
+            setattr(module, attr, value)
+
+
+class ReplaySocket:
+    """Сокет клиента из записи: отправленные ему кадры только считаются"""
+
+    subprotocol = None
+
+    def __init__(self):
+        self.sent = 0
+
+    async def send(self, frame):
+        self.sent += 1
+
+    async def close(self):
+        pass
+
+
+class ReplayTickets:
+    """Билеты из записи вместо случайных"""
+
+    def __init__(self):
+        self._resolved = defaultdict(deque)
+        self._issued = 0
+
+    def __len__(self):
+        return 0
+
+    def record(self, ticket, uid):
+        self._resolved[ticket].append(uid)
+
+    def issue(self, uid):
+        self._issued += 1
+        return f'replay{self._issued}'
+
+    def resolve(self, ticket):
+        queue = self._resolved.get(ticket)
+        return queue.popleft() if queue else None
+
+
+class ReplayApp(LiftApp):
+    """LiftApp, берущий результаты проверки токенов из записи"""
+
+    def __init__(self, app, auths):
+        super().__init__(app)
+        self._auths = auths
+
+    def authenticate(self, data):
+        queue = self._auths.get(data['uid'])
+        result = queue.popleft() if queue else DENIED
+        if result == EXPIRED:
+            raise TokenExpired
+
+        return result == GRANTED
+
+
+def restore_state(ctx, payload):
+    """Приводит пустое здание в состояние на начало записи так же,
+    как init_state после восстановления с диска
+    """
+    state, actors = ujson.loads(payload), ctx.actors
+    for uid, row in state['actors']:
+        actors.put(uid, row)
+    for id, lift in state['lifts'].items():
+        if id in ctx.lifts:
+            restore_lift(actors, ctx.lifts[id], lift)
+
+    for actor in actors.waiting():
+        ctx.waiting.add(actor)
+    for actor in actors.values():
+        ctx.actor_index.add(actor)
+    ctx.lifecycle.adopt(actors)
+
+
+def state_digest(ctx):
+    """Отпечаток состояния акторов и лифтов здания"""
+
+    digest = sha256()
+    for uid in sorted(ctx.actors):
+        digest.update(ujson.dumps([uid, ctx.actors.row(uid)]).encode('utf-8'))
+    for id in sorted(ctx.lifts):
+        digest.update(ujson.dumps([id, ctx.lifts[id].state()]).encode('utf-8'))
+
+    return digest.hexdigest()
+
+
+async def replay(app, path):
+    """Проигрывает запись в здании приложения app, созданном init_state"""
+
+    (wall, start_ns), events = read_trace(path)
+    ctx = app.ctx
+
+    # Результаты проверок нужны раньше, чем до них дойдет очередь в записи
+    auths, tickets = defaultdict(deque), ReplayTickets()
+    for kind, arg, _, payload in events:
+        if kind == AUTH:
+            auths[payload.decode('utf-8')].append(arg)
+        elif kind == RESUME:
+            tickets.record(*ujson.loads(payload))
+
+    ctx.tickets = tickets
+    ctx.trace = None
+    lift_app = ReplayApp(app, auths)
+    delivery = ctx.building.bus.subscribe(lift_app._deliver, kinds={DROP_OFF, ENTER_LIFT})
+    clock = VirtualClock(wall, start_ns)
+    sockets, codecs = {}, {}
+    counts = defaultdict(int)
+
+    clock.install()
+    started = perf_counter()
+    try:
+        for kind, arg, at, payload in events:
+            clock.now_ns = at
+            counts[kind] += 1
+            if kind == CONNECT:
+                ws = sockets[arg] = ReplaySocket()
+                codec = codecs[arg] = CODECS[payload.decode('utf-8')]
+                ctx.lifecycle.connect(ws, codec)
+            elif kind in (TEXT, BINARY) and arg in sockets:
+                msg = payload.decode('utf-8') if kind == TEXT else payload
+                if not await lift_app.handle(None, sockets[arg], codecs[arg], msg):
+                    ctx.lifecycle.disconnect(sockets.pop(arg))
+            elif kind == DISCONNECT and arg in sockets:
+                ctx.lifecycle.disconnect(sockets.pop(arg))
+            elif kind == TICK:
+                ctx.building.tick(arg)
+                ctx.interests.flush()
+                ctx.subscriptions.flush(clock.monotonic())
+                # Писатели очередей сокетов работают между шагами, как в петле
+                await asyncio.sleep(0)
+            elif kind == SWEEP:
+                ctx.lifecycle.sweep()
+            elif kind == STATE:
+                restore_state(ctx, payload)
+            elif kind == PLAN:
+                # План записан по приходу, а рассчитан по состоянию на arg нс раньше
+                plan, latency = dict(ujson.loads(payload)), arg / 1e9
+                ctx.building.dispatcher.set_plan(plan, clock.monotonic() - latency, latency)
+    finally:
+        clock.uninstall()
+        delivery.cancel()
+
+    elapsed = perf_counter() - started
+    span = (events[-1][2] - events[0][2]) / 1e9 if events else 0.0
+
+    return {
+        'events': len(events),
+        'signals': counts[TEXT] + counts[BINARY],
+        'ticks': counts[TICK],
+        'connections': counts[CONNECT],
+        'recorded_seconds': span,
+        'replay_seconds': elapsed,
+        'speedup': span / elapsed if elapsed else None,
+        'digest': state_digest(ctx),
+    }
+
+
+def replay_app(config):
+    """Приложение с пустым зданием для проигрыша. Начальное состояние
+    здания приходит из записи
+    """
+
+    from main import init_state
+
+    config = dict(config, PERSISTENCE=dict(config['PERSISTENCE'], DIR=None),
+                  TRACE=dict(config['TRACE'], PATH=None))
+    app = SimpleNamespace(config=config, ctx=SimpleNamespace())
+    init_state(app.ctx, config)
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay a recorded lift server trace')
+    parser.add_argument('--config', type=str, help='Path to configuration yaml file')
+    parser.add_argument('--trace', type=str, required=True, help='Path to the trace file')
+    parser.add_argument('--profile', type=str, default=None,
+                        help='Run under cProfile and write stats to this path')
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+    # Импорт sanic ставит политику uvloop, у которой нет петли по умолчанию
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    app = replay_app(config)
+
+    profiler = cProfile.Profile() if args.profile else None
+    if profiler is not None:
+        profiler.enable()
+
+    report = loop.run_until_complete(replay(app, args.trace))
+
+    if profiler is not None:
+        profiler.disable()
+        profiler.dump_stats(args.profile)
+        pstats.Stats(profiler, stream=sys.stderr).sort_stats('cumulative').print_stats(25)
+
+    print(ujson.dumps(report, indent=2))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,8 +1,11 @@
 from datetime import datetime as dt
 from functools import wraps
+from math import isfinite
+from time import perf_counter_ns
 
 from marshmallow import Schema, ValidationError
 from marshmallow import fields
+from marshmallow import missing as _missing
 from marshmallow import validate
 from marshmallow.validate import Range
 from marshmallow_enum import EnumField
@@ -12,11 +15,142 @@ from models import ActorStatus, LiftStatus
 ISO8601_FORMAT = '%Y-%m-%dT%H:%M:%S.%fZ'
 
 
+class Timestamp(str):
+    """Строка штампа времени, хранящая результат его разбора"""
+
+    def __new__(cls, raw, value):
+        obj = super().__new__(cls, raw)
+        obj.value = value
+
+        return obj
+
+
+def parse_iso8601(value):
+    return Timestamp(value, dt.strptime(value, ISO8601_FORMAT))
+
+
+class Iso8601(fields.Str):
+    """Штамп времени в формате ISO 8601, разбираемый один раз при валидации"""
+
+    def _deserialize(self, value, attr, data, **kwargs):
+        value = super()._deserialize(value, attr, data, **kwargs)
+        try:
+            return parse_iso8601(value)
+        except ValueError:
+            raise ValidationError(f"'{value}' is not correct ISO 8601 value")
+
+
+def _to_float(value):
+    if not isfinite(value):
+        raise ValueError(value)
+
+    return float(value)
+
+
+# Типы полей, которые умеет проверять быстрый путь: допустимые типы
+# значения и функция преобразования
+_FAST_FIELDS = {
+    fields.Str: ((str,), None),
+    fields.Int: ((int,), None),
+    fields.Float: ((int, float), _to_float),
+    fields.Dict: ((dict,), None),
+    Iso8601: ((str,), parse_iso8601),
+}
+
+
+class SchemaLoader:
+    """Схема, построенная один раз, с быстрым путем валидации.
+
+    Для схем из простых полей корректное сообщение проверяется напрямую,
+    без механизма marshmallow. Любое отклонение от ожидаемой формы
+    передается самой схеме, поэтому ошибки остаются такими же, как у
+    marshmallow
+    """
+
+    def __init__(self, schema):
+        self.schema = schema()
+        self._fields = self._compile(self.schema)
+
+    @staticmethod
+    def _compile(schema):
+        compiled = []
+        for name, field in schema.fields.items():
+            fast = _FAST_FIELDS.get(type(field))
+            if fast is None or field.data_key is not None or field.attribute is not None:
+                return None
+
+            types, convert = fast
+            compiled.append((name, types, convert, field.required, field.missing,
+                             field.allow_none, tuple(field.validators)))
+
+        return compiled
+
+    def load(self, data):
+        if self._fields is not None:
+            try:
+                return self._fast_load(data)
+            except (ValidationError, ValueError, TypeError, KeyError):
+                pass
+
+        return self.schema.load(data)
+
+    def _fast_load(self, data):
+        if type(data) is not dict:
+            raise TypeError(data)
+
+        result, found = {}, 0
+        for name, types, convert, required, missing, allow_none, validators in self._fields:
+            value = data.get(name, _missing)
+            if value is _missing:
+                if required:
+                    raise KeyError(name)
+
+                if missing is not _missing:
+                    result[name] = missing() if callable(missing) else missing
+                continue
+
+            found += 1
+            if value is None:
+                if not allow_none:
+                    raise ValueError(name)
+
+                result[name] = None
+                continue
+
+            if type(value) not in types:
+                raise TypeError(name)
+
+            if convert is not None:
+                value = convert(value)
+
+            for validator in validators:
+                if validator(value) is False:
+                    raise ValueError(name)
+
+            result[name] = value
+
+        # Неизвестные поля - ошибка, ее текст сформирует marshmallow
+        if found != len(data):
+            raise KeyError(data)
+
+        return result
+
+
 def with_schema(schema):
     def decorator(func):
+        loader = SchemaLoader(schema)
+
         @wraps(func)
         def wrapper(self, _, __, data, *args, **kwargs):
-            valid_data = schema().load(data)
+            spans = self.app.ctx.spans
+            if spans is None:
+                return func(self, _, __, loader.load(data), *args, **kwargs)
+
+            started = perf_counter_ns()
+            try:
+                valid_data = loader.load(data)
+            finally:
+                spans.add(schema.__name__, 'schema', started, args[-1])
 
             return func(self, _, __, valid_data, *args, **kwargs)
 
@@ -24,32 +158,66 @@ def with_schema(schema):
     return decorator
 
 
-def _validate_iso8601(value):
-    try:
-        dt.strptime(value, ISO8601_FORMAT)
-    except ValueError:
-        raise ValidationError(f"'{value}' is not correct ISO 8601 value")
-
-
 class IncomingSchema(Schema):
     signal = fields.Str(required=True)
     id = fields.Str(default=None, missing=None, allow_none=True, validate=validate.Length(max=32))
     data = fields.Dict(required=True)
 
 
+BATCH_LIMIT = 1000
+
+
+class BatchSchema(Schema):
+    requests = fields.List(fields.Dict(), required=True,
+                           validate=validate.Length(min=1, max=BATCH_LIMIT))
+
+
+class ResumeSchema(Schema):
+    ticket = fields.Str(required=True, validate=validate.Length(max=64))
+
+
 class AuthSchema(Schema):
     uid = fields.Str(required=True)
-    timestamp = fields.Str(required=True, validate=_validate_iso8601)
+    timestamp = Iso8601(required=True)
     token = fields.Str(required=True)
     weight = fields.Float(required=True, validate=validate.Range(min=1.0))
 
 
 class LiftListSchema(Schema):
     count = fields.Int(default=10, missing=10, validate=Range(min=1))
+    cursor = fields.Str(default=None, missing=None, allow_none=True,
+                        validate=validate.Regexp(r'^\d+$'))
+    status = fields.Str(default=None, missing=None, allow_none=True,
+                        validate=validate.OneOf([x.name for x in LiftStatus]))
+    floor = fields.Int(default=None, missing=None, allow_none=True)
 
 
 class ActorListSchema(Schema):
     count = fields.Int(default=10, missing=10, validate=Range(min=1))
+    cursor = fields.Str(default=None, missing=None, allow_none=True,
+                        validate=validate.Regexp(r'^\d+$'))
+    status = fields.Str(default=None, missing=None, allow_none=True,
+                        validate=validate.OneOf([x.name for x in ActorStatus]))
+    floor = fields.Int(default=None, missing=None, allow_none=True)
+    need_floor = fields.Int(default=None, missing=None, allow_none=True)
+    lift = fields.Str(default=None, missing=None, allow_none=True)
+    weight_min = fields.Float(default=None, missing=None, allow_none=True)
+    weight_max = fields.Float(default=None, missing=None, allow_none=True)
+
+
+class SubscribeSchema(Schema):
+    topic = fields.Str(required=True, validate=validate.OneOf(['lifts', 'floors', 'actors']))
+    ids = fields.List(fields.Str(), default=None, missing=None, allow_none=True)
+    rate = fields.Float(default=1.0, missing=1.0, validate=Range(min=0.01, max=100.0))
+
+
+class UnsubscribeSchema(Schema):
+    topic = fields.Str(required=True, validate=validate.OneOf(['lifts', 'floors', 'actors']))
+
+
+class WatchSchema(Schema):
+    # Этаж floor:<номер> или лифт lift:<id>
+    topic = fields.Str(required=True, validate=validate.Regexp(r'^(floor:[1-9]\d*|lift:.+)$'))
 
 
 class ActorExpectSchema(Schema):
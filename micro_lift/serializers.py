@@ -0,0 +1,58 @@
+"""Быстрая сериализация моделей без построения схем marshmallow.
+
+Формат совпадает с выводом схем schema.Actor и schema.Lift. Закодированный
+JSON хранится в самом объекте до его следующего изменения, а списки
+собираются склейкой готовых фрагментов
+"""
+
+import ujson
+
+from schema import ISO8601_FORMAT
+
+
+def encode_actor(actor):
+    return {
+        'uid': actor.uid,
+        'weight': float(actor.weight),
+        'floor': actor.floor,
+        'need_floor': actor.need_floor,
+        'status': actor.status.name,
+        'timestamp': actor.timestamp.strftime(ISO8601_FORMAT),
+    }
+
+
+def encode_lift(lift):
+    return {
+        'id': lift.id,
+        'speed': float(lift.speed),
+        'max_weight': int(lift.max_weight),
+        'position': float(lift.position),
+        'passengers': [x.uid for x in lift.passengers],
+        'status': lift.status.name,
+    }
+
+
+def _actor_json(actor):
+    return ujson.dumps(encode_actor(actor))
+
+
+def _lift_json(lift):
+    return ujson.dumps(encode_lift(lift))
+
+
+def actor_json(actor):
+    """JSON актора из кэша объекта"""
+    return actor.snapshot(_actor_json)
+
+
+def lift_json(lift):
+    """JSON лифта из кэша объекта"""
+    return lift.snapshot(_lift_json)
+
+
+def actors_json(actors):
+    return '[' + ','.join([actor_json(x) for x in actors]) + ']'
+
+
+def lifts_json(lifts):
+    return '[' + ','.join([lift_json(x) for x in lifts]) + ']'
@@ -0,0 +1,146 @@
+"""Шаг симуляции здания, не зависящий от сетевого ввода-вывода"""
+
+from time import monotonic, perf_counter_ns
+
+from events import DROP_OFF, ENTER_LIFT, FLOOR_PASSED, LIFT_STOPPED, Event
+from models import LiftStatus
+
+
+def passed_floors(last_floor, cur_floor):
+    """Этажи после last_floor до cur_floor включительно по ходу движения"""
+
+    if last_floor is None:
+        return (cur_floor,)
+
+    step = 1 if cur_floor > last_floor else -1
+    return range(last_floor + step, cur_floor + step, step)
+
+
+class Building:
+    """Лифты и ожидающие акторы здания.
+
+    Шаг симуляции полностью синхронный: все, что должно дойти до клиентов,
+    публикуется в шину событий, а доставкой занимаются ее подписчики
+    """
+
+    def __init__(self, engine, waiting, dispatcher, bus):
+        self.engine = engine
+        self.waiting = waiting
+        self.dispatcher = dispatcher
+        self.bus = bus
+        self.tick_duration = 0.0
+        # Буфер спанов фаз шага, None - спаны не пишутся
+        self.spans = None
+        self._floors = {}
+
+    @property
+    def lifts(self):
+        return self.engine.lifts
+
+    def is_idle(self):
+        """Никто не ждет лифт, ни один лифт никуда не едет и не везет пассажиров"""
+
+        if len(self.waiting):
+            return False
+
+        return all(x.target is None and x.status == LiftStatus.STOPPED and not x.passengers
+                   for x in self.lifts.values())
+
+    def ticks_to_next_event(self):
+        """Через сколько шагов произойдет ближайшее событие: лифт доедет
+        до назначенного этажа. None, если здание простаивает
+        """
+        ticks = None
+        for lift in self.lifts.values():
+            if lift.target is None:
+                # Остановившийся с пассажирами лифт высадит их на следующем шаге
+                if lift.status == LiftStatus.IN_ACTION or lift.passengers:
+                    return 1
+                continue
+
+            steps = max(lift.steps_to(lift.target), 1)
+            ticks = steps if ticks is None else min(ticks, steps)
+
+        if ticks is None and len(self.waiting):
+            return 1
+
+        return ticks
+
+    def tick(self, steps=1):
+        """Один шаг симуляции всех лифтов здания.
+
+        Лифты сдвигаются сразу на steps шагов, но не дальше назначенного этажа
+        """
+
+        started = monotonic()
+        waiting, dispatcher, publish = self.waiting, self.dispatcher, self.bus.publish
+        spans = self.spans
+        if spans is not None:
+            tick_started = phase = perf_counter_ns()
+
+        dispatcher.assign(self.lifts, waiting)
+        if spans is not None:
+            spans.add('assign', 'tick', phase)
+
+        for lift_id, lift in self.lifts.items():
+            if spans is not None:
+                phase = perf_counter_ns()
+            near = dispatcher.next_floor(lift, waiting)
+            if spans is not None:
+                spans.add('near_floor', 'tick', phase, args={'lift': lift_id})
+
+            if lift.status == LiftStatus.IN_ACTION:
+                cur_floor = lift.floor
+                last_floor = self._floors.get(lift_id)
+                if last_floor != cur_floor:
+                    self._floors[lift_id] = cur_floor
+                    for p in lift.passengers:
+                        p.floor = cur_floor
+
+                    # За один шаг лифт мог проехать несколько этажей,
+                    # о каждом из них сообщается по порядку
+                    for floor in passed_floors(last_floor, cur_floor):
+                        publish(Event(FLOOR_PASSED, lift_id, floor))
+
+                if near is None or cur_floor == near:
+                    lift.stop()
+                    publish(Event(LIFT_STOPPED, lift_id, cur_floor))
+                else:
+                    lift.target = near
+
+            elif lift.status == LiftStatus.STOPPED:
+                self._floors[lift_id] = lift.floor
+                if near is not None and lift.floor == near:
+                    # Сначала высаживаем
+                    if spans is not None:
+                        phase = perf_counter_ns()
+                    dropped = lift.drop_off()
+                    if dropped:
+                        dispatcher.dropped(dropped)
+                        publish(Event(DROP_OFF, lift_id, lift.floor, dropped))
+                    if spans is not None:
+                        spans.add('drop_off', 'tick', phase, args={'lift': lift_id, 'actors': len(dropped)})
+
+                    # Потом забираем, если это необходимо
+                    if spans is not None:
+                        phase = perf_counter_ns()
+                    taken = lift.take_actors(waiting)
+                    if taken:
+                        dispatcher.boarded(taken)
+                        publish(Event(ENTER_LIFT, lift_id, lift.floor, taken))
+                    if spans is not None:
+                        spans.add('boarding', 'tick', phase, args={'lift': lift_id, 'actors': len(taken)})
+
+                    near = dispatcher.next_floor(lift, waiting)
+
+                lift.target = near
+
+        # Все лифты сдвигаются за один шаг движка
+        if spans is not None:
+            phase = perf_counter_ns()
+        self.engine.advance(steps)
+        if spans is not None:
+            spans.add('movement', 'tick', phase, args={'steps': steps})
+            spans.add('tick', 'tick', tick_started, args={'steps': steps})
+
+        self.tick_duration = monotonic() - started
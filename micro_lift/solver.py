@@ -0,0 +1,227 @@
+"""Оптимальное распределение вызовов между лифтами вне петли событий.
+
+Раз в interval секунд решатель снимает с здания задачу: положение,
+направление, свободную грузоподъемность и остановки лифтов и этажи
+вызовов. По ней строится матрица оценок времени обслуживания каждого
+вызова каждым лифтом, и задача о назначениях решается в отдельном
+процессе. Готовый план - этаж вызова -> лифт - передается диспетчеру
+OptimalDispatcher, который пользуется им до прихода следующего.
+
+Если установлен scipy, назначения ищет linear_sum_assignment, иначе
+венгерский алгоритм на чистом Python
+"""
+
+import asyncio
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor, ThreadPoolExecutor
+import multiprocessing
+from time import monotonic, perf_counter
+
+from sanic.log import error_logger
+
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:
+    linear_sum_assignment = None
+
+
+# Оценка для лифта, которому вызов не по силам
+INFEASIBLE = 1e9
+
+
+def snapshot(lifts, waiting, floor_height, loop_delay):
+    """Задача для решателя из простых значений, которые можно передать процессу"""
+
+    rows = []
+    for lift_id, lift in lifts.items():
+        floor, target = lift.floor, lift.target
+        stops = {x.need_floor for x in lift.passengers}
+        if target is not None:
+            stops.add(target)
+
+        direction = 0 if target is None or target == floor else (1 if target > floor else -1)
+        rows.append((lift_id, floor, direction, lift.max_weight - lift.load, tuple(stops),
+                     floor_height / lift.speed * loop_delay))
+
+    return {
+        'lifts': rows,
+        'calls': list(waiting.calls()),
+        'stop_time': loop_delay,
+    }
+
+
+def serve_time(floor, direction, stops, call, floor_time, stop_time):
+    """Оценка времени, через которое лифт доберется до этажа вызова.
+
+    Вызов по ходу движения обслуживается по пути, с остановками перед ним.
+    Вызов позади - после дальней остановки впереди и разворота
+    """
+    if direction == 0 or (call - floor) * direction >= 0:
+        low, high = min(floor, call), max(floor, call)
+        before = sum(1 for x in stops if low <= x < high or high < x <= low)
+        return abs(call - floor) * floor_time + before * stop_time
+
+    ahead = [abs(x - floor) for x in stops if (x - floor) * direction > 0]
+    far = max(ahead, default=0)
+
+    return (2 * far + abs(call - floor)) * floor_time + len(ahead) * stop_time
+
+
+def cost_matrix(problem):
+    """Оценки времени обслуживания: строки - вызовы, столбцы - места в лифтах.
+
+    Чтобы один лифт мог взять несколько вызовов, у каждого лифта есть
+    несколько мест, и каждое следующее стоит на одну остановку дороже
+    """
+    lifts, calls, stop_time = problem['lifts'], problem['calls'], problem['stop_time']
+    slots = len(calls) // max(len(lifts), 1) + 1
+
+    columns = [(inx, slot) for slot in range(slots) for inx in range(len(lifts))]
+    matrix = []
+    for call, weight in calls:
+        row = []
+        for inx, slot in columns:
+            _, floor, direction, free, stops, floor_time = lifts[inx]
+            if free < weight:
+                row.append(INFEASIBLE)
+            else:
+                row.append(serve_time(floor, direction, stops, call, floor_time, stop_time)
+                           + slot * stop_time)
+        matrix.append(row)
+
+    return matrix, columns
+
+
+def hungarian(cost):
+    """Столбец каждой строки при минимальной сумме стоимостей.
+
+    Строк должно быть не больше, чем столбцов. Венгерский алгоритм
+    с потенциалами, O(n^2 m)
+    """
+    n, m = len(cost), len(cost[0])
+    inf = float('inf')
+    u, v = [0.0] * (n + 1), [0.0] * (m + 1)
+    # p[j] - строка, занявшая столбец j; столбцы и строки с единицы
+    p, way = [0] * (m + 1), [0] * (m + 1)
+
+    for i in range(1, n + 1):
+        p[0], j0 = i, 0
+        minv, used = [inf] * (m + 1), [False] * (m + 1)
+        while True:
+            used[j0] = True
+            i0, delta, j1 = p[j0], inf, 0
+            row, ui0 = cost[i0 - 1], u[i0]
+            for j in range(1, m + 1):
+                if not used[j]:
+                    cur = row[j - 1] - ui0 - v[j]
+                    if cur < minv[j]:
+                        minv[j], way[j] = cur, j0
+                    if minv[j] < delta:
+                        delta, j1 = minv[j], j
+
+            for j in range(m + 1):
+                if used[j]:
+                    u[p[j]] += delta
+                    v[j] -= delta
+                else:
+                    minv[j] -= delta
+
+            j0 = j1
+            if p[j0] == 0:
+                break
+
+        while j0:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+
+    result = [None] * n
+    for j in range(1, m + 1):
+        if p[j]:
+            result[p[j] - 1] = j - 1
+
+    return result
+
+
+def solve(problem):
+    """План: этаж вызова -> лифт. Вызовы, которые не по силам ни одному
+    лифту, в план не попадают
+    """
+    if not problem['calls'] or not problem['lifts']:
+        return {}
+
+    matrix, columns = cost_matrix(problem)
+    if linear_sum_assignment is not None:
+        rows, cols = linear_sum_assignment(matrix)
+        assigned = dict(zip(rows.tolist(), cols.tolist()))
+    else:
+        assigned = dict(enumerate(hungarian(matrix)))
+
+    lifts, plan = problem['lifts'], {}
+    for row, col in assigned.items():
+        if matrix[row][col] < INFEASIBLE:
+            plan[problem['calls'][row][0]] = lifts[columns[col][0]][0]
+
+    return plan
+
+
+class PlanSolver:
+    def __init__(self, building, floor_height, loop_delay, interval=1.0, workers=1,
+                 latency=None, trace=None):
+        self._building = building
+        self._trace = trace
+        self._floor_height = floor_height
+        self._loop_delay = loop_delay
+        self._interval = interval
+        self._latency = latency
+        self._workers = workers
+        self._executor = self._create_executor()
+
+    def _create_executor(self):
+        # Демоническому процессу, например владельцу здания в режиме
+        # нескольких процессов, нельзя заводить дочерние процессы
+        if multiprocessing.current_process().daemon:
+            return ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix='solver')
+
+        return ProcessPoolExecutor(max_workers=self._workers)
+
+    def problem(self):
+        building = self._building
+        return snapshot(building.lifts, building.waiting, self._floor_height, self._loop_delay)
+
+    async def solve(self):
+        """Решает задачу текущего состояния здания и передает план диспетчеру"""
+
+        loop = asyncio.get_event_loop()
+        taken, started = monotonic(), perf_counter()
+        plan = await loop.run_in_executor(self._executor, solve, self.problem())
+        latency = perf_counter() - started
+
+        if self._trace is not None:
+            self._trace.plan(plan, latency)
+        self._building.dispatcher.set_plan(plan, taken, latency)
+        if self._latency is not None:
+            self._latency.observe(latency)
+
+        return plan
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self._interval)
+            # Пустое здание не стоит решать, последний план просто устаревает
+            if not len(self._building.waiting):
+                continue
+
+            try:
+                await self.solve()
+            except BrokenExecutor:
+                # Процесс пула умер, например убит по памяти. Сломанный пул
+                # не принимает задач, поэтому заводится новый
+                error_logger.exception('Solver pool is broken, restarting')
+                self._executor.shutdown(wait=False)
+                self._executor = self._create_executor()
+            except Exception:
+                # Диспетчер продолжит работать по прошлому плану
+                error_logger.exception('Failed to solve assignment plan')
+
+    def close(self):
+        self._executor.shutdown(wait=False)
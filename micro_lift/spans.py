@@ -0,0 +1,79 @@
+"""Спаны фаз шага петли лифтов и обработчиков сигналов.
+
+Спан - имя, категория, начало и длительность в наносекундах
+perf_counter_ns. Последние спаны хранятся в кольцевом буфере и выдаются
+в формате Chrome trace (chrome://tracing, ui.perfetto.dev). При
+выключенных спанах в контексте лежит None, и горячие пути проверяют
+только это
+"""
+
+from collections import deque
+import os
+from time import perf_counter_ns
+
+
+# Поток петли лифтов на временной шкале. Сигналы соединения рисуются
+# отдельной строкой с номером id сокета
+LOOP = 0
+
+
+class SpanBuffer:
+    def __init__(self, size=65536):
+        self._spans = deque(maxlen=size)
+        self._pid = os.getpid()
+
+    def __len__(self):
+        return len(self._spans)
+
+    def add(self, name, cat, started, ws=None, args=None):
+        """Спан от started до текущего момента в строке петли или сокета ws"""
+
+        tid = LOOP if ws is None else id(ws)
+        self._spans.append((name, cat, started, perf_counter_ns() - started, tid, args))
+
+    def codec(self, codec, ws):
+        return SpanCodec(codec, self, ws)
+
+    def export(self):
+        """Буфер в формате Chrome trace"""
+
+        pid = self._pid
+        events = [{
+            'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': LOOP,
+            'args': {'name': 'lift_loop'},
+        }]
+        for name, cat, started, duration, tid, args in self._spans:
+            event = {
+                'name': name, 'cat': cat, 'ph': 'X', 'pid': pid, 'tid': tid,
+                'ts': started / 1000.0, 'dur': duration / 1000.0,
+            }
+            if args:
+                event['args'] = args
+            events.append(event)
+
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+class SpanCodec:
+    """Кодек соединения, записывающий каждую сериализацию спаном"""
+
+    def __init__(self, codec, spans, ws):
+        self._codec = codec
+        self._spans = spans
+        self._ws = ws
+
+    def __getattr__(self, name):
+        attr = getattr(self._codec, name)
+        if not callable(attr):
+            return attr
+
+        spans, ws = self._spans, self._ws
+
+        def call(*args, **kwargs):
+            started = perf_counter_ns()
+            try:
+                return attr(*args, **kwargs)
+            finally:
+                spans.add(name, 'codec', started, ws)
+
+        return call
@@ -0,0 +1,366 @@
+"""Компактное хранилище акторов в виде структуры массивов.
+
+Поля всех акторов лежат в типизированных массивах, по одному на поле,
+а не в отдельных объектах со своим __dict__, Enum и datetime. Объект
+актора - легкий посредник с __slots__, знающий лишь хранилище и номер
+ячейки, поэтому поля актора занимают несколько десятков байт. Еще около
+сотни байт приходится на строку uid и ее запись в словаре ячеек
+"""
+
+from array import array
+from datetime import datetime as dt
+from time import time
+
+from models import ActorStatus, BaseActor
+
+
+_STATUSES = tuple(ActorStatus)
+
+# Значения массивов, означающие отсутствие значения
+NO_FLOOR, NO_LIFT, NO_TIME = 0, -1, -1.0
+
+# Массивы, которые сохраняются на диск. Время вызова и посадки отсчитывается
+# по монотонным часам процесса и после перезапуска теряет смысл
+PERSISTED = ('_weight', '_floor', '_need_floor', '_status', '_timestamp', '_lift')
+
+
+class RemovedActor(Exception):
+    def __init__(self, message='Actor was removed from the store'):
+        super().__init__(message)
+
+
+class StoredActor(BaseActor):
+    """Актор, чье состояние хранится в массивах ActorStore.
+
+    Закрытые атрибуты BaseActor отображены на ячейки массивов, поэтому
+    весь интерфейс Actor продолжает работать без изменений. Посредники
+    одной ячейки равны между собой и взаимозаменяемы.
+
+    Посредник помнит поколение ячейки: после удаления актора ячейка
+    достается новому, и обращение через старый посредник поднимает
+    RemovedActor, а не читает и не меняет чужого актора
+    """
+
+    __slots__ = ('_store', '_inx', '_gen')
+
+    def __init__(self, store, slot):
+        self._store = store
+        self._inx = slot
+        self._gen = store._gens[slot]
+
+    def __eq__(self, other):
+        return isinstance(other, StoredActor) and self._inx == other._inx and \
+            self._gen == other._gen and self._store is other._store
+
+    def __hash__(self):
+        return hash(self._inx)
+
+    def __repr__(self):
+        if self._store._gens[self._inx] != self._gen:
+            return 'StoredActor(<removed>)'
+        return f'StoredActor({self._uid!r})'
+
+    @property
+    def _slot(self):
+        if self._store._gens[self._inx] != self._gen:
+            raise RemovedActor()
+        return self._inx
+
+    @property
+    def _uid(self):
+        return self._store._uids[self._slot]
+
+    @property
+    def _weight(self):
+        return self._store._weight[self._slot]
+
+    @property
+    def _floor(self):
+        return self._store._floor[self._slot]
+
+    @_floor.setter
+    def _floor(self, floor):
+        self._store._floor[self._slot] = floor
+
+    @property
+    def _need_floor(self):
+        floor = self._store._need_floor[self._slot]
+        return floor if floor != NO_FLOOR else None
+
+    @_need_floor.setter
+    def _need_floor(self, floor):
+        self._store._need_floor[self._slot] = NO_FLOOR if floor is None else floor
+
+    @property
+    def _status(self):
+        return _STATUSES[self._store._status[self._slot]]
+
+    @_status.setter
+    def _status(self, status):
+        self._store._status[self._slot] = status.value
+
+    @property
+    def _timestamp(self):
+        return dt.utcfromtimestamp(self._store._timestamp[self._slot])
+
+    @property
+    def _called_at(self):
+        value = self._store._called_at[self._slot]
+        return value if value != NO_TIME else None
+
+    @_called_at.setter
+    def _called_at(self, value):
+        self._store._called_at[self._slot] = NO_TIME if value is None else value
+
+    @property
+    def _entered_at(self):
+        value = self._store._entered_at[self._slot]
+        return value if value != NO_TIME else None
+
+    @_entered_at.setter
+    def _entered_at(self, value):
+        self._store._entered_at[self._slot] = NO_TIME if value is None else value
+
+    @property
+    def _lift_id(self):
+        inx = self._store._lift[self._slot]
+        return self._store._lift_ids[inx] if inx != NO_LIFT else None
+
+    @_lift_id.setter
+    def _lift_id(self, lift_id):
+        self._store._lift[self._slot] = self._store._intern_lift(lift_id)
+
+    @property
+    def _room(self):
+        return self._store.room
+
+    def snapshot(self, encoder):
+        snapshots = self._store._snapshots
+        cache = snapshots.get(self._slot)
+        if cache is None:
+            cache = snapshots[self._slot] = {}
+
+        raw = cache.get(encoder)
+        if raw is None:
+            raw = cache[encoder] = encoder(self)
+
+        return raw
+
+    def watch(self, callback):
+        self._store.watch(callback)
+
+    def unwatch(self, callback):
+        self._store.unwatch(callback)
+
+    def _touch(self):
+        store = self._store
+        store._snapshots.pop(self._slot, None)
+        for callback in store._watchers:
+            callback(self)
+
+
+class ActorStore:
+    """Акторы здания в типизированных массивах.
+
+    Ведет себя как словарь uid -> актор. Освободившиеся ячейки
+    переиспользуются новыми акторами. Наблюдатели общие для всего
+    хранилища: функция, переданная watch любого актора, вызывается при
+    изменении каждого из них
+    """
+
+    def __init__(self, room=None):
+        self.room = room
+
+        self._uids = []
+        self._slots = {}
+        self._free = []
+        # Поколение ячейки растет при каждом удалении ее актора
+        self._gens = array('I')
+
+        self._weight = array('d')
+        self._floor = array('i')
+        self._need_floor = array('i')
+        self._status = array('b')
+        self._timestamp = array('d')
+        self._called_at = array('d')
+        self._entered_at = array('d')
+        self._lift = array('i')
+
+        self._lift_ids = []
+        self._lift_inx = {}
+        self._snapshots = {}
+        # Наблюдатель -> число акторов, через которых он подписан
+        self._watchers = {}
+        self._listeners = []
+
+    def add(self, uid, weight):
+        """Создает актора в режиме бездействия на первом этаже"""
+
+        if uid in self._slots:
+            raise KeyError(f'Actor {uid} already exists')
+
+        values = (weight, 1, NO_FLOOR, ActorStatus.IDLE.value, time(), NO_TIME, NO_TIME, NO_LIFT)
+        columns = (self._weight, self._floor, self._need_floor, self._status,
+                   self._timestamp, self._called_at, self._entered_at, self._lift)
+        if self._free:
+            slot = self._free.pop()
+            self._uids[slot] = uid
+            for column, value in zip(columns, values):
+                column[slot] = value
+        else:
+            slot = len(self._uids)
+            self._uids.append(uid)
+            self._gens.append(0)
+            for column, value in zip(columns, values):
+                column.append(value)
+
+        self._slots[uid] = slot
+
+        actor = StoredActor(self, slot)
+        for callback in self._listeners:
+            callback(uid, actor)
+
+        return actor
+
+    def get(self, uid, default=None):
+        slot = self._slots.get(uid)
+        return StoredActor(self, slot) if slot is not None else default
+
+    def __getitem__(self, uid):
+        return StoredActor(self, self._slots[uid])
+
+    def __delitem__(self, uid):
+        slot = self._slots.pop(uid)
+        if self.room is not None:
+            self.room.discard(StoredActor(self, slot))
+
+        self._uids[slot] = None
+        self._gens[slot] += 1
+        self._snapshots.pop(slot, None)
+        self._free.append(slot)
+
+        for callback in self._listeners:
+            callback(uid, None)
+
+    def __contains__(self, uid):
+        return uid in self._slots
+
+    def slot(self, uid):
+        """Номер ячейки актора или None"""
+
+        return self._slots.get(uid)
+
+    def at(self, slot):
+        """Актор в ячейке slot"""
+
+        return StoredActor(self, slot)
+
+    def __len__(self):
+        return len(self._slots)
+
+    def __iter__(self):
+        return iter(self._slots)
+
+    def keys(self):
+        return self._slots.keys()
+
+    def values(self):
+        for slot in self._slots.values():
+            yield StoredActor(self, slot)
+
+    def items(self):
+        for uid, slot in self._slots.items():
+            yield uid, StoredActor(self, slot)
+
+    def listen(self, callback):
+        """Регистрирует функцию, вызываемую с uid и актором при добавлении
+        актора и с uid и None при удалении
+        """
+        self._listeners.append(callback)
+
+    def row(self, uid):
+        """Сохраняемые поля актора"""
+
+        slot = self._slots[uid]
+        lift = self._lift[slot]
+        return [self._weight[slot], self._floor[slot], self._need_floor[slot],
+                self._status[slot], self._timestamp[slot],
+                self._lift_ids[lift] if lift != NO_LIFT else None]
+
+    def put(self, uid, row):
+        """Записывает поля, полученные методом row, создавая актора при необходимости"""
+
+        actor = self.get(uid)
+        if actor is None:
+            actor = self.add(uid, row[0])
+
+        slot = actor._slot
+        self._weight[slot], self._floor[slot], self._need_floor[slot], \
+            self._status[slot], self._timestamp[slot] = row[:5]
+        self._lift[slot] = self._intern_lift(row[5])
+        self._snapshots.pop(slot, None)
+
+        return actor
+
+    def dump(self):
+        """Копия сохраняемых массивов: uid по ячейкам, id лифтов и байты массивов"""
+
+        columns = {x: getattr(self, x).tobytes() for x in PERSISTED}
+        return list(self._uids), list(self._lift_ids), columns
+
+    def load(self, uids, lift_ids, columns):
+        """Заменяет содержимое хранилища данными, полученными методом dump"""
+
+        self._uids = list(uids)
+        self._slots = {uid: slot for slot, uid in enumerate(uids) if uid is not None}
+        self._free = [slot for slot, uid in enumerate(uids) if uid is None]
+        # Посредники, выданные до загрузки, устаревают
+        generation = max(self._gens, default=-1) + 1
+        self._gens = array('I', [generation]) * len(uids)
+        self._lift_ids = list(lift_ids)
+        self._lift_inx = {x: inx for inx, x in enumerate(lift_ids)}
+        self._snapshots = {}
+
+        for name in PERSISTED:
+            column = array(getattr(self, name).typecode)
+            column.frombytes(columns[name])
+            setattr(self, name, column)
+
+        self._called_at = array('d', [NO_TIME]) * len(uids)
+        self._entered_at = array('d', [NO_TIME]) * len(uids)
+
+    def waiting(self):
+        """Акторы, ожидающие лифт"""
+
+        code = ActorStatus.EXPECT.value
+        for uid, slot in self._slots.items():
+            if self._status[slot] == code:
+                yield StoredActor(self, slot)
+
+    def watch(self, callback):
+        self._watchers[callback] = self._watchers.get(callback, 0) + 1
+
+    def unwatch(self, callback):
+        count = self._watchers.get(callback, 0) - 1
+        if count > 0:
+            self._watchers[callback] = count
+        else:
+            self._watchers.pop(callback, None)
+
+    def nbytes(self):
+        """Объем массивов полей в байтах"""
+
+        columns = (self._weight, self._floor, self._need_floor, self._status,
+                   self._timestamp, self._called_at, self._entered_at, self._lift)
+        return sum(len(x) * x.itemsize for x in columns)
+
+    def _intern_lift(self, lift_id):
+        if lift_id is None:
+            return NO_LIFT
+
+        inx = self._lift_inx.get(lift_id)
+        if inx is None:
+            inx = self._lift_inx[lift_id] = len(self._lift_ids)
+            self._lift_ids.append(lift_id)
+
+        return inx
@@ -0,0 +1,215 @@
+"""Подписки клиентов на изменения состояния лифтов, этажей и акторов"""
+
+import asyncio
+from time import monotonic, perf_counter_ns
+
+from codec import JSON
+from serializers import encode_actor, encode_lift
+
+
+class Subscription:
+    """Подписка одного сокета на тему.
+
+    Хранит последнее отправленное клиенту состояние каждого объекта, чтобы
+    слать только изменившиеся поля, идентификаторы объектов, изменившихся
+    с прошлой отправки, и время, раньше которого следующее обновление
+    отправлять нельзя
+    """
+
+    def __init__(self, ws, topic, ids, rate):
+        self.ws = ws
+        self.topic = topic
+        self.ids = None if ids is None else set(ids)
+        self.interval = 1.0 / rate
+        self.next_at = 0.0
+        self.sent = {}
+        # None - нужно сверить все объекты темы
+        self.pending = None
+
+    def mark(self, changed):
+        """Запоминает изменившиеся объекты темы. changed равен None,
+        если тема не отслеживает изменения
+        """
+        if self.pending is None:
+            return
+        if changed is None:
+            self.pending = None
+            return
+
+        ids = self.ids
+        if ids is None:
+            self.pending |= changed
+        elif len(ids) < len(changed):
+            self.pending.update(x for x in ids if x in changed)
+        else:
+            self.pending.update(x for x in changed if x in ids)
+
+    def delta(self, state, everything):
+        """Изменившиеся поля объектов и идентификаторы исчезнувших объектов.
+
+        Сверяются только объекты, изменившиеся с прошлой отправки.
+        state возвращает состояние объекта или None, если объекта нет,
+        everything - идентификаторы всех объектов темы
+        """
+        pending, self.pending = self.pending, set()
+        changes, removed, sent = {}, [], self.sent
+        if pending is None:
+            pending = set(everything() if self.ids is None else self.ids)
+            pending.update(sent)
+
+        for id in pending:
+            cur = state(id)
+            if cur is None:
+                if sent.pop(id, None) is not None:
+                    removed.append(id)
+                continue
+
+            last = sent.get(id)
+            if last is None:
+                changes[id] = cur
+            else:
+                fields = {k: v for k, v in cur.items() if last.get(k) != v}
+                if fields:
+                    changes[id] = fields
+
+            sent[id] = cur
+
+        return changes, removed
+
+
+class SubscriptionHub:
+    """Рассылает подписчикам обновления не чаще раза за шаг симуляции
+    и не чаще, чем выбрал сам клиент. Все изменения между отправками
+    сливаются в одно обновление.
+
+    Пока у лифтов или акторов есть подписчики, хаб собирает идентификаторы
+    изменившихся объектов через Snapshot.watch и кодирует только их
+    """
+
+    def __init__(self, ctx, period):
+        self._ctx = ctx
+        self._period = period
+        self._subs = {}
+        self._active = None
+        # Тема -> идентификаторы объектов, изменившихся с прошлой рассылки
+        self._changed = {}
+        self._watched = set()
+
+    def subscribe(self, ws, topic, ids=None, rate=1.0):
+        self._subs[(ws, topic)] = Subscription(ws, topic, ids, rate)
+        if topic in ('lifts', 'actors') and topic not in self._changed:
+            self._track(topic)
+        if self._active is not None:
+            self._active.set()
+
+    def unsubscribe(self, ws, topic):
+        if self._subs.pop((ws, topic), None) is None:
+            return False
+
+        self._untrack()
+        return True
+
+    def discard(self, ws):
+        """Убирает все подписки сокета"""
+
+        for key in [x for x in self._subs if x[0] is ws]:
+            del self._subs[key]
+        self._untrack()
+
+    def states(self, topic):
+        """Текущее состояние объектов темы: функция id -> состояние или None
+        и функция, перечисляющая идентификаторы всех объектов.
+        Объекты кодируются при первом обращении
+        """
+        ctx = self._ctx
+        if topic == 'lifts':
+            objects, encode = ctx.lifts, encode_lift
+        elif topic == 'actors':
+            objects, encode = ctx.actors, encode_actor
+        else:
+            floors = {str(floor): {'waiting': count} for floor, count in ctx.waiting.counts()}
+            return floors.get, floors.keys
+
+        cache = {}
+
+        def state(id):
+            if id in cache:
+                return cache[id]
+
+            obj = objects.get(id)
+            value = cache[id] = None if obj is None else encode(obj)
+            return value
+
+        return state, objects.keys
+
+    def flush(self, now=None):
+        """Отправляет обновления подписчикам, у которых подошло время"""
+
+        now = monotonic() if now is None else now
+        states, broadcaster, codecs = {}, self._ctx.broadcaster, self._ctx.codecs
+        changed = self._changed
+        self._changed = {x: set() for x in changed}
+        spans = self._ctx.spans
+        if spans is not None:
+            started = perf_counter_ns()
+        for sub in list(self._subs.values()):
+            sub.mark(changed.get(sub.topic))
+            if sub.next_at > now:
+                continue
+
+            if sub.topic not in states:
+                states[sub.topic] = self.states(sub.topic)
+
+            changes, removed = sub.delta(*states[sub.topic])
+            if changes or removed:
+                sub.next_at = now + sub.interval
+                codec = codecs.get(sub.ws, JSON)
+                broadcaster.outbox(sub.ws).put(codec.update(sub.topic, changes, removed))
+
+        if spans is not None:
+            spans.add('subscriptions', 'fanout', started, args={'topics': len(states)})
+
+    async def run(self):
+        self._active = asyncio.Event()
+        while True:
+            if not self._subs:
+                self._active.clear()
+                await self._active.wait()
+
+            self.flush()
+            await asyncio.sleep(self._period)
+
+    def _track(self, topic):
+        self._changed[topic] = set()
+        if topic in self._watched:
+            return
+
+        self._watched.add(topic)
+        ctx = self._ctx
+        if topic == 'lifts':
+            for lift in ctx.lifts.values():
+                lift.watch(self._lift_changed)
+        else:
+            # Наблюдатель хранилища общий для всех акторов
+            ctx.actors.watch(self._actor_changed)
+            ctx.actors.listen(self._actor_listed)
+
+    def _untrack(self):
+        """Перестает собирать изменения тем, на которые никто не подписан"""
+
+        topics = {x[1] for x in self._subs}
+        for topic in [x for x in self._changed if x not in topics]:
+            del self._changed[topic]
+
+    def _lift_changed(self, lift):
+        changed = self._changed.get('lifts')
+        if changed is not None:
+            changed.add(lift.id)
+
+    def _actor_changed(self, actor):
+        self._actor_listed(actor.uid)
+
+    def _actor_listed(self, uid, actor=None):
+        changed = self._changed.get('actors')
+        if changed is not None:
+            changed.add(uid)
@@ -1,13 +1,17 @@
 import asyncio
-from datetime import datetime as dt
 from functools import wraps
+import hmac
+from time import monotonic, perf_counter, perf_counter_ns
 
 from marshmallow.exceptions import ValidationError
-import ujson
-
-from auth import is_expired_token, is_valid_auth
-from models import Actor, ActorStatus, LiftStatus
-from schema import with_schema
+from sanic import response
+
+from auth import is_expired_token
+from codec import JSON, UnknownCodec, negotiate
+from events import DROP_OFF, ENTER_LIFT
+from interests import FLOOR, LIFT, lift_topic
+from metrics import CONTENT_TYPE
+from schema import SchemaLoader, with_schema
 import schema as sc
 
 
@@ -34,9 +38,16 @@ class TokenExpired(Exception):
         super().__init__(message, *args, **kwargs)
 
 
+class StopSession(Exception):
+    """Обработка сообщений соединения прекращается, клиенту уже ответили"""
+
+
 class LiftApp:
     def __init__(self, app):
         self.app = app
+        self._incoming = SchemaLoader(sc.IncomingSchema)
+        # Ответы сигналов, выполняемых в составе пакета, по сокетам
+        self._batches = {}
 
         self._ROUTES = {
             'auth': self._auth_actor,
@@ -44,59 +55,140 @@ class LiftApp:
             'actor_list': self._actor_list,
             'actor_idle': self._actor_idle,
             'actor_expect': self._actor_expect,
+            'dispatch_stats': self._dispatch_stats,
+            'subscribe': self._subscribe,
+            'unsubscribe': self._unsubscribe,
+            'watch': self._watch,
+            'unwatch': self._unwatch,
+            'batch': self._batch,
+            'resume': self._resume,
+            'connection_stats': self._connection_stats,
         }
 
     def route(self, signal):
         return self._ROUTES.get(signal)
 
     def authenticate(self, data):
-        uid, conf, actor = data['uid'], self.app.config, None
-        ctx = self.app.ctx
+        conf, trace = self.app.config, self.app.ctx.trace
 
-        token_timestamp = dt.strptime(data['timestamp'], conf['DATETIME_FORMAT'])
-        if is_expired_token(token_timestamp, conf['AUTH_TOKEN_DELAY']):
+        # Штамп уже разобран при валидации схемой AuthSchema
+        if is_expired_token(data['timestamp'].value, conf['AUTH_TOKEN_DELAY']):
+            if trace is not None:
+                trace.auth(data['uid'], False, expired=True)
             raise TokenExpired
 
-        actor = None
-        if is_valid_auth(data, conf['SECRET_KEY']):
-            actor = ctx.actors.get(uid)
-            if not actor:
-                actor = Actor(uid, data['weight'])
+        granted = self.app.ctx.auth.verify(data['uid'], data['timestamp'], data['token'])
+        if trace is not None:
+            trace.auth(data['uid'], granted)
 
-        return actor
+        return granted
 
     async def entry_point(self, request, ws):
+        lifecycle, trace = self.app.ctx.lifecycle, self.app.ctx.trace
 
-        while True:
-            msg = await ws.recv()
-            try:
-                data = ujson.loads(msg)
-                # Предварительная валидация сообщения в соответствии с протоколом
-                valid_data = sc.IncomingSchema().load(data)
-            except ValueError as e:
-                await ws.send(self._error('invalid', None, 400, str(e)))
-                continue
-            except ValidationError as e:
-                await ws.send(self._error('invalid', data.get(id), 400, str(e)))
-                continue
-
-            signal, id = valid_data['signal'], valid_data['id']
-            try:
-                handler = self.route(signal)
-                if handler is None:
-                    await ws.send(self._error(signal, id, 404, str('Signal not found!')))
-                    continue
-
-                await handler(signal, id, data['data'], request, ws)
-            except AuthRequired as e:
-                await ws.send(self._error(signal, id, 401, str(e)))
-                continue
-            except TokenExpired as e:
-                await ws.send(self._error(signal, id, 403, str(e)))
-                continue
-            except Exception as e:
-                await ws.send(self._error(signal, id, 400, str(e)))
-                break
+        try:
+            codec = negotiate(request, ws)
+        except UnknownCodec as e:
+            await ws.send(JSON.error('connect', None, 400, str(e)))
+            await ws.close()
+            return
+
+        lifecycle.connect(ws, codec)
+        if trace is not None:
+            trace.connect(ws, codec)
+        try:
+            while await self.handle(request, ws, codec, await ws.recv()):
+                pass
+        finally:
+            if trace is not None:
+                trace.disconnect(ws)
+            lifecycle.disconnect(ws)
+
+    async def metrics(self, request):
+        """Метрики сервера в текстовом формате Prometheus"""
+        return response.text(self.app.ctx.metrics.render(), content_type=CONTENT_TYPE)
+
+    async def spans(self, request):
+        """Последние спаны в формате Chrome trace. Адрес закрыт токеном
+        администратора SPANS.TOKEN, без токена в конфигурации он выключен
+        """
+        spans, token = self.app.ctx.spans, self.app.config['SPANS']['TOKEN']
+        if spans is None or token is None:
+            return response.json({'message': 'Spans are disabled'}, status=404)
+
+        given = request.headers.get('authorization', '')
+        if not hmac.compare_digest(given.encode('utf-8'), f'Bearer {token}'.encode('utf-8')):
+            return response.json({'message': str(AuthRequired())}, status=401)
+
+        return response.json(spans.export())
+
+    async def handle(self, request, ws, codec, msg):
+        """Обрабатывает одно сообщение клиента. Возвращает False, если
+        соединение больше не обслуживается
+        """
+        ctx = self.app.ctx
+        if ctx.trace is not None:
+            ctx.trace.message(ws, msg)
+
+        try:
+            data = codec.loads(msg)
+            # Предварительная валидация сообщения в соответствии с протоколом
+            valid_data = self._incoming.load(data)
+        except ValueError as e:
+            ctx.metrics.validation_failures.labels('decode').inc()
+            await self._reply(ws, codec.error('invalid', None, 400, str(e)))
+            return True
+        except ValidationError as e:
+            ctx.metrics.validation_failures.labels('message').inc()
+            id = data.get('id') if isinstance(data, dict) else None
+            await self._reply(ws, codec.error('invalid', id, 400, str(e)))
+            return True
+
+        return await self._dispatch(valid_data['signal'], valid_data['id'], data['data'], request, ws)
+
+    async def _dispatch(self, signal, id, data, request, ws):
+        """Выполняет сигнал. Возвращает False, если после ошибки соединение
+        больше не обслуживается
+        """
+        codec, metrics, spans = self._codec(ws), self.app.ctx.metrics, self.app.ctx.spans
+        handler = self.route(signal)
+        if handler is None:
+            await self._reply(ws, codec.error(signal, id, 404, str('Signal not found!')))
+            return True
+
+        if spans is not None:
+            span_started = perf_counter_ns()
+        started = perf_counter()
+        try:
+            await handler(signal, id, data, request, ws)
+        except AuthRequired as e:
+            await self._reply(ws, codec.error(signal, id, 401, str(e)))
+        except TokenExpired as e:
+            await self._reply(ws, codec.error(signal, id, 403, str(e)))
+        except StopSession:
+            return False
+        except ValidationError as e:
+            metrics.validation_failures.labels('signal').inc()
+            await self._reply(ws, codec.error(signal, id, 400, str(e)))
+            return False
+        except Exception as e:
+            await self._reply(ws, codec.error(signal, id, 400, str(e)))
+            return False
+        finally:
+            metrics.signal_duration.labels(signal).observe(perf_counter() - started)
+            if spans is not None:
+                spans.add(signal, 'signal', span_started, ws)
+
+        return True
+
+    async def _reply(self, ws, frame):
+        """Отправляет ответ клиенту или откладывает его до ответа на пакет"""
+
+        batch = self._batches.get(ws)
+        if batch is None:
+            await ws.send(frame)
+        else:
+            batch.append(frame)
 
     @with_schema(sc.AuthSchema)
     async def _auth_actor(self, signal, id, data, req, ws):
@@ -104,137 +196,266 @@ class LiftApp:
 
         uid, ctx = data['uid'], self.app.ctx
         conf = self.app.config
-        sockets = ctx.sockets
-
-        actor = self.authenticate(data)
-        if actor:
-            if actor.weight > conf['LIFT']['MAX_WEIGHT']:
-                await ws.send(self._error(signal, id, 400, 'Actor overweight!'))
-                return
-
-            ctx.actors[uid] = actor
-            ctx.by_ws[ws] = actor
-
-            if uid in sockets and sockets[uid]:
-                sockets[uid].add(ws)
-            else:
-                sockets[uid] = {ws}
-
-            await self._send_broadcast(
-                self._notify('actor_arrive', sc.Actor().dump(actor)),
-                exclude={uid}
-            )
-            await ws.send(self._response(signal, id, sc.Actor().dump(actor)))
+        codec = self._codec(ws)
+
+        if self.authenticate(data):
+            actor = ctx.actors.get(uid)
+            if actor is None:
+                if data['weight'] > conf['LIFT']['MAX_WEIGHT']:
+                    await self._reply(ws, codec.error(signal, id, 400, 'Actor overweight!'))
+                    return
+
+                if not ctx.lifecycle.admit():
+                    await self._reply(ws, codec.error(signal, id, 503, 'Too many actors'))
+                    return
+
+                actor = ctx.actors.add(uid, data['weight'])
+                ctx.actor_index.add(actor)
+
+            ctx.lifecycle.attach(ws, actor)
+
+            ctx.interests.arrive(actor)
+            await self._reply(ws, codec.raw_response(
+                signal, id, codec.actor(actor), ticket=ctx.tickets.issue(uid)))
         else:
-            await ws.send(self._error(signal, id, 403, 'Forbidden request'))
+            await self._reply(ws, codec.error(signal, id, 403, 'Forbidden request'))
             await ws.close()
 
+    @with_schema(sc.ResumeSchema)
+    async def _resume(self, signal, id, data, req, ws):
+        """Возвращает сокет к уже аутентифицированному актору по билету"""
+
+        ctx, codec = self.app.ctx, self._codec(ws)
+        uid = ctx.tickets.resolve(data['ticket'])
+        if ctx.trace is not None:
+            ctx.trace.resume(data['ticket'], uid)
+        actor = ctx.actors.get(uid) if uid is not None else None
+        if actor is None:
+            await self._reply(ws, codec.error(signal, id, 403, 'Invalid ticket'))
+            return
+
+        ctx.lifecycle.attach(ws, actor)
+        await self._reply(ws, codec.raw_response(
+            signal, id, codec.actor(actor), ticket=ctx.tickets.issue(uid)))
+
     @auth_required
     @with_schema(sc.LiftListSchema)
     async def _lift_list(self, signal, id,  data, req, ws):
         """Выводит список всех лифтов в здании"""
 
-        lifts = list(self.app.ctx.lifts.values())
-        await ws.send(self._response(
-            signal, id, sc.Lift().dump(lifts[:data['count']], many=True)))
+        lifts, cursor = self.app.ctx.lift_index.page(
+            data['count'],
+            self._filters(data, ('status', 'floor')),
+            self._cursor(data)
+        )
+        codec = self._codec(ws)
+        await self._reply(ws, codec.raw_response(
+            signal, id, codec.lifts(lifts), cursor=self._next_cursor(cursor)))
 
     @auth_required
     @with_schema(sc.ActorListSchema)
     async def _actor_list(self, signal, id, data, req, ws):
         """Выводит список всех подключенных акторов"""
 
-        actors = list(self.app.ctx.actors.values())
-        await ws.send(self._response(
-            signal, id, sc.Actor().dump(actors[:data['count']], many=True)))
+        ranges = None
+        if data['weight_min'] is not None or data['weight_max'] is not None:
+            ranges = {'weight': (data['weight_min'], data['weight_max'])}
+
+        actors, cursor = self.app.ctx.actor_index.page(
+            data['count'],
+            self._filters(data, ('status', 'floor', 'need_floor', 'lift')),
+            self._cursor(data),
+            ranges
+        )
+        codec = self._codec(ws)
+        await self._reply(ws, codec.raw_response(
+            signal, id, codec.actors(actors), cursor=self._next_cursor(cursor)))
 
     @auth_required
     async def _actor_idle(self, signal, id, data, req, ws):
         """Переводит актора в режим бездействия"""
 
-        actor = self.app.ctx.by_ws.get(ws)
+        actor, codec = self.app.ctx.by_ws.get(ws), self._codec(ws)
         actor.idle()
 
-        await ws.send(self._response(signal, id, sc.Actor().dump(actor)))
+        await self._reply(ws, codec.raw_response(signal, id, codec.actor(actor)))
 
     @auth_required
     @with_schema(sc.ActorExpectSchema)
     async def _actor_expect(self, signal, id, data, req, ws):
         """Устанавливает желаемый этаж для поездки актору"""
-        actor = self.app.ctx.by_ws.get(ws)
+        actor, codec = self.app.ctx.by_ws.get(ws), self._codec(ws)
         actor.wait_lift(data['floor'])
 
-        await ws.send(self._response(signal, id, sc.Actor().dump(actor)))
+        await self._reply(ws, codec.raw_response(signal, id, codec.actor(actor)))
+
+    @auth_required
+    async def _dispatch_stats(self, signal, id, data, req, ws):
+        """Статистика ожидания и поездок для текущей стратегии диспетчеризации"""
+
+        stats = self.app.ctx.building.dispatcher.stats()
+        await self._reply(ws, self._codec(ws).response(signal, id, stats))
+
+    @auth_required
+    async def _connection_stats(self, signal, id, data, req, ws):
+        """Число соединений и акторов, отключений и вытесненных акторов"""
+
+        await self._reply(ws, self._codec(ws).response(signal, id, self.app.ctx.lifecycle.stats()))
+
+    @auth_required
+    @with_schema(sc.SubscribeSchema)
+    async def _subscribe(self, signal, id, data, req, ws):
+        """Подписывает клиента на обновления лифтов, этажей или акторов"""
+
+        self.app.ctx.subscriptions.subscribe(ws, data['topic'], data['ids'], data['rate'])
+        await self._reply(ws, self._codec(ws).response(signal, id, data))
+
+    @auth_required
+    @with_schema(sc.UnsubscribeSchema)
+    async def _unsubscribe(self, signal, id, data, req, ws):
+        """Отменяет подписку клиента на обновления"""
+
+        self.app.ctx.subscriptions.unsubscribe(ws, data['topic'])
+        await self._reply(ws, self._codec(ws).response(signal, id, data))
+
+    @auth_required
+    @with_schema(sc.WatchSchema)
+    async def _watch(self, signal, id, data, req, ws):
+        """Присылает клиенту уведомления этажа или лифта, даже если
+        он не ждет на этом этаже и не едет в этом лифте
+        """
+        ctx, codec = self.app.ctx, self._codec(ws)
+        kind, _, key = data['topic'].partition(':')
+        if kind == FLOOR and int(key) > self.app.config['FLOOR']['COUNT'] or \
+                kind == LIFT and key not in ctx.lifts:
+            await self._reply(ws, codec.error(signal, id, 404, 'Unknown topic'))
+            return
+
+        if not ctx.interests.watch(ws, data['topic']):
+            await self._reply(ws, codec.error(signal, id, 400, 'Too many watched topics'))
+            return
+
+        await self._reply(ws, codec.response(signal, id, data))
+
+    @auth_required
+    @with_schema(sc.WatchSchema)
+    async def _unwatch(self, signal, id, data, req, ws):
+        self.app.ctx.interests.unwatch(ws, data['topic'])
+        await self._reply(ws, self._codec(ws).response(signal, id, data))
+
+    @with_schema(sc.BatchSchema)
+    async def _batch(self, signal, id, data, req, ws):
+        """Выполняет пакет сигналов и отвечает на все одним кадром.
+
+        Каждый сигнал пакета обрабатывается так же, как отдельное сообщение:
+        ошибка в нем попадает в его ответ и не мешает остальным. Ошибка,
+        после которой отдельное сообщение закрыло бы сессию, прерывает пакет
+        """
+        codec, incoming = self._codec(ws), self._incoming
+        frames = self._batches[ws] = []
+        alive = True
+        try:
+            for item in data['requests']:
+                try:
+                    valid_data = incoming.load(item)
+                except ValidationError as e:
+                    self.app.ctx.metrics.validation_failures.labels('message').inc()
+                    frames.append(codec.error('invalid', item.get('id'), 400, str(e)))
+                    continue
+
+                if valid_data['signal'] == signal:
+                    frames.append(codec.error(signal, valid_data['id'], 400, 'Nested batch is not allowed'))
+                    continue
+
+                alive = await self._dispatch(valid_data['signal'], valid_data['id'], item['data'], req, ws)
+                if not alive:
+                    break
+        finally:
+            del self._batches[ws]
+
+        await ws.send(codec.raw_response(signal, id, codec.join(frames)))
+        if not alive:
+            raise StopSession
 
     async def lift_loop(self, app):
         """Петля действий для лифта"""
         delay = app.config['LOOP_DELAY']
-        actors = app.ctx.actors.values()
-
+        building, metrics, trace = app.ctx.building, app.ctx.metrics, app.ctx.trace
+
+        building.bus.subscribe(self._deliver, kinds={DROP_OFF, ENTER_LIFT})
+        asyncio.ensure_future(app.ctx.subscriptions.run())
+        asyncio.ensure_future(app.ctx.lifecycle.run())
+        asyncio.ensure_future(app.ctx.interests.run())
+        if app.ctx.persistence is not None:
+            asyncio.ensure_future(app.ctx.persistence.run())
+        if trace is not None:
+            asyncio.ensure_future(trace.run())
+        if app.ctx.solver is not None:
+            asyncio.ensure_future(app.ctx.solver.run())
+
+        # Любой новый вызов лифта будит петлю
+        wakeup = asyncio.Event()
+        building.waiting.listen(wakeup.set)
+
+        # lag - прошедшее, но еще не отработанное время в шагах симуляции
+        lag, last = 0.0, monotonic()
         while True:
-            for lift_id, lift in app.ctx.lifts.items():
-                near = lift.near_act_floor(actors)
-                if lift.status == LiftStatus.IN_ACTION:
-                    cur_floor = lift.floor
-                    for p in lift.passengers:
-                        p.floor = cur_floor
-
-                    if near is None or lift.floor == near:
-                        lift.stop()
-                    else:
-                        lift.move_to_act_floor(actors)
-
-                elif lift.status == LiftStatus.STOPPED:
-                    if near is not None and lift.floor == near:
-                        # Сначала высаживаем
-                        await self._send_broadcast(
-                            self._notify('drop_off', {'id': lift_id, 'floor': lift.floor}),
-                            only=[x.uid for x in lift.drop_off()]
-                        )
-
-                        # Потом забираем, если это необходимо
-                        await self._send_broadcast(
-                            self._notify('enter_lift', {'id': lift_id, 'floor': lift.floor}),
-                            only=[x.uid for x in lift.take_actors(actors)]
-                        )
-
-                        lift.move_to_act_floor(actors)
-
-                    if near is not None and lift.floor != near:
-                        lift.move_to_act_floor(actors)
-
-            await asyncio.sleep(delay)
-
-    async def _send_broadcast(self, message, only=None, exclude=[]):
-        """Широковещательная посылка сообщений акторам"""
-        uids = self.app.ctx.sockets.keys() if only is None else only
-        for uid_item in uids:
-            if uid_item not in exclude:
-                for sock in self.app.ctx.sockets[uid_item]:
-                    await sock.send(message)
+            now = monotonic()
+            lag += (now - last) / delay
+            last = now
+
+            steps = int(lag)
+            lag -= steps
+            if trace is not None:
+                trace.tick(steps)
+            started = perf_counter()
+            building.tick(steps)
+            elapsed = perf_counter() - started
+            metrics.tick_duration.observe(elapsed)
+            if elapsed > delay:
+                metrics.tick_overruns.inc()
+
+            ticks = building.ticks_to_next_event()
+            wakeup.clear()
+            if ticks is None:
+                # Здание простаивает: спим до первого вызова
+                await wakeup.wait()
+                lag, last = 0.0, monotonic()
+                continue
 
-    @staticmethod
-    def _response(signal, id, data, status='ok'):
-        return ujson.dumps({
-            'type': 'response',
-            'signal': signal,
-            'id': id,
-            'status': status,
-            'data': data
-        })
-
-    @classmethod
-    def _error(cls, signal, id,  code, message):
-        return cls._response(
-            signal,
-            id,
-            {'code': code, 'message': message},
-            'error'
+            # Спим сразу до ближайшего события, а не шагами по LOOP_DELAY
+            timeout = (ticks - lag) * delay
+            deadline = monotonic() + timeout
+            try:
+                await asyncio.wait_for(wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                # Насколько петля проснулась позже запланированного
+                metrics.tick_drift.observe(max(monotonic() - deadline, 0.0))
+
+    async def _deliver(self, event):
+        """Доставляет акторам уведомления о посадке и высадке"""
+
+        self.app.ctx.interests.publish(
+            lift_topic(event.lift_id),
+            lambda codec: codec.lift_event(event.kind, event.lift_id, event.floor),
+            uids=[x.uid for x in event.actors]
         )
 
+    def _codec(self, ws):
+        codec, spans = self.app.ctx.codecs.get(ws, JSON), self.app.ctx.spans
+        if spans is not None:
+            return spans.codec(codec, ws)
+
+        return codec
+
+    @staticmethod
+    def _filters(data, names):
+        return {x: data[x] for x in names if data[x] is not None}
+
+    @staticmethod
+    def _cursor(data):
+        return int(data['cursor']) if data['cursor'] is not None else None
+
     @staticmethod
-    def _notify(event, data):
-        return ujson.dumps({
-            'type': 'notify',
-            'event': event,
-            'data': data
-        })
+    def _next_cursor(cursor):
+        return str(cursor) if cursor is not None else None
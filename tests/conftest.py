@@ -1,9 +1,12 @@
+from types import SimpleNamespace
+
 import pytest
 
 from sanic.app import Sanic
 from sanic.websocket import WebSocketProtocol
 
-from micro_lift.main import init_app
+from conf import load_config
+from micro_lift.main import init_app, init_state
 
 
 Sanic.test_mode = True
@@ -13,3 +16,26 @@ def cli(loop, sanic_client):
     app = init_app('config/config.yaml')
 
     return loop.run_until_complete(sanic_client(app, scheme='ws', protocol=WebSocketProtocol))
+
+
+@pytest.fixture
+def make_app():
+    """Приложение без сервера: конфигурация и состояние здания в контексте.
+
+    Аргументы заменяют поля конфигурации, словари дополняют вложенные
+    разделы: make_app(LOOP_DELAY=0.01, TRACE={'PATH': path})
+    """
+
+    def make(**overrides):
+        config = load_config('config/config.yaml')
+        for name, value in overrides.items():
+            if isinstance(value, dict):
+                value = dict(config[name], **value)
+            config[name] = value
+
+        app = SimpleNamespace(config=config, ctx=SimpleNamespace())
+        init_state(app.ctx, config)
+
+        return app
+
+    return make
@@ -1,8 +1,6 @@
-from datetime import datetime as dt
-
 import ujson
 
-from auth import gen_token
+from auth import auth_request
 
 
 async def req(ws, signal, data, id='my_id'):
@@ -26,14 +24,7 @@ async def ws_conn(client):
 
 
 def quick_auth(app, uid, weight=70.0):
-    timestamp = dt.utcnow().strftime(app.config['DATETIME_FORMAT'])
-
-    return {
-        'uid': uid,
-        'token': gen_token(app.config['SECRET_KEY'], uid, timestamp),
-        'timestamp': timestamp,
-        'weight': weight
-    }
+    return auth_request(app.config['SECRET_KEY'], app.config['DATETIME_FORMAT'], uid, weight)
 
 
 async def auth_actors(client, *uids):
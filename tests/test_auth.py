@@ -0,0 +1,31 @@
+from datetime import datetime as dt
+
+from auth import Authenticator, Tickets, gen_token
+from schema import ISO8601_FORMAT, parse_iso8601
+
+
+def test_prepared_key_matches_gen_token():
+    """Подготовленный ключ дает те же токены и кэширует успешную проверку"""
+
+    auth = Authenticator('secret', 900)
+    timestamp = parse_iso8601(dt.utcnow().strftime(ISO8601_FORMAT))
+    token = gen_token('secret', 'actor1', timestamp)
+
+    assert auth.token('actor1', timestamp) == token
+    assert auth.verify('actor1', timestamp, token)
+    assert auth.verify('actor1', timestamp, token)
+    assert len(auth._verified) == 1
+    assert not auth.verify('actor2', timestamp, token)
+
+
+def test_ticket_rotation():
+    """У актора действует только последний выданный билет"""
+
+    tickets = Tickets(ttl=60)
+    first = tickets.issue('actor1')
+    assert tickets.resolve(first) == 'actor1'
+
+    second = tickets.issue('actor1')
+    assert tickets.resolve(first) is None
+    assert tickets.resolve(second) == 'actor1'
+    assert tickets.resolve('unknown') is None
@@ -0,0 +1,44 @@
+from bench import CASES, Fixture, compare, run_suite
+from conf import load_config
+from models import ActorStatus
+
+
+def test_cases_restore_state():
+    """Случаи с изменением состояния возвращают здание в исходное"""
+
+    config = load_config('config/config.yaml')
+    fixture = Fixture(config, 100, 3)
+    waiting = len(fixture.waiting)
+
+    run, reset = CASES['take_actors'](fixture)
+    run()
+    assert len(fixture.waiting) < waiting
+    reset()
+    assert len(fixture.waiting) == waiting
+    assert all(x.status == ActorStatus.EXPECT for x in fixture.actors)
+
+    run, reset = CASES['drop_off'](Fixture(config, 10, 3))
+    for _ in range(2):
+        reset()
+        run()
+
+
+def test_suite_and_regressions():
+    """Прогон выдает скорость каждого случая, падение скорости
+    относительно калибровки считается регрессией
+    """
+    config = load_config('config/config.yaml')
+    report = run_suite(config, actors=(10,), lifts=(2,), min_time=0.001, repeat=1)
+    assert set(report['results']) == {f'{x}/10x2' for x in CASES}
+    assert all(x > 0 for x in report['results'].values())
+    assert compare(report, report, 0.3) == []
+
+    # Замеры в доли миллисекунды шумят, поэтому разбросы задаются явно
+    quiet = dict(report, spread={x: 0.0 for x in report['results']}, calibration_spread=0.0)
+    slower = dict(quiet, calibration=report['calibration'] * 2)
+    # На вдвое более быстрой машине прежние результаты - вдвое медленнее
+    assert len(compare(quiet, slower, 0.3)) == len(report['results'])
+
+    # Падение в пределах шума случая регрессией не считается
+    noisy = dict(slower, spread={x: 0.2 for x in report['results']})
+    assert compare(quiet, noisy, 0.3) == []
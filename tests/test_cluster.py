@@ -0,0 +1,103 @@
+import asyncio
+from types import SimpleNamespace
+
+import ujson
+
+from cluster import OPEN, OwnerLink, SimulationOwner, read_message
+from .shortcuts import quick_auth
+
+
+class FakeSocket:
+    """Websocket клиента, подключенного к процессу-обработчику"""
+
+    def __init__(self, *frames):
+        self.inbox = asyncio.Queue()
+        self.sent = asyncio.Queue()
+        self.closed = False
+        for x in frames:
+            self.inbox.put_nowait(x)
+
+    async def recv(self):
+        return await self.inbox.get()
+
+    async def send(self, frame):
+        self.sent.put_nowait(ujson.loads(frame))
+
+    async def close(self):
+        self.closed = True
+
+
+async def test_worker_relays_to_owner(tmp_path, make_app):
+    """Обработчик пересылает сигналы владельцу симуляции и получает ответы"""
+
+    app = make_app()
+    path = str(tmp_path / 'owner.sock')
+    server = await SimulationOwner(app).serve(path)
+    link = OwnerLink(path)
+    await link.connect(None, None)
+
+    ws = FakeSocket(ujson.dumps({'signal': 'auth', 'id': '1', 'data': quick_auth(app, 'actor1')}))
+    task = asyncio.ensure_future(link.entry_point(SimpleNamespace(query_string=''), ws))
+
+    resp = await asyncio.wait_for(ws.sent.get(), 1.0)
+    assert resp['status'] == 'ok'
+    assert 'actor1' in app.ctx.actors
+
+    task.cancel()
+    server.close()
+
+
+async def test_worker_relays_metrics(tmp_path, make_app):
+    """Метрики и спаны обработчик запрашивает у владельца"""
+
+    app = make_app()
+    path = str(tmp_path / 'owner.sock')
+    server = await SimulationOwner(app).serve(path)
+    link = OwnerLink(path)
+    await link.connect(None, None)
+
+    request = SimpleNamespace(query_string='', headers={})
+    resp = await asyncio.wait_for(link.metrics(request), 1.0)
+    assert resp.status == 200
+    assert resp.content_type.startswith('text/plain')
+    assert b'lift_actors 0' in resp.body
+
+    resp = await asyncio.wait_for(link.spans(request), 1.0)
+    assert resp.status == 404
+
+    server.close()
+
+
+async def test_worker_survives_owner_exit(tmp_path):
+    """Когда владелец завершается, клиенты обработчика отключаются,
+    а новые подключения сразу получают ошибку
+    """
+    async def dying_owner(reader, writer):
+        op, _, _ = await read_message(reader)
+        assert op == OPEN
+        writer.close()
+
+    path = str(tmp_path / 'owner.sock')
+    server = await asyncio.start_unix_server(dying_owner, path)
+    link = OwnerLink(path)
+    await link.connect(None, None)
+
+    ws = FakeSocket()
+    task = asyncio.ensure_future(link.entry_point(SimpleNamespace(query_string=''), ws))
+    for _ in range(100):
+        await asyncio.sleep(0.01)
+        if ws.closed:
+            break
+    assert ws.closed
+    task.cancel()
+
+    late = FakeSocket()
+    await asyncio.wait_for(link.entry_point(SimpleNamespace(query_string=''), late), 1.0)
+    resp = late.sent.get_nowait()
+    assert resp['status'] == 'error' and resp['data']['code'] == 503
+    assert late.closed
+
+    resp = await link.metrics(SimpleNamespace(query_string='', headers={}))
+    assert resp.status == 503
+
+    server.close()
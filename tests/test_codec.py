@@ -0,0 +1,35 @@
+import msgpack
+import ujson
+
+from codec import JSON, CODECS
+from models import Actor
+from serializers import encode_actor
+
+
+def test_msgpack_raw_response():
+    """Готовые фрагменты вклеиваются в корректный кадр MessagePack"""
+
+    codec = CODECS['msgpack']
+    actor = Actor('actor1', 70.0)
+    actor.wait_lift(4)
+
+    frame = msgpack.unpackb(codec.raw_response('actor_list', 'my_id', codec.actors([actor] * 20), cursor='7'))
+    assert frame['type'] == 'response'
+    assert frame['cursor'] == '7'
+    assert len(frame['data']) == 20
+    assert frame['data'][0] == ['actor1', 70.0, 1, 4, 1, encode_actor(actor)['timestamp']]
+
+    # Снимки кодеков хранятся независимо
+    assert ujson.loads(JSON.actor(actor))['status'] == 'EXPECT'
+
+
+def test_msgpack_update_compact():
+    """Обновления передаются номерами полей и числовыми статусами"""
+
+    codec = CODECS['msgpack']
+    frame = msgpack.unpackb(codec.update('lifts', {'lift_0': {'position': 3.5, 'status': 'IN_ACTION'}}, []),
+                            strict_map_key=False)
+    assert frame == ['update', ['lifts', {'lift_0': {3: 3.5, 5: 1}}, []]]
+
+    frame = msgpack.unpackb(codec.update('floors', {'3': {'waiting': 2}}, ['5']), strict_map_key=False)
+    assert frame == ['update', ['floors', {3: {0: 2}}, [5]]]
@@ -0,0 +1,53 @@
+from dispatch import CollectiveDispatcher, Dispatcher, DestinationDispatcher
+from engine import LiftEngine
+from models import Actor, WaitingRoom
+
+
+def _building(lift_count, *calls):
+    room, engine = WaitingRoom(), LiftEngine(lift_count, 0.25, 300.0, 3.0)
+    for inx, (floor, need_floor) in enumerate(calls):
+        actor = Actor(f'actor{inx}', 70.0, room=room)
+        actor.floor = floor
+        actor.wait_lift(need_floor)
+
+    return engine.lifts, room
+
+
+def test_call_assigned_to_single_lift():
+    """Вызов с этажа закрепляется только за одним лифтом"""
+
+    lifts, room = _building(3, (5, 1))
+    for dispatcher in (Dispatcher(), CollectiveDispatcher(), DestinationDispatcher()):
+        dispatcher.assign(lifts, room)
+        targets = [dispatcher.next_floor(x, room) for x in lifts.values()]
+
+        assert targets.count(5) == 1
+        assert targets.count(None) == 2
+
+
+def test_collective_keeps_direction():
+    """Собирательное управление не разворачивает лифт, пока впереди есть остановки"""
+
+    lifts, room = _building(1, (2, 1), (6, 1))
+    lift = lifts['lift_0']
+    lift.position = 3.0 * 3
+
+    nearest, collective = Dispatcher(), CollectiveDispatcher()
+    for dispatcher in (nearest, collective):
+        dispatcher.assign(lifts, room)
+
+    assert nearest.next_floor(lift, room) == 2
+    assert collective.next_floor(lift, room) == 6
+
+
+def test_stats_summary():
+    """Статистика считает время ожидания посаженных акторов"""
+
+    lifts, room = _building(1, (1, 4))
+    dispatcher = Dispatcher()
+    dispatcher.boarded(lifts['lift_0'].take_actors(room))
+
+    stats = dispatcher.stats()
+    assert stats['strategy'] == 'nearest'
+    assert stats['wait']['count'] == 1
+    assert stats['trip']['count'] == 0
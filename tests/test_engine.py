@@ -0,0 +1,52 @@
+from marshmallow import ValidationError
+import pytest
+import yaml
+
+import conf
+from engine import LiftEngine, NumpyEngine
+from models import Actor, LiftStatus, WaitingRoom
+
+
+def _ride(engine, room):
+    """Доводит лифт до этажа назначения единственного пассажира"""
+
+    lift = engine.lifts['lift_0']
+    actor = Actor('actor1', 70.0, room=room)
+    actor.wait_lift(3)
+    lift.take_actors(room)
+
+    for _ in range(100):
+        lift.target = lift.near_act_floor(room)
+        engine.advance()
+        if lift.floor == 3:
+            break
+
+    return lift
+
+
+def test_numpy_engine_matches_python():
+    """Векторный движок двигает лифты так же, как поэлементный"""
+
+    expected = _ride(LiftEngine(2, 0.25, 300.0, 3.0), WaitingRoom())
+    actual = _ride(NumpyEngine(2, 0.25, 300.0, 3.0), WaitingRoom())
+
+    assert actual.position == pytest.approx(expected.position)
+    assert actual.floor == expected.floor == 3
+    assert actual.status == LiftStatus.IN_ACTION
+    assert actual.load == 70.0
+
+
+def test_numpy_engine_requires_numpy(tmp_path, monkeypatch):
+    """Без numpy конфигурация с векторным движком не загружается"""
+
+    with open('config/config.yaml') as f:
+        data = yaml.safe_load(f)
+    data['LIFT']['ENGINE'] = 'numpy'
+    path = tmp_path / 'config.yaml'
+    path.write_text(yaml.safe_dump(data))
+
+    assert conf.load_config(str(path))['LIFT']['ENGINE'] == 'numpy'
+
+    monkeypatch.setattr(conf, 'find_spec', lambda name: None)
+    with pytest.raises(ValidationError, match='requirements-optional.txt'):
+        conf.load_config(str(path))
@@ -0,0 +1,49 @@
+import asyncio
+
+from fanout import Broadcaster
+
+
+class StuckSocket:
+    """Сокет клиента, который не успевает принимать сообщения"""
+
+    def __init__(self):
+        self.sent = []
+        self.closed = False
+        self.release = asyncio.Event()
+
+    async def send(self, frame):
+        await self.release.wait()
+        self.sent.append(frame)
+
+    async def close(self):
+        self.closed = True
+
+
+async def test_stuck_client_does_not_block_others():
+    """Зависший клиент не задерживает доставку остальным"""
+
+    stuck, fast = StuckSocket(), StuckSocket()
+    fast.release.set()
+    broadcaster = Broadcaster({'a': {stuck}, 'b': {fast}}, queue_size=2, policy='drop')
+
+    for inx in range(4):
+        broadcaster.publish(f'frame{inx}')
+        await asyncio.sleep(0.01)
+
+    assert fast.sent == ['frame0', 'frame1', 'frame2', 'frame3']
+    assert broadcaster.outbox(stuck).closed
+
+
+async def test_coalesce_keyed_updates():
+    """Неотправленное обновление заменяется более свежим с тем же ключом"""
+
+    ws = StuckSocket()
+    broadcaster = Broadcaster({'a': {ws}}, queue_size=4, policy='coalesce')
+    broadcaster.publish('lift_0:1', key='lift_0')
+    broadcaster.publish('lift_0:2', key='lift_0')
+    broadcaster.publish('other')
+    assert broadcaster.depth() == 2
+
+    ws.release.set()
+    await asyncio.sleep(0.01)
+    assert ws.sent == ['lift_0:2', 'other']
@@ -0,0 +1,30 @@
+from conf import load_config
+from headless import Simulation, random_traffic
+
+
+def test_headless_serves_all_actors():
+    """Безсерверная симуляция обслуживает весь трафик и детерминирована"""
+
+    config = load_config('config/config.yaml')
+    traffic = random_traffic(200, 0.5, config['FLOOR']['COUNT'], seed=1)
+
+    report = Simulation(config, dwell=1.0).run(traffic)
+    assert report['served'] == 200
+    assert report['wait']['count'] == 200
+    assert report['trip']['p50'] > 0
+
+    assert Simulation(config, dwell=1.0).run(traffic) == report
+
+
+def test_same_floor_arrivals_are_skipped():
+    """Актор, появившийся на нужном этаже, не вызывает лифт и не копится"""
+
+    config = load_config('config/config.yaml')
+    traffic = [{'time': float(x), 'uid': f'actor{x}', 'weight': 70.0, 'floor': 3, 'need_floor': 3}
+               for x in range(100)]
+    traffic.append({'time': 100.0, 'uid': 'rider', 'weight': 70.0, 'floor': 1, 'need_floor': 4})
+
+    simulation = Simulation(config, dwell=1.0)
+    report = simulation.run(traffic)
+    assert report['served'] == 1
+    assert not simulation._times
@@ -0,0 +1,121 @@
+import index as index_module
+from index import actor_index
+from models import Actor, WaitingRoom
+
+
+def make_actors(count):
+    room = WaitingRoom()
+    index = actor_index()
+    actors = [Actor(f'actor{x}', 50.0 + x, room=room) for x in range(count)]
+    for x in actors:
+        index.add(x)
+
+    return index, actors
+
+
+def test_page_cursor():
+    """Страницы идут подряд без пропусков и повторов"""
+
+    index, actors = make_actors(5)
+
+    page, cursor = index.page(2)
+    assert page == actors[:2]
+
+    page, cursor = index.page(2, after=cursor)
+    assert page == actors[2:4]
+
+    page, cursor = index.page(2, after=cursor)
+    assert page == actors[4:]
+    assert cursor is None
+
+
+def test_cursor_survives_row_reuse():
+    """Новый объект в освободившейся строке попадает в конец выборки,
+    а не за курсор уже выданной страницы
+    """
+    index, actors = make_actors(5)
+    page, cursor = index.page(2)
+    assert page == actors[:2]
+
+    index.remove('actor0')
+    late = Actor('late', 90.0)
+    index.add(late)
+
+    page, cursor = index.page(2, after=cursor)
+    assert page == actors[2:4]
+    page, cursor = index.page(2, after=cursor)
+    assert page == [actors[4], late]
+    assert cursor is None
+
+    page, cursor = index.page(1, ranges={'weight': (52.0, None)})
+    assert page == [actors[2]]
+    page, cursor = index.page(3, ranges={'weight': (52.0, None)}, after=cursor)
+    assert page == [actors[3], actors[4], late]
+    assert cursor is None
+
+
+def test_renumber(monkeypatch):
+    """Исчерпав номера, индекс нумерует объекты заново в прежнем порядке"""
+
+    monkeypatch.setattr(index_module, 'SEQ_LIMIT', 8)
+    index, actors = make_actors(5)
+    for inx in range(5, 12):
+        index.remove(actors[inx - 5].uid)
+        actors.append(Actor(f'actor{inx}', 50.0 + inx))
+        index.add(actors[-1])
+
+    assert index.page(10)[0] == actors[7:]
+    page, cursor = index.page(3, ranges={'weight': (None, 60.0)})
+    assert page == actors[7:10]
+    assert index.page(10, ranges={'weight': (None, 60.0)}, after=cursor) == ([actors[10]], None)
+
+
+def test_filters_follow_changes():
+    """Индекс обновляется при изменении актора"""
+
+    index, actors = make_actors(4)
+    actors[1].wait_lift(5)
+    actors[3].wait_lift(5)
+
+    page, _ = index.page(10, {'status': 'EXPECT', 'need_floor': 5})
+    assert page == [actors[1], actors[3]]
+
+    actors[1].idle()
+    page, _ = index.page(10, {'status': 'EXPECT'})
+    assert page == [actors[3]]
+
+    page, _ = index.page(10, ranges={'weight': (51.6, None)})
+    assert page == actors[2:]
+
+    index.remove('actor3')
+    assert index.page(10, {'status': 'EXPECT'}) == ([], None)
+
+
+def test_intersection_and_ranges():
+    """Пересечение фильтров и диапазон веса выбираются без перебора,
+    а списки индекса держатся отсортированными при частых изменениях
+    """
+    index, actors = make_actors(3000)
+    for actor in actors[::7]:
+        actor.wait_lift(5)
+    for actor in actors[::3]:
+        actor.wait_lift(4)
+
+    page, cursor = index.page(5, {'status': 'EXPECT', 'need_floor': 5})
+    expected = [x for x in actors if x.need_floor == 5]
+    assert page == expected[:5]
+
+    page, _ = index.page(5, {'need_floor': 5}, after=cursor)
+    assert page == expected[5:10]
+
+    page, _ = index.page(100, {'need_floor': 4}, ranges={'weight': (60.0, 80.0)})
+    assert [x.weight for x in page] == [60.0 + x for x in range(0, 21) if x % 3 == 2]
+
+    page, _ = index.page(100, ranges={'weight': (None, 52.0)})
+    assert page == actors[:3]
+    assert index.page(10, ranges={'weight': (5000.0, None)}) == ([], None)
+
+    for actor in actors:
+        actor.idle()
+    page, _ = index.page(10, {'status': 'IDLE'}, after=2989)
+    assert page == actors[2990:]
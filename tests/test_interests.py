@@ -0,0 +1,106 @@
+import asyncio
+
+import ujson
+
+from interests import InterestRouter
+
+from .shortcuts import auth_actors, receive, req
+
+
+class Socket:
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, frame):
+        self.sent.append(ujson.loads(frame))
+
+    async def close(self):
+        pass
+
+
+def connect(ctx, uid, floor=1):
+    actor = ctx.actors.add(uid, 70.0)
+    actor.floor = floor
+    ws = Socket()
+    ctx.sockets[uid] = {ws}
+
+    return actor, ws
+
+
+async def test_arrivals_digest(make_app):
+    """Прибытия за шаг приходят одной сводкой только ожидающим на этаже
+    и наблюдателям этажа
+    """
+    ctx = make_app().ctx
+    router = InterestRouter(ctx, 0.01)
+    waiting, ws_waiting = connect(ctx, 'waiting')
+    waiting.wait_lift(5)
+    _, ws_idle = connect(ctx, 'idle')
+    _, ws_upstairs = connect(ctx, 'upstairs', floor=3)
+    ctx.actors['upstairs'].wait_lift(5)
+    ws_watcher = Socket()
+    router.watch(ws_watcher, 'floor:1')
+
+    for uid in ('new1', 'new2'):
+        actor, _ = connect(ctx, uid)
+        router.arrive(actor)
+
+    router.flush()
+    await asyncio.sleep(0.01)
+
+    for ws in (ws_waiting, ws_watcher):
+        assert len(ws.sent) == 1
+        assert ws.sent[0]['event'] == 'actor_arrive'
+        assert [x['uid'] for x in ws.sent[0]['data']] == ['new1', 'new2']
+
+    assert ws_idle.sent == [] and ws_upstairs.sent == []
+    assert ctx.metrics.fanout_size.sum == 2
+
+    router.discard(ws_watcher)
+    router.arrive(ctx.actors['new1'])
+    router.flush()
+    await asyncio.sleep(0.01)
+    assert len(ws_watcher.sent) == 1
+
+
+async def test_watch_floor(cli):
+    """Наблюдатель этажа получает сводку о прибытии"""
+
+    ws, = await auth_actors(cli, 'actor1')
+    await req(ws, 'watch', {'topic': 'floor:1'})
+    resp = await receive(ws)
+    assert resp['status'] == 'ok'
+
+    await auth_actors(cli, 'actor2', 'actor3')
+
+    # Сводка может включать и прибытие самого наблюдателя, если оно
+    # пришлось на тот же шаг
+    arrived = []
+    while 'actor3' not in arrived:
+        resp = await receive(ws)
+        assert resp['event'] == 'actor_arrive'
+        arrived += [x['uid'] for x in resp['data']]
+
+    assert arrived[-2:] == ['actor2', 'actor3']
+
+    for topic in ('lift:lift_99', 'floor:1000'):
+        await req(ws, 'watch', {'topic': topic})
+        resp = await receive(ws)
+        assert resp['data']['code'] == 404
+
+    await req(ws, 'watch', {'topic': 'roof'})
+    resp = await receive(ws)
+    assert resp['data']['code'] == 400
+
+
+def test_watch_limit(make_app):
+    """Сокет наблюдает не больше чем за max_watches темами"""
+
+    router = InterestRouter(make_app().ctx, 0.01, max_watches=2)
+    assert router.watch('ws', 'floor:1') and router.watch('ws', 'floor:2')
+    assert router.watch('ws', 'floor:2')
+    assert not router.watch('ws', 'lift:lift_0')
+    assert router.watch('ws2', 'lift:lift_0')
+
+    router.unwatch('ws', 'floor:1')
+    assert router.watch('ws', 'lift:lift_0')
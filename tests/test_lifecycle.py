@@ -0,0 +1,56 @@
+from codec import JSON
+from lifecycle import Lifecycle
+
+
+def connect(ctx, lifecycle, ws, uid):
+    actor = ctx.actors.add(uid, 70.0)
+    ctx.actor_index.add(actor)
+    lifecycle.connect(ws, JSON)
+    lifecycle.attach(ws, actor)
+
+    return actor
+
+
+async def test_disconnect_and_eviction(make_app):
+    """Отключение освобождает сокет, брошенный актор удаляется по сроку,
+    а пассажир лифта остается до высадки
+    """
+    ctx = make_app().ctx
+    lifecycle = Lifecycle(ctx, actor_ttl=60.0)
+    waiting = connect(ctx, lifecycle, 'ws1', 'actor1')
+    rider = connect(ctx, lifecycle, 'ws2', 'actor2')
+    waiting.wait_lift(5)
+    rider.wait_lift(3)
+    rider.enter_lift('lift_0')
+
+    lifecycle.disconnect('ws1')
+    lifecycle.disconnect('ws2')
+    assert ctx.sockets == {} and ctx.by_ws == {} and ctx.codecs == {}
+
+    lifecycle.sweep()
+    assert len(ctx.actors) == 2
+
+    lifecycle.sweep(now=1e12)
+    assert list(ctx.actors) == ['actor2']
+    assert len(ctx.waiting) == 0
+    assert len(ctx.actor_index) == 1
+
+    rider.leave_lift()
+    lifecycle.sweep(now=1e12)
+    assert len(ctx.actors) == 0
+    assert lifecycle.stats()['evicted'] == 2
+
+
+async def test_actor_cap(make_app):
+    """При достижении лимита место освобождают отключившиеся акторы"""
+
+    ctx = make_app().ctx
+    lifecycle = Lifecycle(ctx, max_actors=2)
+    connect(ctx, lifecycle, 'ws1', 'actor1')
+    connect(ctx, lifecycle, 'ws2', 'actor2')
+    assert not lifecycle.admit()
+
+    lifecycle.disconnect('ws1')
+    assert lifecycle.admit()
+    assert list(ctx.actors) == ['actor2']
+    assert lifecycle.stats()['rejected'] == 1
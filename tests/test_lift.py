@@ -1,7 +1,9 @@
 from datetime import datetime as dt
 from datetime import timedelta
 
-from .shortcuts import req, receive, ws_conn, auth_actors
+import msgpack
+
+from .shortcuts import req, receive, ws_conn, auth_actors, quick_auth
 from auth import gen_token
 from schema import ISO8601_FORMAT
 
@@ -69,3 +71,106 @@ async def test_not_change_status_in_lift(cli):
 
     resp = await receive(ws)
     assert resp['data']['status'] != 'EXPECT'
+
+
+async def test_invalid_message(cli):
+    """Сообщение, не соответствующее протоколу, отклоняется с текстом ошибки marshmallow"""
+
+    ws = await ws_conn(cli)
+    await req(ws, 'actor_list', {'count': 0}, id='x' * 40)
+
+    resp = await receive(ws)
+    assert resp['status'] == 'error'
+    assert resp['data']['code'] == 400
+    assert 'id' in resp['data']['message']
+
+
+async def test_subscribe_lift_updates(cli):
+    """Подписчик получает полное состояние, а затем только изменившиеся поля"""
+
+    ws, ws2 = await auth_actors(cli, 'actor1', 'actor2')
+    await req(ws, 'subscribe', {'topic': 'lifts', 'rate': 100.0})
+
+    resp = await receive(ws)
+    assert resp['status'] == 'ok'
+
+    resp = await receive(ws)
+    assert resp['event'] == 'update'
+    assert set(resp['data']['changes']['lift_0']) >= {'position', 'status', 'passengers'}
+
+    await req(ws2, 'actor_expect', {'floor': 5})
+    await receive(ws2)
+
+    resp = await receive(ws)
+    assert resp['event'] == 'update'
+    assert resp['data']['changes']['lift_0']['passengers'] == ['actor2']
+    assert 'speed' not in resp['data']['changes']['lift_0']
+
+
+async def test_actor_list_pages(cli):
+    """Список акторов выдается страницами с фильтрами"""
+
+    *_, ws = await auth_actors(cli, 'actor1', 'actor2', 'actor3')
+    await req(ws, 'actor_list', {'count': 2, 'status': 'IDLE'})
+
+    resp = await receive(ws)
+    assert [x['uid'] for x in resp['data']] == ['actor1', 'actor2']
+
+    await req(ws, 'actor_list', {'count': 2, 'status': 'IDLE', 'cursor': resp['cursor']})
+
+    resp = await receive(ws)
+    assert [x['uid'] for x in resp['data']] == ['actor3']
+    assert 'cursor' not in resp
+
+
+async def test_msgpack_connection(cli):
+    """Клиент, выбравший MessagePack, получает бинарные кадры"""
+
+    ws = await cli.ws_connect('/ws?codec=msgpack')
+    await ws.send(msgpack.packb({'signal': 'auth', 'data': quick_auth(cli.app, 'actor1'), 'id': 'my_id'}))
+
+    resp = msgpack.unpackb(await ws.recv())
+    assert resp['status'] == 'ok'
+    assert resp['data'][0] == 'actor1'
+
+
+async def test_batch(cli):
+    """Пакет сигналов получает все ответы одним кадром, ошибки не мешают остальным"""
+
+    ws, = await auth_actors(cli, 'actor1')
+    await req(ws, 'batch', {'requests': [
+        {'signal': 'actor_idle', 'data': {}, 'id': '1'},
+        {'signal': 'unknown', 'data': {}, 'id': '2'},
+        {'signal': 'actor_list', 'data': {'count': 1}, 'id': '3'},
+        {'signal': 'actor_list', 'id': '4'},
+    ]})
+
+    resp = await receive(ws)
+    assert resp['signal'] == 'batch'
+    assert [x['id'] for x in resp['data']] == ['1', '2', '3', '4']
+    assert [x['status'] for x in resp['data']] == ['ok', 'error', 'ok', 'error']
+    assert resp['data'][1]['data']['code'] == 404
+    assert resp['data'][2]['data'][0]['uid'] == 'actor1'
+
+
+async def test_resume_session(cli):
+    """Билет из ответа auth возвращает новый сокет к тому же актору"""
+
+    ws = await ws_conn(cli)
+    await req(ws, 'auth', quick_auth(cli.app, 'actor1'))
+    ticket = (await receive(ws))['ticket']
+    await ws.close()
+
+    ws = await ws_conn(cli)
+    await req(ws, 'resume', {'ticket': ticket})
+
+    resp = await receive(ws)
+    assert resp['status'] == 'ok'
+    assert resp['data']['uid'] == 'actor1'
+    assert resp['ticket'] != ticket
+
+    await req(ws, 'actor_idle', {})
+    assert (await receive(ws))['status'] == 'ok'
+
+    await req(ws, 'resume', {'ticket': ticket})
+    assert (await receive(ws))['data']['code'] == 403
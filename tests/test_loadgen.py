@@ -0,0 +1,55 @@
+import pytest
+from sanic.websocket import WebSocketProtocol
+
+from loadgen import histogram_quantiles, parse_metrics, run_load, traffic_plan
+from main import init_app
+from metrics import Metrics
+
+
+@pytest.fixture
+def fast_cli(loop, sanic_client):
+    """Сервер с коротким шагом петли, чтобы поездки укладывались в тест"""
+
+    app = init_app('config/config.yaml')
+    app.config['LOOP_DELAY'] = 0.002
+
+    return loop.run_until_complete(sanic_client(app, scheme='ws', protocol=WebSocketProtocol))
+
+
+def test_traffic_plan():
+    """План трафика детерминирован и соответствует профилю"""
+
+    plan = traffic_plan('lunch', 50, 10.0, 10, seed=1)
+    assert plan == traffic_plan('lunch', 50, 10.0, 10, seed=1)
+    assert all(x['legs'][1] == 1 and x['legs'][0] == x['legs'][2] for x in plan)
+    assert all(b['time'] > a['time'] for a, b in zip(plan, plan[1:]))
+    assert all(x['legs'] == [x['legs'][0]] for x in traffic_plan('up', 10, 10.0, 10))
+
+
+def test_histogram_quantiles():
+    """Перцентили считаются по приросту гистограммы за прогон"""
+
+    metrics = Metrics()
+    metrics.tick_drift.observe(5.0)
+    before = parse_metrics(metrics.render())
+    for _ in range(99):
+        metrics.tick_drift.observe(0.003)
+    metrics.tick_drift.observe(0.2)
+    after = parse_metrics(metrics.render())
+
+    result = histogram_quantiles(before, after, 'lift_tick_drift_seconds')
+    assert result['count'] == 100
+    assert 0.0025 < result['p50'] <= 0.005
+    assert 0.1 < result['p999'] <= 0.25
+
+
+async def test_run_load(fast_cli):
+    """Прогон подключает акторов, совершает их поездки и снимает метрики сервера"""
+
+    plan = traffic_plan('up', 5, 1000.0, 3, seed=1)
+    report = await run_load(fast_cli.make_url('/ws'), fast_cli.app.config, plan, trip_timeout=10.0)
+    assert report['errors'] == 0 and report['timeouts'] == 0
+    assert report['trips'] == len(plan)
+    assert report['rtt']['auth']['count'] == 5
+    assert report['rtt']['auth']['p999'] > 0
+    assert report['server']['tick_duration']['count'] > 0
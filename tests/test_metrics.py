@@ -0,0 +1,63 @@
+from metrics import CONTENT_TYPE, Counter, Family, Histogram, Metrics
+
+from .shortcuts import auth_actors, receive, req
+
+
+def test_histogram_buckets():
+    hist = Histogram((0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        hist.observe(value)
+
+    samples = dict(hist.samples('h', []))
+    assert samples['h_bucket{le="0.1"}'] == 2
+    assert samples['h_bucket{le="1.0"}'] == 3
+    assert samples['h_bucket{le="+Inf"}'] == 4
+    assert samples['h_count'] == 4
+    assert samples['h_sum'] == 2.65
+
+
+def test_render():
+    metrics = Metrics()
+    metrics.register('requests_total', 'Requests', Family(Counter, 'signal'))
+    metrics.gauge('status', 'By status', lambda: {'IDLE': 2}, label='status')
+    metrics.signal_duration.labels('auth').observe(0.002)
+
+    text = metrics.render()
+    assert '# TYPE lift_signal_duration_seconds histogram' in text
+    assert 'lift_signal_duration_seconds_count{signal="auth"} 1' in text
+    assert 'status{status="IDLE"} 2' in text
+    assert text.endswith('\n')
+
+
+async def test_signal_metrics(cli):
+    metrics = cli.app.ctx.metrics
+    watcher, = await auth_actors(cli, 'actor1')
+    await req(watcher, 'watch', {'topic': 'floor:1'})
+    await receive(watcher)
+    ws, = await auth_actors(cli, 'actor2')
+
+    await req(ws, 'lift_list', {})
+    await receive(ws)
+    await ws.send('{"signal": "lift_list"}')
+    await receive(ws)
+
+    assert metrics.signal_duration.labels('auth').count == 2
+    assert metrics.signal_duration.labels('lift_list').count == 1
+    assert metrics.validation_failures.labels('message').value == 1
+
+    # Сводки прибытий доходят только до наблюдателя этажа
+    digests = []
+    while not any(x['uid'] == 'actor2' for digest in digests for x in digest['data']):
+        digests.append(await receive(watcher))
+    assert metrics.fanout_size.sum == len(digests)
+
+    text = cli.app.ctx.metrics.render()
+    assert 'lift_connected_actors{status="IDLE"} 2' in text
+
+
+async def test_metrics_route(cli):
+    response = await cli.get('/metrics')
+
+    assert response.status_code == 200
+    assert response.headers['content-type'] == CONTENT_TYPE
+    assert 'lift_outbox_depth 0' in response.text
@@ -0,0 +1,49 @@
+from models import Actor, ActorStatus, Lift, WaitingRoom
+
+
+def test_waiting_room_tracks_actor_status():
+    """Реестр ожидающих обновляется при смене состояния актора"""
+
+    room = WaitingRoom()
+    actor = Actor('actor1', 70.0, room=room)
+    assert actor not in room
+
+    actor.wait_lift(5)
+    assert actor in room
+    assert room.at_floor(1) == [actor]
+
+    actor.idle()
+    assert actor not in room
+
+    actor.wait_lift(5)
+    actor.enter_lift()
+    assert actor.status == ActorStatus.IN_LIFT
+    assert len(room) == 0
+
+
+def test_waiting_room_nearest_floor():
+    """Поиск ближайшего этажа учитывает допустимый вес"""
+
+    room = WaitingRoom()
+    light, heavy = Actor('light', 50.0, room=room), Actor('heavy', 150.0, room=room)
+    light.floor, heavy.floor = 8, 3
+    light.wait_lift(1)
+    heavy.wait_lift(1)
+
+    assert room.nearest_floor(4, 300.0) == 3
+    assert room.nearest_floor(4, 100.0) == 8
+    assert room.nearest_floor(4, 10.0) is None
+
+
+def test_lift_takes_lightest_actors():
+    """Лифт забирает самых легких акторов, не превышая грузоподъемность"""
+
+    room = WaitingRoom()
+    lift = Lift('lift_0', 0.25, 150.0, 3.0)
+    actors = [Actor(f'actor{x}', w, room=room) for x, w in enumerate((100.0, 40.0, 60.0))]
+    for x in actors:
+        x.wait_lift(5)
+
+    taken = lift.take_actors(room)
+    assert [x.uid for x in taken] == ['actor1', 'actor2']
+    assert room.at_floor(1) == [actors[0]]
@@ -0,0 +1,88 @@
+import asyncio
+import os
+
+from cluster import start_owner
+from main import init_state
+from models import ActorStatus
+from persistence import SNAPSHOT_NAME
+
+
+def test_restore_snapshot_and_journal(tmp_path, make_app):
+    """Состояние восстанавливается из снимка и более нового журнала"""
+
+    ctx = make_app(PERSISTENCE={'DIR': str(tmp_path)}).ctx
+    lift = ctx.lifts['lift_0']
+    for inx in range(3):
+        ctx.actors.add(f'actor{inx}', 60.0 + inx)
+
+    ctx.actors['actor0'].wait_lift(5)
+    lift.take_actors(ctx.waiting)
+    lift.position = 4.0
+    ctx.persistence.snapshot()
+
+    ctx.actors['actor1'].wait_lift(3)
+    del ctx.actors['actor2']
+    ctx.actors.add('actor3', 90.0)
+    ctx.persistence.flush()
+
+    restored = make_app(PERSISTENCE={'DIR': str(tmp_path)}).ctx
+    actors = restored.actors
+    assert sorted(actors) == ['actor0', 'actor1', 'actor3']
+    assert actors['actor0'].status == ActorStatus.IN_LIFT
+    assert actors['actor0'].lift_id == 'lift_0'
+    assert actors['actor3'].weight == 90.0
+    assert [x.uid for x in restored.waiting] == ['actor1']
+    assert restored.lifts['lift_0'].position == 4.0
+    assert restored.lifts['lift_0'].passengers == [actors['actor0']]
+    assert restored.actor_index.page(10, {'status': 'EXPECT'})[0] == [actors['actor1']]
+
+
+async def test_write_errors(tmp_path, monkeypatch, make_app):
+    """Ошибка записи считается метрикой и не останавливает сохранение,
+    а потерянный журнал покрывает внеочередной снимок
+    """
+    monkeypatch.setattr('persistence.RETRY_DELAY', 0.05)
+    ctx = make_app(PERSISTENCE={'DIR': str(tmp_path), 'FLUSH_INTERVAL': 0.01}).ctx
+    persistence, append = ctx.persistence, ctx.persistence._append
+
+    def broken(segment, data):
+        raise OSError(28, 'No space left on device')
+
+    persistence._append = broken
+    task = asyncio.ensure_future(persistence.run())
+    ctx.actors.add('actor1', 70.0)
+    await asyncio.sleep(0.03)
+    assert 'lift_persistence_errors_total 1' in ctx.metrics.render()
+
+    persistence._append = append
+    await asyncio.sleep(0.1)
+    assert not task.done()
+    task.cancel()
+
+    assert os.path.exists(os.path.join(str(tmp_path), SNAPSHOT_NAME))
+    assert 'actor1' in make_app(PERSISTENCE={'DIR': str(tmp_path)}).ctx.actors
+
+
+def test_owner_saves_on_terminate(tmp_path):
+    """Владелец симуляции, остановленный SIGTERM, записывает снимок"""
+
+    state, sock = tmp_path / 'state', tmp_path / 'owner.sock'
+    config = tmp_path / 'config.yaml'
+    with open('config/config.yaml') as fsrc:
+        config.write_text(fsrc.read() + f"""
+PERSISTENCE:
+  DIR: {state}
+CLUSTER:
+  SOCKET: {sock}
+""")
+
+    owner = start_owner(str(config), init_state)
+    for _ in range(100):
+        if sock.exists():
+            break
+        owner.join(0.05)
+
+    owner.terminate()
+    owner.join(5.0)
+    assert owner.exitcode == 0
+    assert (state / SNAPSHOT_NAME).exists()
@@ -0,0 +1,114 @@
+import asyncio
+from time import perf_counter
+from types import SimpleNamespace
+
+import ujson
+
+from codec import JSON
+from replay import TEXT, TraceRecorder, read_trace, replay, replay_app
+from views import LiftApp
+from .shortcuts import quick_auth
+from .test_cluster import FakeSocket
+
+
+def message(signal, data, id='1'):
+    return ujson.dumps({'signal': signal, 'id': id, 'data': data})
+
+
+def building_state(ctx):
+    """Этажи и статусы акторов и состояние лифтов, без штампов времени"""
+
+    actors = {uid: row[:4] + row[5:] for uid in ctx.actors for row in [ctx.actors.row(uid)]}
+    return actors, {id: lift.state() for id, lift in ctx.lifts.items()}
+
+
+async def test_replay_is_deterministic(tmp_path, make_app):
+    """Проигрыш записи приводит здание в то же состояние, что и на сервере"""
+
+    path = str(tmp_path / 'server.trace')
+    app = make_app(TRACE={'PATH': path})
+    lift_app = LiftApp(app)
+
+    forged = dict(quick_auth(app, 'actor3'), token='forged')
+    sockets = [
+        FakeSocket(message('auth', quick_auth(app, 'actor1')),
+                   message('actor_expect', {'floor': 5}), 'not json'),
+        FakeSocket(message('auth', quick_auth(app, 'actor2', 90.0)),
+                   message('actor_expect', {'floor': 3})),
+        FakeSocket(message('resume', {'ticket': 'unknown'}), message('auth', forged)),
+    ]
+    tasks = [asyncio.ensure_future(lift_app.entry_point(SimpleNamespace(args={}), x))
+             for x in sockets]
+    for ws, replies in zip(sockets, (3, 2, 2)):
+        for _ in range(replies):
+            await asyncio.wait_for(ws.sent.get(), 1.0)
+
+    for _ in range(40):
+        app.ctx.trace.tick(1)
+        app.ctx.building.tick(1)
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    app.ctx.trace.close()
+
+    _, events = read_trace(path)
+    assert sum(1 for x in events if x[0] == TEXT) == 7
+
+    first = await replay(replay_app(app.config), path)
+    second = replay_app(app.config)
+    report = await replay(second, path)
+    assert first['digest'] == report['digest']
+    assert report['signals'] == 7 and report['ticks'] == 40
+    assert building_state(second.ctx) == building_state(app.ctx)
+    assert set(second.ctx.actors) == {'actor1', 'actor2'}
+
+
+async def test_replay_restored_state(tmp_path, make_app):
+    """Запись сервера, восстановившего здание с диска, начинается с его
+    состояния, и проигрыш приходит к тому же результату
+    """
+    state = {'DIR': str(tmp_path / 'state')}
+    first = make_app(PERSISTENCE=state).ctx
+    for inx in range(3):
+        first.actors.add(f'actor{inx}', 70.0)
+    first.actors['actor0'].wait_lift(5)
+    first.actors['actor1'].wait_lift(3)
+    for _ in range(10):
+        first.building.tick(1)
+    first.persistence.snapshot()
+
+    path = str(tmp_path / 'server.trace')
+    app = make_app(PERSISTENCE=state, TRACE={'PATH': path})
+    assert len(app.ctx.actors) == 3
+
+    for _ in range(40):
+        app.ctx.trace.tick(1)
+        app.ctx.building.tick(1)
+    app.ctx.trace.close()
+
+    replayed = replay_app(app.config)
+    await replay(replayed, path)
+    assert building_state(replayed.ctx) == building_state(app.ctx)
+    assert replayed.ctx.actor_index.page(10)[0] == list(replayed.ctx.actors.values())
+
+
+def test_recording_overhead(tmp_path):
+    """Запись события на горячем пути обходится дешево. Граница грубая,
+    чтобы тест не зависел от загрузки машины
+    """
+
+    recorder = TraceRecorder(str(tmp_path / 'bench.trace'))
+    ws, frame = object(), message('actor_expect', {'floor': 5})
+    recorder.connect(ws, JSON)
+
+    count = 20000
+    started = perf_counter()
+    for _ in range(count):
+        recorder.message(ws, frame)
+        recorder.tick(1)
+    elapsed = (perf_counter() - started) / (count * 2)
+    recorder.close()
+
+    assert elapsed < 100e-6
+    assert len(read_trace(str(tmp_path / 'bench.trace'))[1]) == count * 2 + 1
@@ -0,0 +1,46 @@
+import pytest
+from marshmallow import ValidationError
+
+import schema as sc
+from schema import SchemaLoader
+
+
+def test_fast_path_matches_schema():
+    """Быстрый путь возвращает те же данные, что и marshmallow"""
+
+    loader = SchemaLoader(sc.IncomingSchema)
+    data = {'signal': 'auth', 'data': {}}
+
+    assert loader.load(data) == sc.IncomingSchema().load(data)
+    assert SchemaLoader(sc.ActorExpectSchema).load({'floor': 3}) == {'floor': 3}
+    assert SchemaLoader(sc.LiftListSchema).load({}) == sc.LiftListSchema().load({})
+    assert SchemaLoader(sc.LiftListSchema).load({})['count'] == 10
+
+
+def test_fast_path_errors_from_marshmallow():
+    """Ошибки валидации формирует marshmallow"""
+
+    loader = SchemaLoader(sc.ActorExpectSchema)
+    for data in ({'floor': 0}, {'floor': 'x'}, {'floor': 2, 'extra': 1}, {}):
+        with pytest.raises(ValidationError) as err:
+            loader.load(data)
+
+        with pytest.raises(ValidationError) as expected:
+            sc.ActorExpectSchema().load(data)
+
+        assert err.value.messages == expected.value.messages
+
+
+def test_timestamp_parsed_once():
+    """Штамп времени разбирается при валидации и передается дальше"""
+
+    data = SchemaLoader(sc.AuthSchema).load({
+        'uid': 'actor1',
+        'timestamp': '2021-12-07T06:00:07.944440Z',
+        'token': 'token',
+        'weight': 70,
+    })
+
+    assert data['timestamp'] == '2021-12-07T06:00:07.944440Z'
+    assert data['timestamp'].value.year == 2021
+    assert data['weight'] == 70.0
@@ -0,0 +1,35 @@
+import ujson
+
+from engine import LiftEngine
+from models import Actor, WaitingRoom
+import schema as sc
+from serializers import actor_json, actors_json, lift_json
+
+
+def test_actor_json_matches_schema():
+    """Быстрый сериализатор дает тот же результат, что и схема marshmallow"""
+
+    actor = Actor('actor1', 70.0)
+    actor.wait_lift(4)
+
+    assert ujson.loads(actor_json(actor)) == sc.Actor().dump(actor)
+    assert ujson.loads(actors_json([actor, actor])) == [sc.Actor().dump(actor)] * 2
+
+
+def test_snapshot_invalidated_on_change():
+    """Снимок пересобирается только после изменения объекта"""
+
+    room = WaitingRoom()
+    actor = Actor('actor1', 70.0, room=room)
+    lift = LiftEngine(1, 0.25, 300.0, 3.0).lifts['lift_0']
+
+    first = actor_json(actor)
+    assert actor_json(actor) is first
+
+    actor.wait_lift(4)
+    assert ujson.loads(actor_json(actor))['status'] == 'EXPECT'
+
+    before = lift_json(lift)
+    lift.take_actors(room)
+    assert ujson.loads(lift_json(lift))['passengers'] == ['actor1']
+    assert ujson.loads(before)['passengers'] == []
@@ -0,0 +1,131 @@
+import asyncio
+
+from dispatch import Dispatcher
+from engine import LiftEngine
+from events import DROP_OFF, ENTER_LIFT, FLOOR_PASSED, LIFT_STOPPED, Event, EventBus
+from models import Actor, ActorStatus, WaitingRoom
+from simulation import Building
+from views import LiftApp
+
+
+def test_tick_publishes_events():
+    """Шаг симуляции сообщает о посадке, проезде этажей и высадке через шину"""
+
+    room, bus, events = WaitingRoom(), EventBus(), []
+    bus.listen(events.append)
+    building = Building(LiftEngine(1, 1.0, 300.0, 3.0), room, Dispatcher(), bus)
+
+    actor = Actor('actor1', 70.0, room=room)
+    actor.wait_lift(3)
+    for _ in range(20):
+        building.tick()
+
+    kinds = [x.kind for x in events]
+    assert kinds[0] == ENTER_LIFT
+    assert kinds.count(FLOOR_PASSED) == 2
+    assert LIFT_STOPPED in kinds
+    assert kinds[-1] == DROP_OFF
+    assert events[-1].actors == [actor]
+    assert actor.floor == 3
+    assert building.tick_duration > 0
+
+
+async def test_subscriber_survives_handler_error():
+    """Исключение обработчика подписчика не останавливает доставку событий"""
+
+    bus, received = EventBus(), []
+
+    async def handler(event):
+        if event.floor == 1:
+            raise RuntimeError('broken subscriber')
+        received.append(event.floor)
+
+    task = bus.subscribe(handler, {FLOOR_PASSED})
+    bus.publish(Event(FLOOR_PASSED, 'lift', 1))
+    bus.publish(Event(FLOOR_PASSED, 'lift', 2))
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+    assert received == [2]
+    assert not task.done()
+    task.cancel()
+
+
+def test_jump_to_next_event():
+    """Лифт доезжает до цели за рассчитанное число шагов одним прыжком"""
+
+    room = WaitingRoom()
+    building = Building(LiftEngine(1, 0.25, 300.0, 3.0), room, Dispatcher(), EventBus())
+    assert building.is_idle()
+    assert building.ticks_to_next_event() is None
+
+    actor = Actor('actor1', 70.0, room=room)
+    actor.wait_lift(4)
+    assert building.ticks_to_next_event() == 1
+
+    building.tick(0)
+    lift = building.lifts['lift_0']
+    ticks = building.ticks_to_next_event()
+    assert lift.target == 4
+    assert ticks == lift.steps_to(4) > 1
+
+    building.tick(ticks)
+    assert lift.floor == 4
+
+    # Остановившийся лифт еще должен высадить пассажира
+    building.tick(1)
+    assert building.ticks_to_next_event() == 1
+    assert not building.is_idle()
+
+    building.tick(1)
+    assert actor.floor == 4
+    assert building.is_idle()
+
+
+def test_jump_reports_every_floor():
+    """Прыжок через несколько этажей сообщает о каждом пройденном этаже"""
+
+    room, bus, events = WaitingRoom(), EventBus(), []
+    bus.listen(events.append, {FLOOR_PASSED})
+    building = Building(LiftEngine(1, 0.25, 300.0, 3.0), room, Dispatcher(), bus)
+
+    actor = Actor('actor1', 70.0, room=room)
+    actor.wait_lift(6)
+    building.tick(0)
+    building.tick(1)
+    building.tick(building.ticks_to_next_event())
+    building.tick(1)
+
+    lift = building.lifts['lift_0']
+    assert lift.floor == 6
+    assert [x.floor for x in events] == [2, 3, 4, 5, 6]
+
+    # Высадка на шестом этаже, затем поездка вниз
+    building.tick(1)
+    assert actor.floor == 6
+    events.clear()
+    actor.wait_lift(2)
+    while not building.is_idle():
+        building.tick(building.ticks_to_next_event())
+    assert [x.floor for x in events] == [5, 4, 3, 2]
+
+
+async def test_loop_drops_off_after_stop(make_app):
+    """Петля лифтов не засыпает, пока остановившийся лифт не высадил пассажира"""
+
+    app = make_app(LOOP_DELAY=0.01)
+
+    actor = app.ctx.actors.add('actor1', 70.0)
+    actor.wait_lift(3)
+    loop = asyncio.ensure_future(LiftApp(app).lift_loop(app))
+    try:
+        for _ in range(500):
+            if actor.status == ActorStatus.IDLE:
+                break
+            await asyncio.sleep(0.01)
+    finally:
+        loop.cancel()
+
+    assert actor.status == ActorStatus.IDLE
+    assert actor.floor == 3
+    assert app.ctx.building.is_idle()
@@ -0,0 +1,113 @@
+import asyncio
+from concurrent.futures.process import BrokenProcessPool
+from itertools import permutations
+import random
+
+from dispatch import OptimalDispatcher
+from engine import LiftEngine
+from events import EventBus
+from models import Actor, WaitingRoom
+from simulation import Building
+from solver import PlanSolver, hungarian, snapshot, solve
+
+
+def test_hungarian_is_optimal():
+    """Сумма назначений совпадает с перебором всех вариантов"""
+
+    rnd = random.Random(1)
+    for rows, cols in ((1, 1), (3, 3), (3, 5), (5, 6)):
+        cost = [[rnd.uniform(0, 10) for _ in range(cols)] for _ in range(rows)]
+        result = hungarian(cost)
+        assert len(set(result)) == rows
+
+        best = min(sum(cost[r][c] for r, c in enumerate(x)) for x in permutations(range(cols), rows))
+        assert abs(sum(cost[r][c] for r, c in enumerate(result)) - best) < 1e-9
+
+
+def make_building(count=2):
+    room = WaitingRoom()
+    building = Building(LiftEngine(count, 1.0, 300.0, 3.0), room, OptimalDispatcher(), EventBus())
+
+    return room, building
+
+
+def test_plan_serves_nearest_calls():
+    """Каждый вызов достается лифту, который доберется быстрее, а
+    вызов, который не по силам ни одному лифту, в план не попадает
+    """
+    room, building = make_building()
+    lift_0, lift_1 = building.lifts.values()
+    lift_0.position, lift_1.position = 0.01, 27.01
+
+    for uid, floor, weight in (('a', 2, 70.0), ('b', 9, 70.0), ('c', 5, 400.0)):
+        actor = Actor(uid, weight, room=room)
+        actor.floor = floor
+        actor.wait_lift(1)
+
+    plan = solve(snapshot(building.lifts, room, 3.0, 0.5))
+    assert plan == {2: lift_0.id, 9: lift_1.id}
+
+
+async def test_solver_feeds_dispatcher():
+    """План считается в процессе решателя, а диспетчер сообщает его
+    возраст и время расчета
+    """
+    room, building = make_building()
+    dispatcher = building.dispatcher
+    assert dispatcher.plan_age() is None
+
+    actors = []
+    for inx, floor in enumerate((3, 7, 8)):
+        actor = Actor(f'actor{inx}', 70.0, room=room)
+        actor.floor = floor
+        actor.wait_lift(1)
+        actors.append(actor)
+
+    solver = PlanSolver(building, 3.0, 0.5)
+    try:
+        plan = await solver.solve()
+    finally:
+        solver.close()
+
+    assert set(plan) == {3, 7, 8}
+    assert dispatcher.plan_age() >= 0
+    assert dispatcher.stats()['solver']['latency']['count'] == 1
+
+    for _ in range(200):
+        building.tick()
+    assert all(x.floor == 1 for x in actors)
+    assert not len(room)
+
+
+class BrokenPool:
+    def submit(self, *args, **kwargs):
+        raise BrokenProcessPool('worker died')
+
+    def shutdown(self, wait=True):
+        pass
+
+
+async def test_solver_restarts_broken_pool():
+    """Упавший пул решателя заменяется новым, и цикл продолжает считать планы"""
+
+    room, building = make_building()
+    actor = Actor('actor1', 70.0, room=room)
+    actor.floor = 5
+    actor.wait_lift(1)
+
+    solver = PlanSolver(building, 3.0, 0.5, interval=0.01)
+    solver._executor.shutdown()
+    solver._executor = BrokenPool()
+    task = asyncio.ensure_future(solver.run())
+    try:
+        for _ in range(500):
+            await asyncio.sleep(0.01)
+            if building.dispatcher.plan_age() is not None:
+                break
+
+        assert not task.done()
+    finally:
+        task.cancel()
+        solver.close()
+
+    assert building.dispatcher.plan_age() is not None
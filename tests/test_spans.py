@@ -0,0 +1,72 @@
+import asyncio
+from types import SimpleNamespace
+
+import ujson
+
+from dispatch import Dispatcher
+from engine import LiftEngine
+from events import EventBus
+from models import Actor, WaitingRoom
+from simulation import Building
+from spans import LOOP, SpanBuffer
+from views import LiftApp
+from .shortcuts import quick_auth
+from .test_cluster import FakeSocket
+
+
+def test_tick_phases():
+    """Шаг пишет спаны фаз в кольцевой буфер, старые спаны вытесняются"""
+
+    room = WaitingRoom()
+    building = Building(LiftEngine(1, 1.0, 300.0, 3.0), room, Dispatcher(), EventBus())
+    building.spans = SpanBuffer(1000)
+
+    actor = Actor('actor1', 70.0, room=room)
+    actor.wait_lift(3)
+    for _ in range(20):
+        building.tick()
+
+    trace = building.spans.export()
+    names = [x['name'] for x in trace['traceEvents'] if x['ph'] == 'X']
+    assert names.count('tick') == 20
+    assert {'assign', 'near_floor', 'drop_off', 'boarding', 'movement'} <= set(names)
+    assert all(x['dur'] >= 0 and x['tid'] == LOOP
+               for x in trace['traceEvents'] if x['ph'] == 'X')
+    ujson.dumps(trace)
+
+    small = SpanBuffer(2)
+    building.spans = small
+    building.tick()
+    assert len(small) == 2
+
+
+async def test_signal_spans(make_app):
+    """Обработчик сигнала, валидация схемой и сериализация ответа
+    попадают в строку соединения
+    """
+    app = make_app(SPANS={'ENABLED': True, 'BUFFER_SIZE': 1000, 'TOKEN': 'admin'})
+
+    ws = FakeSocket(ujson.dumps({'signal': 'auth', 'id': '1', 'data': quick_auth(app, 'actor1')}))
+    task = asyncio.ensure_future(LiftApp(app).entry_point(SimpleNamespace(args={}), ws))
+    resp = await asyncio.wait_for(ws.sent.get(), 1.0)
+    task.cancel()
+    assert resp['status'] == 'ok'
+
+    spans = {x['name']: x for x in app.ctx.spans.export()['traceEvents'] if x['ph'] == 'X'}
+    assert spans['auth']['cat'] == 'signal'
+    assert spans['AuthSchema']['cat'] == 'schema'
+    assert spans['raw_response']['cat'] == 'codec'
+    assert spans['actor']['tid'] == spans['auth']['tid'] == id(ws)
+
+    admin = SimpleNamespace(headers={'authorization': 'Bearer admin'})
+    body = ujson.loads((await LiftApp(app).spans(admin)).body)
+    assert len(body['traceEvents']) == len(app.ctx.spans) + 1
+
+    for headers in ({}, {'authorization': 'Bearer wrong'}):
+        assert (await LiftApp(app).spans(SimpleNamespace(headers=headers))).status == 401
+
+    app.config['SPANS'] = dict(app.config['SPANS'], TOKEN=None)
+    assert (await LiftApp(app).spans(admin)).status == 404
+
+    app.ctx.spans = None
+    assert (await LiftApp(app).spans(admin)).status == 404
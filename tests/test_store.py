@@ -0,0 +1,79 @@
+import pytest
+import ujson
+
+from engine import LiftEngine
+from index import actor_index
+from models import ActorStatus, WaitingRoom
+import schema as sc
+from serializers import actor_json
+from store import ActorStore, RemovedActor
+
+
+def test_stored_actor_interface():
+    """Актор из хранилища ведет себя как обычный Actor"""
+
+    room = WaitingRoom()
+    store = ActorStore(room=room)
+    lift = LiftEngine(1, 0.25, 300.0, 3.0).lifts['lift_0']
+    actor = store.add('actor1', 70.0)
+
+    actor.wait_lift(4)
+    assert store['actor1'] in room
+    assert ujson.loads(actor_json(actor)) == sc.Actor().dump(store['actor1'])
+
+    lift.take_actors(room)
+    assert actor.status == ActorStatus.IN_LIFT
+    assert actor.lift_id == 'lift_0'
+    assert actor.entered_at is not None
+    assert len(room) == 0
+
+    lift.position = 10.0
+    for p in lift.passengers:
+        p.floor = lift.floor
+
+    assert lift.drop_off() == [actor]
+    assert (actor.status, actor.floor, actor.need_floor, actor.lift_id) == \
+        (ActorStatus.IDLE, 4, None, None)
+
+
+def test_store_index_and_slot_reuse():
+    """Индекс следит за акторами хранилища, ячейки удаленных переиспользуются,
+    а старый посредник ячейки не становится новым актором
+    """
+    store = ActorStore(room=WaitingRoom())
+    index = actor_index(store)
+    for inx in range(3):
+        index.add(store.add(f'actor{inx}', 60.0 + inx))
+
+    store['actor1'].wait_lift(5)
+    assert index.page(10, {'status': 'EXPECT'})[0] == [store['actor1']]
+
+    stale = store['actor1']
+    index.remove('actor1')
+    del store['actor1']
+    assert len(store.room) == 0
+
+    index.add(store.add('actor3', 80.0))
+    assert store['actor3'].weight == 80.0
+    assert store['actor3'].status == ActorStatus.IDLE
+    assert len(store) == 3
+    assert store.nbytes() // len(store) < 64
+
+    assert stale != store['actor3']
+    with pytest.raises(RemovedActor):
+        stale.uid
+    with pytest.raises(RemovedActor):
+        stale.wait_lift(4)
+    assert index.page(10, {'status': 'EXPECT'}) == ([], None)
+    assert index.page(10, ranges={'weight': (70.0, None)})[0] == [store['actor3']]
+
+
+def test_index_memory():
+    """Индекс хранилища занимает несколько десятков байт на актора"""
+
+    store = ActorStore(room=WaitingRoom())
+    index = actor_index(store)
+    for inx in range(10000):
+        index.add(store.add(f'actor{inx}', 60.0 + inx % 50))
+
+    assert index.nbytes() // len(store) < 80
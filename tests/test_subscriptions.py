@@ -0,0 +1,48 @@
+from types import SimpleNamespace
+
+import ujson
+
+
+
+def test_flush_only_changed(make_app):
+    """Подписчик с фильтром получает только свои объекты, и кодируются
+    только изменившиеся с прошлой рассылки
+    """
+    ctx = make_app().ctx
+    for x in range(100):
+        ctx.actors.add(f'actor{x}', 70.0)
+
+    frames = []
+    ctx.broadcaster = SimpleNamespace(outbox=lambda ws: SimpleNamespace(put=frames.append))
+    hub = ctx.subscriptions
+    hub.subscribe('ws', 'actors', ids=['actor5', 'gone'], rate=1000.0)
+
+    hub.flush(1.0)
+    assert list(ujson.loads(frames.pop())['data']['changes']) == ['actor5']
+
+    encoded = []
+    states = hub.states
+
+    def counting(topic):
+        state, everything = states(topic)
+        return lambda id: encoded.append(id) or state(id), everything
+
+    hub.states = counting
+    ctx.actors['actor7'].wait_lift(3)
+    hub.flush(2.0)
+    assert not frames and not encoded
+
+    ctx.actors['actor5'].wait_lift(4)
+    del ctx.actors['actor7']
+    hub.flush(3.0)
+    assert ujson.loads(frames.pop())['data']['changes'] == {
+        'actor5': {'status': 'EXPECT', 'need_floor': 4}}
+    assert encoded == ['actor5']
+
+    del ctx.actors['actor5']
+    hub.flush(4.0)
+    assert ujson.loads(frames.pop())['data']['removed'] == ['actor5']
+
+    hub.unsubscribe('ws', 'actors')
+    ctx.actors['actor8'].wait_lift(3)
+    assert not hub._changed